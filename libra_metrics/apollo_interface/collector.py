@@ -0,0 +1,498 @@
+'''
+Collection of the SOH data of every hub of the station map from the apollo
+server
+'''
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from libra_metrics.apollo_interface.hedging import Hedger
+from libra_metrics.apollo_interface.limiter import AdaptiveLimiter, \
+    TokenBucket
+from libra_metrics.apollo_interface.soh_api import request_api, \
+    request_api_batch
+from libra_metrics.apollo_interface.station_map import LibraHub
+
+
+@dataclass
+class HubResponse:
+    hub: LibraHub
+    data: Dict[str, str]
+    # Wall time in seconds of the request that returned the data
+    latency: float
+
+
+@dataclass
+class BatchResult:
+    '''
+    Outcome of the requests of a batch of hubs
+    '''
+    responses: List[HubResponse] = field(default_factory=list)
+    # Hubs whose request failed, with the error of the request
+    failed: List[Tuple[List[LibraHub], Exception]] = \
+        field(default_factory=list)
+    # Hubs that were not requested because the deadline passed
+    expired: List[LibraHub] = field(default_factory=list)
+
+
+def _batch_rejected(error: Exception) -> bool:
+    '''
+    Determine if an error means apollo does not accept batched requests, as
+    opposed to a failure that would also affect single requests
+    '''
+    # Imported here since requests is only loaded once a request was sent
+    from requests.exceptions import HTTPError
+
+    if isinstance(error, HTTPError):
+        response = error.response
+        return response is not None and 400 <= response.status_code < 500
+    return False
+
+
+def _server_overloaded(error: Exception) -> bool:
+    '''
+    Determine if an error is a sign the apollo server is overloaded
+    '''
+    from requests.exceptions import ConnectionError, HTTPError, Timeout
+
+    if isinstance(error, HTTPError):
+        response = error.response
+        return response is None or response.status_code >= 500
+    return isinstance(error, (ConnectionError, Timeout))
+
+
+def _server_unreachable(error: Exception) -> bool:
+    '''
+    Determine if an error means the apollo server can't be reached at all, as
+    opposed to a failure of the request of some of the hubs
+    '''
+    from requests.exceptions import ConnectionError, Timeout
+
+    return isinstance(error, (ConnectionError, Timeout))
+
+
+class ApolloCollector:
+    '''
+    Requests the SOH data of hubs from an apollo server
+
+    Without a limiter the hubs are requested one after the other. With a
+    limiter the requests are sent from a pool of threads and the limiter
+    decides how many of them can be in flight at once.
+
+    A fetch can be given a deadline, the hubs that could not be collected
+    before it are listed in the expired attribute once the fetch ends. The
+    hubs whose request failed, for instance with a 404 or 500 error, are
+    listed in the failed attribute and the other hubs are still requested.
+    The fetch only stops on errors that mean the server can't be reached.
+    '''
+    def __init__(
+        self,
+        apollo_address: str,
+        batch_size: int = 1,
+        timeout: Optional[float] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+        rate_limit: Optional[TokenBucket] = None,
+        hedger: Optional[Hedger] = None,
+        session=None
+    ):
+        '''
+        Parameters
+        ----------
+        apollo_address: str
+            The address, including port number, for the apollo server's web
+            interface
+
+        batch_size: int
+            The maximum number of hubs to request in a single API call
+
+        timeout: float
+            The number of seconds to wait for each request
+
+        limiter: AdaptiveLimiter
+            Limits the number of concurrent requests
+
+        rate_limit: TokenBucket
+            Caps the rate at which requests are sent
+
+        hedger: Hedger
+            Hedges the requests of single hubs that are slower than usual
+
+        session: requests.Session
+            The session whose connection pool the requests are sent through
+        '''
+        self.apollo_address = apollo_address
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.limiter = limiter
+        self.rate_limit = rate_limit
+        self.hedger = hedger
+        self.session = session
+        # Cleared once apollo rejects a batched request
+        self.batching = batch_size > 1
+        # Hubs the last fetch gave up on when its deadline passed
+        self.expired: List[LibraHub] = []
+        # Hubs the last fetch couldn't collect because their request failed
+        self.failed: List[LibraHub] = []
+        # Error of each failed request of the last fetch
+        self.errors: List[Exception] = []
+        # Time, on the monotonic clock, by which the current fetch must end
+        self._deadline: Optional[float] = None
+
+    def _timeout(self) -> Optional[float]:
+        '''
+        Get the timeout of the next request, shortened so it ends by the
+        deadline of the fetch
+        '''
+        if self._deadline is None:
+            return self.timeout
+        remaining = max(self._deadline - time.monotonic(), 0.001)
+        return remaining if self.timeout is None \
+            else min(self.timeout, remaining)
+
+    def _request(
+        self,
+        function: Callable,
+        hedge_key: Optional[str] = None,
+        **kwargs
+    ) -> Tuple[Any, float]:
+        '''
+        Send a request through the rate limit and the concurrency limiter,
+        hedged by the hedger if there is one and a hedge_key is set
+
+        Returns the result of the request and the time, in seconds, it took
+        once it was allowed through the limits
+        '''
+        if self.rate_limit is not None:
+            self.rate_limit.acquire()
+        ticket = None
+        if self.limiter is not None:
+            ticket = self.limiter.acquire()
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            # The deadline passed while waiting for the limits
+            from requests.exceptions import Timeout
+
+            if self.limiter is not None:
+                self.limiter.cancel()
+            raise Timeout('Collection deadline passed before the request '
+                          + 'was sent')
+
+        if self.session is not None:
+            kwargs['session'] = self.session
+        start = time.monotonic()
+        failed = False
+        try:
+            if self.hedger is not None and hedge_key is not None:
+                result = self.hedger.call(
+                    hedge_key, function, limiter=self.limiter,
+                    timeout=self._timeout(), **kwargs)
+            else:
+                result = function(timeout=self._timeout(), **kwargs)
+            return result, time.monotonic() - start
+        except Exception as e:
+            failed = _server_overloaded(e)
+            raise
+        finally:
+            if self.limiter is not None:
+                self.limiter.release(
+                    time.monotonic() - start, failed, ticket)
+
+    def _fetch_single(
+        self,
+        hubs: List[LibraHub]
+    ) -> BatchResult:
+        '''
+        Request the data of each hub with one request per hub
+
+        The failure of a hub's request doesn't stop the requests of the
+        other hubs, unless the server can't be reached.
+        '''
+        result = BatchResult()
+        for i, hub in enumerate(hubs):
+            try:
+                data, latency = self._request(
+                    request_api,
+                    hedge_key=hub.hub_id,
+                    apollo_address=self.apollo_address,
+                    carina_id=hub.carina_id
+                )
+            except Exception as e:
+                if self._past_deadline(e):
+                    result.expired.extend(hubs[i:])
+                    break
+                if _server_unreachable(e):
+                    raise
+                result.failed.append(([hub], e))
+                continue
+            result.responses.append(HubResponse(
+                hub=hub,
+                data=data,
+                latency=latency
+            ))
+        return result
+
+    def _fetch_batch(
+        self,
+        hubs: List[LibraHub]
+    ) -> BatchResult:
+        '''
+        Request the data of a batch of hubs, falling back on one request per
+        hub if apollo rejects it
+
+        The hubs missing from the response of the batch are requested one at
+        a time, batching stays on for the next batches.
+        '''
+        if not self.batching or len(hubs) == 1:
+            return self._fetch_single(hubs)
+
+        try:
+            data, latency = self._request(
+                request_api_batch,
+                apollo_address=self.apollo_address,
+                carina_ids=[hub.carina_id for hub in hubs]
+            )
+        except Exception as e:
+            if not _batch_rejected(e):
+                raise
+            logging.warning(
+                f'Batched request rejected by {self.apollo_address} ({e}), '
+                + 'falling back to one request per hub')
+            self.batching = False
+            return self._fetch_single(hubs)
+
+        responses = [
+            HubResponse(hub=hub, data=data[hub.carina_id], latency=latency)
+            for hub in hubs if hub.carina_id in data
+        ]
+        missing = [hub for hub in hubs if hub.carina_id not in data]
+        if not missing:
+            return BatchResult(responses=responses)
+        logging.warning(
+            f'Batched response of {self.apollo_address} is missing '
+            + f"{', '.join(hub.hub_id for hub in missing)}, requesting "
+            + 'them one at a time')
+        result = self._fetch_single(missing)
+        result.responses[:0] = responses
+        return result
+
+    def fetch(
+        self,
+        hubs: List[LibraHub],
+        deadline: Optional[float] = None
+    ) -> Iterator[HubResponse]:
+        '''
+        Request the SOH data of every hub
+
+        Parameters
+        ----------
+        hubs: List[LibraHub]
+            The hubs to request data for
+
+        deadline: float
+            Time, on the time.monotonic clock, after which no new request is
+            sent and the requests still in flight are abandoned. The hubs
+            that were not collected are listed in the expired attribute
+
+        Returns
+        -------
+        Iterator[HubResponse]: The data returned for each hub, in the order
+        of the hubs without a limiter or as the requests complete with one
+
+        Raises
+        ------
+        ConnectionError: Raised if the apollo server can't be reached
+
+        Timeout: Raised if a request to the apollo server timed out before
+        the deadline
+        '''
+        size = max(self.batch_size, 1)
+        batches = [hubs[i:i + size] for i in range(0, len(hubs), size)]
+        self.expired = []
+        self.failed = []
+        self.errors = []
+        self._deadline = deadline
+
+        if self.limiter is None:
+            yield from self._fetch_sequential(batches)
+        else:
+            yield from self._fetch_concurrent(batches)
+            logging.info(
+                f'Apollo limiter for {self.apollo_address} ended the cycle at '
+                + f'a concurrency of {self.limiter.stats().concurrency}')
+
+        if self.expired:
+            logging.warning(
+                f'Deadline exceeded, {len(self.expired)} hubs were not '
+                + f'collected from {self.apollo_address}')
+
+    def _fetch_sequential(
+        self,
+        batches: List[List[LibraHub]]
+    ) -> Iterator[HubResponse]:
+        '''
+        Request the batches one after the other
+        '''
+        for i, batch in enumerate(batches):
+            if self._deadline is not None and \
+                    time.monotonic() >= self._deadline:
+                break
+            try:
+                result = self._fetch_batch(batch)
+            except Exception as e:
+                if self._past_deadline(e):
+                    break
+                if _server_unreachable(e):
+                    raise
+                self._batch_failed(batch, e)
+                continue
+            yield from self._collect(result)
+        else:
+            return
+        for batch in batches[i:]:
+            self.expired.extend(batch)
+
+    def _fetch_concurrent(
+        self,
+        batches: List[List[LibraHub]]
+    ) -> Iterator[HubResponse]:
+        '''
+        Request the batches from a pool of threads, as allowed by the limiter
+        '''
+        # Only loaded when requests are sent in parallel, to keep the entry
+        # point quick to start
+        from concurrent.futures import ThreadPoolExecutor, TimeoutError, \
+            as_completed
+
+        # Batches waiting in the pool's queue for a thread
+        waiting = [len(batches)]
+        lock = threading.Lock()
+
+        def fetch_batch(batch: List[LibraHub]) -> BatchResult:
+            with lock:
+                waiting[0] -= 1
+            return self._fetch_batch(batch)
+
+        pool = ThreadPoolExecutor(max_workers=self.limiter.maximum)
+        futures = {pool.submit(fetch_batch, batch): batch
+                   for batch in batches}
+        pending = set(futures)
+        try:
+            timeout = None if self._deadline is None \
+                else max(self._deadline - time.monotonic(), 0)
+            for future in as_completed(futures, timeout=timeout):
+                pending.discard(future)
+                stats = self.limiter.stats()
+                logging.debug(
+                    f'Apollo limiter for {self.apollo_address}: concurrency '
+                    + f'{stats.concurrency}, in flight {stats.in_flight}, '
+                    + f'waiting for a slot {stats.queue_depth}, batches '
+                    + f'queued {waiting[0]}')
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if self._past_deadline(e):
+                        self.expired.extend(futures[future])
+                        continue
+                    if _server_unreachable(e):
+                        raise
+                    self._batch_failed(futures[future], e)
+                    continue
+                yield from self._collect(result)
+        except TimeoutError:
+            # Requests in flight end at the deadline through their timeout,
+            # their results are dropped
+            for future in pending:
+                self.expired.extend(futures[future])
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def overloaded(self) -> bool:
+        '''
+        Determine if every request of the last fetch that failed got an error
+        that means the server is overloaded, and at least one did
+        '''
+        return bool(self.errors) and \
+            all(_server_overloaded(error) for error in self.errors)
+
+    def _collect(
+        self,
+        result: BatchResult
+    ) -> List[HubResponse]:
+        '''
+        Record the hubs of a batch that were not collected and get the
+        responses of the others
+        '''
+        for batch, error in result.failed:
+            self._batch_failed(batch, error)
+        self.expired.extend(result.expired)
+        return result.responses
+
+    def _batch_failed(
+        self,
+        batch: List[LibraHub],
+        error: Exception
+    ):
+        '''
+        Record the hubs of a batch whose request failed
+        '''
+        logging.warning(
+            f'Request of {len(batch)} hubs to {self.apollo_address} failed, '
+            + f"{', '.join(hub.hub_id for hub in batch)} not collected: "
+            + f'{error}')
+        self.failed.extend(batch)
+        self.errors.append(error)
+
+    def _past_deadline(
+        self,
+        error: Exception
+    ) -> bool:
+        '''
+        Determine if a request failed because it was cut short by the deadline
+        '''
+        from requests.exceptions import Timeout
+
+        return self._deadline is not None and isinstance(error, Timeout) \
+            and time.monotonic() >= self._deadline - 0.01
+
+
+def fetch_hubs(
+    apollo_address: str,
+    hubs: List[LibraHub],
+    batch_size: int = 1
+) -> Iterator[HubResponse]:
+    '''
+    Request the SOH data of every hub, one after the other, asking for up to
+    batch_size hubs per request to the apollo server
+
+    If apollo rejects a batched request, the hubs of that batch and of every
+    following batch are requested one at a time instead.
+
+    Parameters
+    ----------
+    apollo_address: str
+        The address, including port number, for the apollo server's web
+        interface
+
+    hubs: List[LibraHub]
+        The hubs to request data for
+
+    batch_size: int
+        The maximum number of hubs to request in a single API call
+
+    Returns
+    -------
+    Iterator[HubResponse]: The data returned for each hub, in the order of
+    the hubs
+
+    Raises
+    ------
+    ConnectionError: Raised if the apollo server can't be reached
+
+    Timeout: Raised if a request to the apollo server timed out
+    '''
+    collector = ApolloCollector(
+        apollo_address=apollo_address,
+        batch_size=batch_size
+    )
+    return collector.fetch(hubs)
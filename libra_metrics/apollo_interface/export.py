@@ -0,0 +1,170 @@
+'''
+Streaming export of the station statistics for downstream analytics
+
+Each cycle's statistics are written to rotating NDJSON or CSV files as the
+hubs are processed, one line per station with the cycle time, hub, slot and
+metrics. Nothing is kept for the whole cycle: the lines of a hub go straight
+to a large write buffer that is flushed in big appends. Missing metrics are
+null in NDJSON and empty in CSV.
+
+Gzip files get one gzip member per cycle, which standard tools read as a
+single stream.
+'''
+import io
+import json
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from libra_metrics.apollo_interface.collector import HubResponse
+from libra_metrics.apollo_interface.soh_api import StationStatistics
+
+
+FORMATS = ('ndjson', 'csv')
+COLUMNS = ('timestamp', 'hub', 'slot', 'station', 'total_bytes',
+           'good_burst', 'receive_strength')
+# File name suffix of each rotation
+ROTATIONS = {
+    'hourly': '%Y%m%dT%H',
+    'daily': '%Y%m%d',
+}
+
+
+class StatsExporter:
+    '''
+    Streams the statistics of each cycle to the export files
+    '''
+    def __init__(
+        self,
+        directory: str,
+        format: str = 'ndjson',
+        compress: bool = False,
+        rotate: str = 'daily',
+        buffer_size: int = 1024 * 1024
+    ):
+        '''
+        Parameters
+        ----------
+        directory: str
+            The export directory, created if needed
+
+        format: str
+            One of FORMATS
+
+        compress: bool
+            Compress the files with gzip
+
+        rotate: str
+            Start a new file every hour or day (UTC), one of ROTATIONS
+
+        buffer_size: int
+            The number of bytes buffered before they are written out
+        '''
+        if format not in FORMATS:
+            raise ValueError(f'Unknown export format {format}')
+        if rotate not in ROTATIONS:
+            raise ValueError(f'Unknown export rotation {rotate}')
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.format = format
+        self.compress = compress
+        self.rotate = rotate
+        self.buffer_size = buffer_size
+        self._cycle_time: Optional[float] = None
+        self._file: Optional[io.TextIOWrapper] = None
+        self._csv = None
+
+    def _open(self):
+        '''
+        Open the file of the current rotation period for appending
+        '''
+        name = datetime.fromtimestamp(self._cycle_time, timezone.utc) \
+            .strftime(ROTATIONS[self.rotate])
+        path = self.directory / \
+            f'stations-{name}.{self.format}{".gz" if self.compress else ""}'
+        new = not path.exists() or path.stat().st_size == 0
+
+        # Only loaded when exporting, to keep the entry point quick to start
+        import csv
+        import gzip
+
+        if self.compress:
+            # Buffered so the compressor is fed big blocks
+            raw = io.BufferedWriter(
+                gzip.GzipFile(path, mode='ab'), self.buffer_size)
+        else:
+            raw = open(path, 'ab', buffering=self.buffer_size)
+        self._file = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        if self.format == 'csv':
+            self._csv = csv.writer(self._file)
+            if new:
+                self._csv.writerow(COLUMNS)
+
+    def add(
+        self,
+        response: HubResponse,
+        stations: StationStatistics
+    ):
+        '''
+        Write the statistics of a hub
+
+        Parameters
+        ----------
+        response: HubResponse
+            The response of the apollo server for the hub
+
+        stations: StationStatistics
+            The statistics extracted from the response
+        '''
+        if self._cycle_time is None:
+            self._cycle_time = time.time()
+            self._open()
+
+        hub = response.hub.hub_id
+        # get_staion_statistics returns the stations in the order of the
+        # hub's slots
+        for slot_id, stats in zip(response.hub.tdmaslots, stations.stations):
+            # Missing values are flagged with -1 or None
+            total_bytes = None if stats.total_bytes < 0 \
+                else stats.total_bytes
+            good_burst = None if stats.good_burst < 0 else stats.good_burst
+            if self._csv is not None:
+                self._csv.writerow((
+                    f'{self._cycle_time:.3f}', hub, slot_id,
+                    stats.station_name,
+                    '' if total_bytes is None else total_bytes,
+                    '' if good_burst is None else good_burst,
+                    '' if stats.receive_strength is None
+                    else stats.receive_strength
+                ))
+            else:
+                self._file.write(json.dumps({
+                    'timestamp': round(self._cycle_time, 3),
+                    'hub': hub,
+                    'slot': slot_id,
+                    'station': stats.station_name,
+                    'total_bytes': total_bytes,
+                    'good_burst': good_burst,
+                    'receive_strength': stats.receive_strength
+                }) + '\n')
+
+    def end_cycle(self):
+        '''
+        Write out the rest of the cycle and close the file
+        '''
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._csv = None
+        self._cycle_time = None
+
+    def abort_cycle(self):
+        '''
+        Close the file of a cycle that failed part way so the next cycle
+        starts with its own time and file
+
+        The lines of the hubs added before the failure were already streamed
+        and stay in the file.
+        '''
+        self.end_cycle()
@@ -0,0 +1,142 @@
+'''
+Reuse of the results of hubs whose statistics did not change
+
+The values of the API keys the statistics are extracted from are hashed into
+a fingerprint of each hub's response. When the fingerprint is the same as in
+the previous cycle, the statistics and check results computed then are
+reused, or left out of the submission in change-only mode. A hub is
+recomputed after max_age cycles even if it did not change so its results
+are refreshed in Nagios.
+'''
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from libra_metrics.apollo_interface.collector import HubResponse
+from libra_metrics.apollo_interface.soh_api import StationStatistics
+from libra_metrics.apollo_interface.station_map import LibraHub
+from libra_metrics.nagios.nrdp import NagiosCheckResults
+
+
+# Per-slot statistics the checks depend on
+SLOT_KEYS = ('totalBytes', 'totalBursts', 'goodBursts', 'receivePower')
+
+
+def hub_keys(
+    hub: LibraHub
+) -> Tuple[str, ...]:
+    '''
+    Get the API keys the statistics of a hub are extracted from
+    '''
+    return tuple(
+        f"modem/tdma/slot/rxStats/{key}#_{slot_id.split('_')[1]}"
+        for slot_id in hub.tdmaslots for key in SLOT_KEYS)
+
+
+@dataclass
+class CachedHub:
+    __slots__ = ('fingerprint', 'stations', 'results', 'rollups', 'age')
+    fingerprint: int
+    stations: StationStatistics
+    # Check results of the stations
+    results: NagiosCheckResults
+    # Rollup results of the hub, empty without rollups
+    rollups: NagiosCheckResults
+    # Number of cycles the results were reused for
+    age: int
+
+
+class HubResultCache:
+    '''
+    The statistics and check results of each hub, with the fingerprint of
+    the response they were computed from
+    '''
+    def __init__(
+        self,
+        changed_only: bool = False,
+        max_age: int = 10
+    ):
+        '''
+        Parameters
+        ----------
+        changed_only: bool
+            Leave the results of unchanged hubs out of the submission instead
+            of reusing them
+
+        max_age: int
+            The number of cycles after which an unchanged hub is recomputed
+        '''
+        self.changed_only = changed_only
+        self.max_age = max_age
+        self._hubs: Dict[str, CachedHub] = {}
+        self._keys: Dict[str, Tuple[str, ...]] = {}
+        self._fingerprints: Dict[str, int] = {}
+        # Counters of the current cycle
+        self.reused = 0
+        self.skipped = 0
+        self.recomputed = 0
+
+    def get(
+        self,
+        response: HubResponse
+    ) -> Optional[CachedHub]:
+        '''
+        Get the cached results of a hub if its response did not change
+
+        Parameters
+        ----------
+        response: HubResponse
+            The response of the apollo server for the hub
+
+        Returns
+        -------
+        CachedHub: The cached results, None if they have to be recomputed
+        '''
+        hub = response.hub
+        keys = self._keys.get(hub.hub_id)
+        if keys is None:
+            keys = self._keys[hub.hub_id] = hub_keys(hub)
+        fingerprint = hash(tuple(response.data.get(key) for key in keys))
+        self._fingerprints[hub.hub_id] = fingerprint
+
+        cached = self._hubs.get(hub.hub_id)
+        if cached is None or cached.fingerprint != fingerprint or \
+                cached.age >= self.max_age:
+            self.recomputed += 1
+            return None
+        cached.age += 1
+        if self.changed_only:
+            self.skipped += 1
+        else:
+            self.reused += 1
+        return cached
+
+    def put(
+        self,
+        response: HubResponse,
+        stations: StationStatistics,
+        results: NagiosCheckResults,
+        rollups: NagiosCheckResults
+    ):
+        '''
+        Cache the results computed for a hub whose get returned None
+        '''
+        hub_id = response.hub.hub_id
+        self._hubs[hub_id] = CachedHub(
+            fingerprint=self._fingerprints[hub_id],
+            stations=stations,
+            results=results,
+            rollups=rollups,
+            age=0
+        )
+
+    def end_cycle(self):
+        '''
+        Log and reset the counters of the cycle
+        '''
+        logging.info(
+            f'Recomputed {self.recomputed} hubs, reused the results of '
+            + f'{self.reused} and skipped {self.skipped} unchanged hubs')
+        self.reused = 0
+        self.skipped = 0
+        self.recomputed = 0
@@ -0,0 +1,289 @@
+'''
+Hedged requests for the hubs behind slow links
+
+The latencies of the recent requests of each hub are kept in a small window.
+Once a request has taken longer than the 95th percentile of its hub, a
+second identical request is sent and the first response to arrive is used.
+The other request is abandoned: its result is ignored once it completes.
+
+Hedging is capped by a budget: each request earns a fraction of a hedge, so
+the extra requests never exceed that fraction of the requests sent. With a
+concurrency limiter, a hedge also needs a free slot of its own and is
+skipped if there is none.
+
+The latency recorded for a hedged request runs from the first request being
+sent to the first response, whichever request it came from. The time a
+request waits for a thread of the pool is left out.
+'''
+import json
+import logging
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional
+
+from libra_metrics.apollo_interface.limiter import AdaptiveLimiter
+
+
+@dataclass
+class HedgeStats:
+    # Requests sent through the hedger
+    requests: int = 0
+    # Requests slow enough that a hedge was sent
+    hedged: int = 0
+    # Hedges whose response arrived first
+    won: int = 0
+    # Requests that were slow enough but the budget or the concurrency limit
+    # was used up
+    skipped: int = 0
+
+
+class Hedger:
+    '''
+    Sends a second request for requests slower than the recent p95 of their
+    hub, shared by the threads sending requests
+    '''
+    def __init__(
+        self,
+        budget: float = 0.1,
+        window: int = 20,
+        min_samples: int = 5,
+        max_workers: int = 16
+    ):
+        '''
+        Parameters
+        ----------
+        budget: float
+            The highest ratio of hedges to requests
+
+        window: int
+            The number of recent latencies kept for each hub
+
+        min_samples: int
+            The number of latencies a hub needs before its requests are
+            hedged
+
+        max_workers: int
+            The number of threads sending the requests and their hedges, at
+            least the number of requests and hedges that can be in flight at
+            once across every server
+        '''
+        self.budget = budget
+        self.window = window
+        self.min_samples = min_samples
+        self.stats = HedgeStats()
+        self._latencies: Dict[str, Deque[float]] = {}
+        # Start with enough credit for a single hedge
+        self._credit = 1.0
+        self._lock = threading.Lock()
+        # Only loaded when hedging, to keep the entry point quick to start
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='hedge')
+
+    def p95(
+        self,
+        key: str
+    ) -> Optional[float]:
+        '''
+        Get the 95th percentile of the recent latencies of a hub, None until
+        enough requests were sent for it
+        '''
+        with self._lock:
+            latencies = sorted(self._latencies.get(key, ()))
+        if len(latencies) < self.min_samples:
+            return None
+        return latencies[math.ceil(0.95 * len(latencies)) - 1]
+
+    def _record(
+        self,
+        key: str,
+        latency: float
+    ):
+        with self._lock:
+            latencies = self._latencies.get(key)
+            if latencies is None:
+                latencies = self._latencies[key] = deque(maxlen=self.window)
+            latencies.append(latency)
+
+    def _spend(self) -> bool:
+        '''
+        Take a hedge from the budget if there is one left
+        '''
+        with self._lock:
+            if self._credit < 1:
+                self.stats.skipped += 1
+                return False
+            self._credit -= 1
+            self.stats.hedged += 1
+            return True
+
+    def _refund(self):
+        '''
+        Give back a hedge taken from the budget that couldn't be sent
+        '''
+        with self._lock:
+            self._credit += 1
+            self.stats.hedged -= 1
+            self.stats.skipped += 1
+
+    def call(
+        self,
+        key: str,
+        function: Callable,
+        limiter: Optional[AdaptiveLimiter] = None,
+        **kwargs
+    ) -> Any:
+        '''
+        Call a request function, hedging it if it is slow
+
+        Parameters
+        ----------
+        key: str
+            The hub the request is for, its latencies decide when to hedge
+
+        function: Callable
+            The request function, called with kwargs
+
+        limiter: AdaptiveLimiter
+            The concurrency limiter the caller took a slot of for the first
+            request, the hedge takes a slot of its own
+
+        Returns
+        -------
+        The result of the first request to succeed
+
+        Raises
+        ------
+        Any exception raised by the request, or by the hedge if both failed
+        '''
+        from concurrent.futures import FIRST_COMPLETED, wait
+
+        with self._lock:
+            self.stats.requests += 1
+            self._credit = min(self._credit + self.budget, 1 + self.budget)
+        delay = self.p95(key)
+
+        # Time the first request was sent, once it got a thread
+        started = []
+
+        def send() -> Any:
+            started.append(time.monotonic())
+            return function(**kwargs)
+
+        primary = self._pool.submit(send)
+        done, _ = wait([primary], timeout=delay)
+        # A hedge can't be faster than a request still waiting for a thread
+        if done or not started or not self._spend():
+            result = primary.result()
+            self._record(key, time.monotonic() - started[0])
+            return result
+
+        ticket = None
+        if limiter is not None:
+            ticket = limiter.try_acquire()
+            if ticket is None:
+                self._refund()
+                result = primary.result()
+                self._record(key, time.monotonic() - started[0])
+                return result
+
+        hedge_start = time.monotonic()
+        hedge = self._pool.submit(function, **kwargs)
+        if limiter is not None:
+            def release(future):
+                failed = not future.cancelled() \
+                    and future.exception() is not None
+                limiter.release(
+                    time.monotonic() - hedge_start, failed, ticket)
+            hedge.add_done_callback(release)
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                self._abandon(pending)
+                if future is hedge:
+                    with self._lock:
+                        self.stats.won += 1
+                self._record(key, time.monotonic() - started[0])
+                return future.result()
+        raise error
+
+    @staticmethod
+    def _abandon(
+        futures: set
+    ):
+        '''
+        Drop the requests that lost the race
+        '''
+        for future in futures:
+            # Requests already sent can't be interrupted, their result is
+            # ignored once they complete
+            future.cancel()
+
+    def log_stats(self):
+        '''
+        Log how often requests were hedged and how often it helped
+        '''
+        stats = self.stats
+        logging.info(
+            f'Hedged {stats.hedged} of {stats.requests} apollo requests, '
+            + f'{stats.won} hedges answered first, {stats.skipped} skipped '
+            + 'by the budget')
+
+    def save(
+        self,
+        path: str
+    ):
+        '''
+        Save the recent latencies so they can be reloaded by the next run
+
+        Parameters
+        ----------
+        path: str
+            The path to the state file
+        '''
+        with self._lock:
+            data = {key: list(latencies)
+                    for key, latencies in self._latencies.items()}
+        with open(path, 'w') as f:
+            json.dump(data, f)
+
+    def load(
+        self,
+        path: str
+    ):
+        '''
+        Load the latencies saved by a previous run, if there is one
+
+        Parameters
+        ----------
+        path: str
+            The path to the state file
+        '''
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            logging.warning(f'Ignoring invalid hedging state in {path}: {e}')
+            return
+        with self._lock:
+            self._latencies = {
+                key: deque(latencies, maxlen=self.window)
+                for key, latencies in data.items()
+            }
+
+    def close(self):
+        '''
+        Stop the threads once the requests in flight complete
+        '''
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,388 @@
+'''
+Append-only history of the station statistics
+
+The history directory holds:
+
+    stations.json       The station names, a station's id is its position
+    YYYYMMDD.seg        The records of a UTC day, in the order they were
+                        collected
+    YYYYMMDD.idx        The time index of the segment, one entry per cycle
+                        giving the cycle's time and its first record
+
+Records have a fixed width so a segment is read through a memory map and a
+range query only touches the records of the cycles the time index points
+to. Segments older than downsample_after days are rewritten with one
+averaged record per station per downsample_interval (.dseg/.didx) and
+segments older than retention days are deleted.
+'''
+import bisect
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from libra_metrics.apollo_interface.collector import HubResponse
+from libra_metrics.apollo_interface.soh_api import StationStatistics
+
+
+# timestamp, station id, total bytes, good burst ratio, receive power
+RECORD = struct.Struct('<dIqff')
+# cycle timestamp, number of the first record of the cycle
+INDEX_ENTRY = struct.Struct('<dQ')
+
+DAY_FORMAT = '%Y%m%d'
+RAW = ('.seg', '.idx')
+DOWNSAMPLED = ('.dseg', '.didx')
+
+
+@dataclass
+class HistoryRecord:
+    __slots__ = ('timestamp', 'station', 'total_bytes', 'good_burst',
+                 'receive_strength')
+    timestamp: float
+    station: str
+    # -1 if the value was missing
+    total_bytes: int
+    # NaN if the value was missing
+    good_burst: float
+    receive_strength: float
+
+
+def _day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(DAY_FORMAT)
+
+
+def _append(
+    path: Path,
+    data: bytes,
+    size: int
+) -> int:
+    '''
+    Append data to a file of fixed width entries of the given size, first
+    cutting off an entry left partly written by an earlier write that failed
+
+    Returns the number of entries in the file before the data
+    '''
+    with open(path, 'ab') as f:
+        end = f.tell()
+        if end % size:
+            logging.warning(f'Truncating a partly written entry at the end of '
+                            + f'{path.name}')
+            end -= end % size
+            f.truncate(end)
+        f.write(data)
+    return end // size
+
+
+def _read_index(path: Path) -> Tuple[List[float], List[int]]:
+    '''
+    Read a time index, returning the cycle times and their first records
+    '''
+    times: List[float] = []
+    starts: List[int] = []
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return times, starts
+    # Ignore a partly written entry at the end
+    data = data[:len(data) - len(data) % INDEX_ENTRY.size]
+    for timestamp, start in INDEX_ENTRY.iter_unpack(data):
+        times.append(timestamp)
+        starts.append(start)
+    return times, starts
+
+
+class HistoryStore:
+    '''
+    Writes the statistics of each cycle to the history and reads them back
+    '''
+    def __init__(
+        self,
+        directory: str,
+        retention: int = 365,
+        downsample_after: int = 30,
+        downsample_interval: int = 3600
+    ):
+        '''
+        Parameters
+        ----------
+        directory: str
+            The history directory, created if needed
+
+        retention: int
+            The number of days of history to keep
+
+        downsample_after: int
+            The age, in days, after which a segment is downsampled
+
+        downsample_interval: int
+            The number of seconds averaged into a single downsampled record
+        '''
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.retention = retention
+        self.downsample_after = downsample_after
+        self.downsample_interval = downsample_interval
+
+        self._stations_path = self.directory / 'stations.json'
+        try:
+            with open(self._stations_path) as f:
+                self.stations: List[str] = json.load(f)
+        except FileNotFoundError:
+            self.stations = []
+        self._ids: Dict[str, int] = {
+            station: i for i, station in enumerate(self.stations)}
+        # Set when stations were added since stations.json was written
+        self._new_stations = False
+
+        self._cycle_time: Optional[float] = None
+        self._pending = bytearray()
+        self._last_maintenance: Optional[str] = None
+
+    def _station_id(self, station: str) -> int:
+        try:
+            return self._ids[station]
+        except KeyError:
+            station_id = self._ids[station] = len(self.stations)
+            self.stations.append(station)
+            self._new_stations = True
+            return station_id
+
+    def _save_stations(self):
+        '''
+        Write stations.json if stations were added
+        '''
+        if not self._new_stations:
+            return
+        tmp = self._stations_path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.stations, f)
+        os.replace(tmp, self._stations_path)
+        self._new_stations = False
+
+    def add(
+        self,
+        response: HubResponse,
+        stations: StationStatistics,
+        now: Optional[float] = None
+    ):
+        '''
+        Add the statistics of a hub to the cycle being collected
+
+        Parameters
+        ----------
+        response: HubResponse
+            The response of the apollo server for the hub
+
+        stations: StationStatistics
+            The statistics extracted from the response
+
+        now: float
+            The time of the cycle, defaults to the system time when its first
+            hub is added
+        '''
+        if self._cycle_time is None:
+            self._cycle_time = time.time() if now is None else now
+        for stats in stations.stations:
+            good_burst = math.nan if stats.good_burst < 0 \
+                else stats.good_burst
+            receive_power = math.nan if stats.receive_strength is None \
+                else stats.receive_strength
+            self._pending += RECORD.pack(
+                self._cycle_time,
+                self._station_id(stats.station_name),
+                stats.total_bytes,
+                good_burst,
+                receive_power
+            )
+
+    def end_cycle(self):
+        '''
+        Append the records of the cycle to the segment of the day in a single
+        write and index them
+        '''
+        # The stations the records refer to are saved first
+        self._save_stations()
+        if self._cycle_time is not None and self._pending:
+            day = _day(self._cycle_time)
+            first_record = _append(self.directory / f'{day}{RAW[0]}',
+                                   self._pending, RECORD.size)
+            _append(self.directory / f'{day}{RAW[1]}',
+                    INDEX_ENTRY.pack(self._cycle_time, first_record),
+                    INDEX_ENTRY.size)
+        self._cycle_time = None
+        self._pending = bytearray()
+
+        # Retention and downsampling only need to run once a day
+        today = _day(time.time())
+        if self._last_maintenance != today:
+            self.maintain()
+            self._last_maintenance = today
+
+    def abort_cycle(self):
+        '''
+        Drop the records of a cycle that failed part way
+        '''
+        self._cycle_time = None
+        self._pending = bytearray()
+
+    def _segment_paths(self) -> Dict[str, Tuple[Path, Path]]:
+        '''
+        Get the segment and index paths of every day in the history
+        '''
+        segments = {}
+        for suffixes in (DOWNSAMPLED, RAW):
+            for path in self.directory.glob(f'*{suffixes[0]}'):
+                segments[path.stem] = (path, path.with_suffix(suffixes[1]))
+        return segments
+
+    def maintain(
+        self,
+        now: Optional[float] = None
+    ):
+        '''
+        Delete the segments past the retention and downsample old segments
+
+        Parameters
+        ----------
+        now: float
+            The current time, defaults to the system time
+        '''
+        if now is None:
+            now = time.time()
+        expired = _day(now - timedelta(days=self.retention).total_seconds())
+        downsample = _day(
+            now - timedelta(days=self.downsample_after).total_seconds())
+
+        for day, (segment, index) in self._segment_paths().items():
+            if day < expired:
+                logging.info(f'Deleting history segment {segment.name}')
+                segment.unlink()
+                index.unlink(missing_ok=True)
+            elif day < downsample and segment.suffix == RAW[0]:
+                self._downsample(day, segment, index)
+
+    def _downsample(
+        self,
+        day: str,
+        segment: Path,
+        index: Path
+    ):
+        '''
+        Replace a raw segment by the average of each station over each
+        downsample_interval
+        '''
+        # bucket -> station id -> [count bytes, sum bytes, count burst,
+        # sum burst, count power, sum power]
+        buckets: Dict[float, Dict[int, List[float]]] = {}
+        with open(segment, 'rb') as f:
+            data = f.read()
+        for timestamp, station_id, total_bytes, good_burst, power in \
+                RECORD.iter_unpack(data):
+            bucket = timestamp - timestamp % self.downsample_interval
+            sums = buckets.setdefault(bucket, {}).setdefault(
+                station_id, [0, 0.0, 0, 0.0, 0, 0.0])
+            if total_bytes >= 0:
+                sums[0] += 1
+                sums[1] += total_bytes
+            if not math.isnan(good_burst):
+                sums[2] += 1
+                sums[3] += good_burst
+            if not math.isnan(power):
+                sums[4] += 1
+                sums[5] += power
+
+        records = bytearray()
+        entries = bytearray()
+        for bucket in sorted(buckets):
+            entries += INDEX_ENTRY.pack(bucket, len(records) // RECORD.size)
+            for station_id, sums in buckets[bucket].items():
+                records += RECORD.pack(
+                    bucket,
+                    station_id,
+                    round(sums[1] / sums[0]) if sums[0] else -1,
+                    sums[3] / sums[2] if sums[2] else math.nan,
+                    sums[5] / sums[4] if sums[4] else math.nan
+                )
+
+        new_segment = self.directory / f'{day}{DOWNSAMPLED[0]}'
+        new_index = self.directory / f'{day}{DOWNSAMPLED[1]}'
+        for path, content in ((new_segment, records), (new_index, entries)):
+            tmp = path.with_suffix('.tmp')
+            tmp.write_bytes(content)
+            os.replace(tmp, path)
+        segment.unlink()
+        index.unlink(missing_ok=True)
+        logging.info(f'Downsampled history segment {segment.name}')
+
+    def query(
+        self,
+        station: str,
+        start: float,
+        end: float
+    ) -> Iterator[HistoryRecord]:
+        '''
+        Read the records of a station between two times
+
+        Parameters
+        ----------
+        station: str
+            The station name
+
+        start: float
+            The earliest time to return, in seconds since the epoch
+
+        end: float
+            The latest time to return, in seconds since the epoch
+
+        Returns
+        -------
+        Iterator[HistoryRecord]: The records of the station, oldest first
+        '''
+        station_id = self._ids.get(station)
+        if station_id is None:
+            return
+
+        first_day = _day(start)
+        last_day = _day(end)
+        segments = self._segment_paths()
+        for day in sorted(segments):
+            if day < first_day or day > last_day:
+                continue
+            segment, index = segments[day]
+            times, starts = _read_index(index)
+            if not times:
+                continue
+            # Only the cycles within the range are read from the segment
+            first = bisect.bisect_left(times, start)
+            last = bisect.bisect_right(times, end)
+            if first >= last:
+                continue
+
+            with open(segment, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size == 0:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    begin = starts[first] * RECORD.size
+                    # Ignore a partly written record at the end
+                    stop = starts[last] * RECORD.size \
+                        if last < len(starts) else size - size % RECORD.size
+                    for offset in range(begin, stop, RECORD.size):
+                        record = RECORD.unpack_from(mm, offset)
+                        if record[1] != station_id:
+                            continue
+                        yield HistoryRecord(
+                            timestamp=record[0],
+                            station=station,
+                            total_bytes=record[2],
+                            good_burst=record[3],
+                            receive_strength=record[4]
+                        )
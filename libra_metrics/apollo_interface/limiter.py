@@ -0,0 +1,234 @@
+'''
+Limits on the load put on the apollo server
+
+AdaptiveLimiter bounds the number of requests in flight with an additive
+increase / multiplicative decrease policy: the limit grows slowly while
+requests return within the target latency and is cut as soon as they slow
+down, time out or fail with a server error. The limit is cut once per
+congestion event: the requests sent before the last cut that come back slow
+were already accounted for by it. TokenBucket caps the rate at
+which requests are sent to an apollo address.
+'''
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+
+@dataclass
+class LimiterStats:
+    # Current number of requests allowed in flight
+    concurrency: int
+    in_flight: int
+    # Number of requests blocked in acquire waiting for a slot
+    queue_depth: int
+
+
+class AdaptiveLimiter:
+    '''
+    AIMD concurrency limiter, shared by the threads sending requests
+    '''
+    def __init__(
+        self,
+        initial: int = 2,
+        minimum: int = 1,
+        maximum: int = 8,
+        target_latency: float = 2.0,
+        backoff: float = 0.5
+    ):
+        '''
+        Parameters
+        ----------
+        initial: int
+            The number of requests allowed in flight at first
+
+        minimum: int
+            The lowest the limit can be cut to
+
+        maximum: int
+            The highest the limit can grow to
+
+        target_latency: float
+            Requests slower than this, in seconds, cut the limit
+
+        backoff: float
+            The factor the limit is multiplied by when it is cut
+        '''
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError(
+                'Limits must satisfy 1 <= minimum <= initial <= maximum')
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self._limit = float(initial)
+        # Incremented each time the limit is cut
+        self._epoch = 0
+        self._in_flight = 0
+        self._waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> int:
+        '''
+        Wait until a request can be sent
+
+        Returns
+        -------
+        int: The ticket of the request, to pass to release
+        '''
+        with self._condition:
+            self._waiting += 1
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._waiting -= 1
+            self._in_flight += 1
+            return self._epoch
+
+    def try_acquire(self) -> Optional[int]:
+        '''
+        Take a slot if one is free, without waiting
+
+        Returns
+        -------
+        int: The ticket of the request, None if no slot is free
+        '''
+        with self._condition:
+            if self._in_flight >= int(self._limit):
+                return None
+            self._in_flight += 1
+            return self._epoch
+
+    def cancel(self):
+        '''
+        Give back the slot of a request that was not sent, leaving the limit
+        as it is
+        '''
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def release(
+        self,
+        latency: float,
+        failed: bool = False,
+        ticket: Optional[int] = None
+    ):
+        '''
+        Record the outcome of a request and adjust the limit
+
+        Parameters
+        ----------
+        latency: float
+            The time the request took, in seconds
+
+        failed: bool
+            True if the request timed out or the server returned an error
+
+        ticket: int
+            The ticket acquire returned for the request. A slow request sent
+            before the limit was last cut doesn't cut it again
+        '''
+        with self._condition:
+            self._in_flight -= 1
+            if failed or latency > self.target_latency:
+                if ticket is None or ticket == self._epoch:
+                    self._limit = max(
+                        self.minimum, self._limit * self.backoff)
+                    self._epoch += 1
+            else:
+                # Grows the limit by about one per limit's worth of requests
+                self._limit = min(self.maximum, self._limit + 1 / self._limit)
+            self._condition.notify_all()
+
+    def stats(self) -> LimiterStats:
+        '''
+        Get the current state of the limiter
+        '''
+        with self._condition:
+            return LimiterStats(
+                concurrency=int(self._limit),
+                in_flight=self._in_flight,
+                queue_depth=self._waiting
+            )
+
+
+class TokenBucket:
+    '''
+    Token bucket capping the rate requests are sent at, shared by the threads
+    sending requests
+    '''
+    def __init__(
+        self,
+        rate: float,
+        burst: int = 1
+    ):
+        '''
+        Parameters
+        ----------
+        rate: float
+            The number of requests allowed per second
+
+        burst: int
+            The number of requests that can be sent at once after a pause
+        '''
+        if rate <= 0:
+            raise ValueError('The rate must be positive')
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Wait until a request can be sent
+        '''
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst,
+                    self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# Rate limits are global to the process so every collector sending requests
+# to the same apollo address shares them
+_rate_limits: Dict[str, TokenBucket] = {}
+_rate_limits_lock = threading.Lock()
+
+
+def get_rate_limit(
+    apollo_address: str,
+    rate: float,
+    burst: int = 1
+) -> TokenBucket:
+    '''
+    Get the token bucket of an apollo address, creating it if needed
+
+    Parameters
+    ----------
+    apollo_address: str
+        The address, including port number, of the apollo server
+
+    rate: float
+        The number of requests allowed per second
+
+    burst: int
+        The number of requests that can be sent at once after a pause
+
+    Returns
+    -------
+    TokenBucket
+    '''
+    with _rate_limits_lock:
+        try:
+            return _rate_limits[apollo_address]
+        except KeyError:
+            bucket = _rate_limits[apollo_address] = TokenBucket(rate, burst)
+            return bucket
@@ -0,0 +1,120 @@
+'''
+Recording of the raw apollo API responses and their replay without a
+network, for profiling and regression testing on production data
+
+A recording directory contains one sub-directory per collection cycle, named
+after the UTC time the cycle started, holding one gzip compressed json file
+per hub:
+
+    <directory>/20221004T120000Z/<hub_id>.json.gz
+'''
+import json
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from libra_metrics.apollo_interface.collector import HubResponse
+from libra_metrics.apollo_interface.station_map import LibraHubs
+
+
+CYCLE_FORMAT = '%Y%m%dT%H%M%SZ'
+
+
+def record_responses(
+    directory: str,
+    responses: Iterator[HubResponse],
+    cycle: Optional[datetime] = None
+) -> Iterator[HubResponse]:
+    '''
+    Save each response to the recording directory as it passes through
+
+    Parameters
+    ----------
+    directory: str
+        The recording directory
+
+    responses: Iterator[HubResponse]
+        The responses returned by the collector
+
+    cycle: datetime
+        The start time of the cycle, defaults to now
+
+    Returns
+    -------
+    Iterator[HubResponse]: The responses, unchanged
+    '''
+    if cycle is None:
+        cycle = datetime.now(timezone.utc)
+    # Only loaded when recording, to keep the entry point quick to start
+    import gzip
+
+    cycle_dir = Path(directory) / cycle.strftime(CYCLE_FORMAT)
+    cycle_dir.mkdir(parents=True, exist_ok=True)
+
+    for response in responses:
+        record = {
+            'carina_id': response.hub.carina_id,
+            'latency': response.latency,
+            'data': response.data
+        }
+        with gzip.open(cycle_dir / f'{response.hub.hub_id}.json.gz',
+                       'wt') as f:
+            json.dump(record, f)
+        yield response
+
+
+def list_recorded_cycles(
+    directory: str
+) -> List[Path]:
+    '''
+    List the cycle directories of a recording, oldest first
+
+    Parameters
+    ----------
+    directory: str
+        The recording directory
+
+    Returns
+    -------
+    List[Path]: The path to the directory of each recorded cycle
+    '''
+    return sorted(path for path in Path(directory).iterdir() if path.is_dir())
+
+
+def replay_cycle(
+    cycle_dir: Path,
+    hubs: LibraHubs
+) -> Iterator[HubResponse]:
+    '''
+    Read back the responses recorded for each hub of the station map during a
+    cycle
+
+    Parameters
+    ----------
+    cycle_dir: Path
+        The directory of the recorded cycle
+
+    hubs: LibraHubs
+        The hubs loaded from the station map
+
+    Returns
+    -------
+    Iterator[HubResponse]: The recorded responses, in the order of the hubs
+    '''
+    import gzip
+
+    for hub in hubs.hubs:
+        path = cycle_dir / f'{hub.hub_id}.json.gz'
+        try:
+            with gzip.open(path, 'rt') as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            logging.warning(f'No recorded response for {hub.hub_id} in '
+                            + f'{cycle_dir.name}, skipping.')
+            continue
+        yield HubResponse(
+            hub=hub,
+            data=record['data'],
+            latency=record['latency']
+        )
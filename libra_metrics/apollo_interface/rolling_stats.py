@@ -0,0 +1,336 @@
+'''
+Incremental rolling statistics of the station metrics
+
+Each station keeps, for each tracked metric, an exponentially weighted
+moving average and the mean, variance and least squares slope of the last
+window samples. Every update is O(1): the window sums are adjusted with the
+sample that enters and the sample that leaves the window rather than being
+recomputed. Every RESYNC_INTERVAL samples the sums are recomputed from the
+window so floating point errors don't build up in long running processes.
+
+The state of every station lives in a few flat arrays so its size only
+depends on the number of stations and the window, and it can be saved
+between runs of the checks.
+'''
+import json
+import logging
+import math
+import struct
+from array import array
+from dataclasses import dataclass
+from typing import Container, Dict, List, Optional
+
+from libra_metrics.apollo_interface.soh_api import StationStats
+
+
+# StationStats attributes tracked by the rolling statistics
+TREND_METRICS = ('good_burst', 'receive_strength')
+
+# Per metric running values: ewma, sum(y), sum(y^2), sum(x*y)
+_EWMA, _SUM, _SUMSQ, _SUMXY = range(4)
+_STATE_FIELDS = 4
+# Number of samples after which the window sums are recomputed exactly
+RESYNC_INTERVAL = 256
+
+_HEADER_SIZE = struct.Struct('<I')
+
+
+@dataclass
+class SlotTrend:
+    ewma: float
+    mean: float
+    variance: float
+    # Change of the metric per sample over the window
+    slope: float
+    # Number of samples in the window
+    samples: int
+
+
+class RollingStatistics:
+    '''
+    Rolling statistics of the TREND_METRICS of every station
+    '''
+    def __init__(
+        self,
+        window: int = 12,
+        alpha: float = 0.3
+    ):
+        '''
+        Parameters
+        ----------
+        window: int
+            The number of samples the mean, variance and slope are computed
+            over
+
+        alpha: float
+            The smoothing factor of the exponentially weighted moving average
+        '''
+        if window < 2:
+            raise ValueError('The window must hold at least 2 samples')
+        self.window = window
+        self.alpha = alpha
+        self.rows: Dict[str, int] = {}
+        # Ring buffer of the last window samples of each station and metric
+        self.values = array('d')
+        self.state = array('d')
+        # Total number of samples seen for each station and metric
+        self.counts = array('q')
+
+    def _row(
+        self,
+        station: str
+    ) -> int:
+        '''
+        Get the row of a station, allocating one if it is new
+        '''
+        try:
+            return self.rows[station]
+        except KeyError:
+            row = self.rows[station] = len(self.rows)
+            metrics = len(TREND_METRICS)
+            self.values.extend(bytes(8 * metrics * self.window))
+            self.state.extend(bytes(8 * metrics * _STATE_FIELDS))
+            self.counts.extend(bytes(8 * metrics))
+            return row
+
+    def _trend(
+        self,
+        index: int
+    ) -> SlotTrend:
+        '''
+        Compute the trend of a station's metric from its running sums
+        '''
+        state = index * _STATE_FIELDS
+        samples = min(self.counts[index], self.window)
+        if samples == 0:
+            return SlotTrend(ewma=math.nan, mean=math.nan,
+                             variance=math.nan, slope=math.nan, samples=0)
+
+        mean = self.state[state + _SUM] / samples
+        variance = max(
+            self.state[state + _SUMSQ] / samples - mean * mean, 0.0)
+        slope = math.nan
+        if samples > 1:
+            # Samples are at x = 0 (oldest) to samples - 1 (newest)
+            sum_x = samples * (samples - 1) / 2
+            sum_xx = (samples - 1) * samples * (2 * samples - 1) / 6
+            slope = (
+                (samples * self.state[state + _SUMXY]
+                 - sum_x * self.state[state + _SUM])
+                / (samples * sum_xx - sum_x * sum_x))
+        return SlotTrend(
+            ewma=self.state[state + _EWMA],
+            mean=mean,
+            variance=variance,
+            slope=slope,
+            samples=samples
+        )
+
+    def _add_sample(
+        self,
+        index: int,
+        value: float
+    ):
+        '''
+        Add a sample to the window of a station's metric
+        '''
+        state = index * _STATE_FIELDS
+        count = self.counts[index]
+        position = index * self.window + count % self.window
+
+        if count == 0:
+            self.state[state + _EWMA] = value
+        else:
+            self.state[state + _EWMA] += \
+                self.alpha * (value - self.state[state + _EWMA])
+
+        if count < self.window:
+            self.state[state + _SUMXY] += count * value
+        else:
+            # Drop the oldest sample and shift every x down by one
+            oldest = self.values[position]
+            self.state[state + _SUMXY] += \
+                oldest - self.state[state + _SUM] \
+                + (self.window - 1) * value
+            self.state[state + _SUM] -= oldest
+            self.state[state + _SUMSQ] -= oldest * oldest
+
+        self.state[state + _SUM] += value
+        self.state[state + _SUMSQ] += value * value
+        self.values[position] = value
+        self.counts[index] = count + 1
+        if (count + 1) % RESYNC_INTERVAL == 0:
+            self._resync(index)
+
+    def _resync(
+        self,
+        index: int
+    ):
+        '''
+        Recompute the window sums of a station's metric from its samples
+        '''
+        state = index * _STATE_FIELDS
+        count = self.counts[index]
+        samples = min(count, self.window)
+        total = total_sq = total_xy = 0.0
+        for x in range(samples):
+            value = self.values[
+                index * self.window + (count - samples + x) % self.window]
+            total += value
+            total_sq += value * value
+            total_xy += x * value
+        self.state[state + _SUM] = total
+        self.state[state + _SUMSQ] = total_sq
+        self.state[state + _SUMXY] = total_xy
+
+    def update(
+        self,
+        stats: StationStats
+    ) -> Dict[str, SlotTrend]:
+        '''
+        Add the latest statistics of a station and get its trends
+
+        Metrics that are missing (None or negative, as set by
+        get_staion_statistics) are not added but their trend is still
+        returned.
+
+        Parameters
+        ----------
+        stats: StationStats
+            The latest statistics of the station
+
+        Returns
+        -------
+        Dict[str, SlotTrend]: The trend of each of the TREND_METRICS
+        '''
+        row = self._row(stats.station_name)
+        trends = {}
+        for offset, metric in enumerate(TREND_METRICS):
+            index = row * len(TREND_METRICS) + offset
+            value = getattr(stats, metric)
+            # good_burst flags a missing value with -1, receive_strength
+            # with None
+            if value is not None and not (
+                    metric == 'good_burst' and value < 0):
+                self._add_sample(index, float(value))
+            trends[metric] = self._trend(index)
+        return trends
+
+    def prune(
+        self,
+        stations: Container[str]
+    ) -> int:
+        '''
+        Drop the statistics of the stations that are not in stations, such as
+        the stations removed from the station map
+
+        Parameters
+        ----------
+        stations: Container[str]
+            The station names to keep
+
+        Returns
+        -------
+        int: The number of stations dropped
+        '''
+        kept = sorted(
+            (row, station) for station, row in self.rows.items()
+            if station in stations)
+        dropped = len(self.rows) - len(kept)
+        if not dropped:
+            return 0
+
+        metrics = len(TREND_METRICS)
+        values = array('d')
+        state = array('d')
+        counts = array('q')
+        for row, _ in kept:
+            values.extend(self.values[
+                row * metrics * self.window:(row + 1) * metrics * self.window])
+            state.extend(self.state[
+                row * metrics * _STATE_FIELDS:
+                (row + 1) * metrics * _STATE_FIELDS])
+            counts.extend(self.counts[row * metrics:(row + 1) * metrics])
+        self.rows = {station: row for row, (_, station) in enumerate(kept)}
+        self.values = values
+        self.state = state
+        self.counts = counts
+        return dropped
+
+    def save(
+        self,
+        path: str
+    ):
+        '''
+        Save the statistics so they can be reloaded by the next run
+
+        Parameters
+        ----------
+        path: str
+            The path to the state file
+        '''
+        stations: List[Optional[str]] = [None] * len(self.rows)
+        for station, row in self.rows.items():
+            stations[row] = station
+        header = json.dumps({
+            'window': self.window,
+            'alpha': self.alpha,
+            'stations': stations
+        }).encode()
+        with open(path, 'wb') as f:
+            f.write(_HEADER_SIZE.pack(len(header)))
+            f.write(header)
+            self.values.tofile(f)
+            self.state.tofile(f)
+            self.counts.tofile(f)
+
+
+def load_rolling_statistics(
+    path: str,
+    window: int = 12,
+    alpha: float = 0.3
+) -> RollingStatistics:
+    '''
+    Load the statistics saved by a previous run
+
+    A new, empty, set of statistics is returned if the file doesn't exist or
+    was saved with a different window or smoothing factor.
+
+    Parameters
+    ----------
+    path: str
+        The path to the state file
+
+    window: int
+        The number of samples the mean, variance and slope are computed over
+
+    alpha: float
+        The smoothing factor of the exponentially weighted moving average
+
+    Returns
+    -------
+    RollingStatistics
+    '''
+    rolling = RollingStatistics(window=window, alpha=alpha)
+    try:
+        with open(path, 'rb') as f:
+            (size,) = _HEADER_SIZE.unpack(f.read(_HEADER_SIZE.size))
+            header = json.loads(f.read(size))
+            if header['window'] != window or header['alpha'] != alpha:
+                logging.info(
+                    f'Trend settings changed, discarding state in {path}')
+                return rolling
+            rows = len(header['stations'])
+            metrics = len(TREND_METRICS)
+            rolling.values.fromfile(f, rows * metrics * window)
+            rolling.state.fromfile(f, rows * metrics * _STATE_FIELDS)
+            rolling.counts.fromfile(f, rows * metrics)
+    except FileNotFoundError:
+        return rolling
+    except EOFError:
+        logging.warning(f'Truncated trend state in {path}, discarding it')
+        return RollingStatistics(window=window, alpha=alpha)
+
+    rolling.rows = {
+        station: row for row, station in enumerate(header['stations'])}
+    return rolling
@@ -0,0 +1,226 @@
+'''
+Adaptive polling of the hubs
+
+Hubs with a station in a CRITICAL or UNKNOWN state are polled at their
+minimum interval while the interval of stable hubs doubles after each poll,
+up to their maximum interval. The hubs due in a cycle are returned longest
+expected latency first so the slow hubs start first and the cycle ends as
+early as possible when the hubs are requested in parallel.
+'''
+import json
+import logging
+import math
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional
+
+from libra_metrics.apollo_interface.station_map import LibraHub
+
+
+@dataclass
+class HubSchedule:
+    # Seconds until the next poll of the hub
+    interval: float
+    # Time of the next poll, in seconds since the epoch
+    next_poll: float
+    # Moving average of the latency of the hub, None until polled
+    latency: Optional[float] = None
+
+
+class PollScheduler:
+    '''
+    Decides which hubs are polled in each cycle and in which order
+    '''
+    def __init__(
+        self,
+        min_interval: float = 60,
+        max_interval: float = 900,
+        backoff: float = 2.0,
+        latency_alpha: float = 0.3
+    ):
+        '''
+        Parameters
+        ----------
+        min_interval: float
+            The interval, in seconds, of hubs that aren't OK, unless the hub
+            sets its own min_interval in the station map
+
+        max_interval: float
+            The longest interval, in seconds, of stable hubs, unless the hub
+            sets its own max_interval in the station map
+
+        backoff: float
+            The factor the interval of a stable hub grows by after each poll
+
+        latency_alpha: float
+            The smoothing factor of the moving average of each hub's latency
+        '''
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.latency_alpha = latency_alpha
+        self.hubs: Dict[str, HubSchedule] = {}
+
+    def _limits(self, hub: LibraHub):
+        minimum = self.min_interval if hub.min_interval is None \
+            else hub.min_interval
+        maximum = self.max_interval if hub.max_interval is None \
+            else hub.max_interval
+        return minimum, max(minimum, maximum)
+
+    def due(
+        self,
+        hubs: List[LibraHub],
+        now: Optional[float] = None
+    ) -> List[LibraHub]:
+        '''
+        Get the hubs to poll, longest expected latency first
+
+        Hubs that were never polled are always due and come first since their
+        latency is unknown.
+
+        Parameters
+        ----------
+        hubs: List[LibraHub]
+            Every hub of the station map
+
+        now: float
+            The current time, defaults to the system time
+
+        Returns
+        -------
+        List[LibraHub]
+        '''
+        if now is None:
+            now = time.time()
+        due = []
+        for hub in hubs:
+            schedule = self.hubs.get(hub.hub_id)
+            if schedule is None or schedule.next_poll <= now:
+                due.append(hub)
+
+        def expected_latency(hub: LibraHub) -> float:
+            schedule = self.hubs.get(hub.hub_id)
+            if schedule is None or schedule.latency is None:
+                return math.inf
+            return schedule.latency
+
+        due.sort(key=expected_latency, reverse=True)
+        return due
+
+    def record(
+        self,
+        hub: LibraHub,
+        latency: float,
+        healthy: bool,
+        now: Optional[float] = None
+    ):
+        '''
+        Record a poll of a hub and schedule the next one
+
+        Parameters
+        ----------
+        hub: LibraHub
+            The hub that was polled
+
+        latency: float
+            The time, in seconds, apollo took to return the hub's statistics
+
+        healthy: bool
+            False if a station of the hub is CRITICAL or UNKNOWN
+
+        now: float
+            The current time, defaults to the system time
+        '''
+        if now is None:
+            now = time.time()
+        minimum, maximum = self._limits(hub)
+        schedule = self.hubs.get(hub.hub_id)
+        if schedule is None:
+            schedule = self.hubs[hub.hub_id] = HubSchedule(
+                interval=minimum, next_poll=now, latency=latency)
+        else:
+            schedule.latency = latency if schedule.latency is None \
+                else schedule.latency \
+                + self.latency_alpha * (latency - schedule.latency)
+            # Clamped in case the limits changed in the station map
+            schedule.interval = max(
+                minimum, min(maximum, schedule.interval * self.backoff))
+        if not healthy:
+            schedule.interval = minimum
+        schedule.next_poll = now + schedule.interval
+
+    def checkpoint(self) -> Dict[str, HubSchedule]:
+        '''
+        Get a copy of the schedule that rollback can restore
+        '''
+        return {hub_id: replace(schedule)
+                for hub_id, schedule in self.hubs.items()}
+
+    def rollback(
+        self,
+        checkpoint: Dict[str, HubSchedule]
+    ):
+        '''
+        Restore the schedule of a checkpoint, so the polls recorded since are
+        due again, such as when their results could not be submitted
+        '''
+        self.hubs = checkpoint
+
+    def next_poll(
+        self,
+        hubs: List[LibraHub]
+    ) -> float:
+        '''
+        Get the time the next hub is due, in seconds since the epoch
+        '''
+        return min(
+            (self.hubs[hub.hub_id].next_poll if hub.hub_id in self.hubs
+             else 0.0) for hub in hubs)
+
+    def save(
+        self,
+        path: str
+    ):
+        '''
+        Save the schedule so it can be reloaded by the next run
+
+        Parameters
+        ----------
+        path: str
+            The path to the state file
+        '''
+        with open(path, 'w') as f:
+            json.dump({
+                hub_id: {
+                    'interval': schedule.interval,
+                    'next_poll': schedule.next_poll,
+                    'latency': schedule.latency
+                }
+                for hub_id, schedule in self.hubs.items()
+            }, f)
+
+    def load(
+        self,
+        path: str
+    ):
+        '''
+        Load the schedule saved by a previous run, if there is one
+
+        Parameters
+        ----------
+        path: str
+            The path to the state file
+        '''
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            logging.warning(f'Ignoring invalid schedule in {path}: {e}')
+            return
+        self.hubs = {
+            hub_id: HubSchedule(**schedule)
+            for hub_id, schedule in data.items()
+        }
@@ -0,0 +1,289 @@
+'''
+Collection from several apollo servers
+
+Hubs of the station map can name the apollo server they are on, the other
+hubs are on the default server. Each server gets its own collector, with its
+own connection pool, concurrency limiter and rate limit, and the servers are
+polled in parallel from a thread each so a slow server doesn't hold up the
+hubs of the others.
+
+A server that can't be reached, or that answers every request with a server
+error, is skipped for a backoff period that doubles with each consecutive
+failure. The hubs it didn't return, the hubs whose request failed and the
+hubs of the servers being skipped are listed in the failed attribute.
+'''
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional
+
+from libra_metrics.apollo_interface.collector import ApolloCollector, \
+    HubResponse
+from libra_metrics.apollo_interface.hedging import Hedger
+from libra_metrics.apollo_interface.station_map import LibraHub
+
+
+@dataclass
+class ServerHealth:
+    # Number of fetches in a row that failed
+    failures: int = 0
+    # Time, on the monotonic clock, until which the server is skipped
+    down_until: float = 0.0
+    last_error: Optional[str] = None
+
+    def up(
+        self,
+        now: float
+    ) -> bool:
+        return now >= self.down_until
+
+
+class ApolloServers:
+    '''
+    Requests the SOH data of hubs from the apollo server of each hub
+    '''
+    def __init__(
+        self,
+        default_address: Optional[str],
+        new_collector: Callable[[str], ApolloCollector],
+        hedger: Optional[Hedger] = None,
+        backoff: float = 30.0,
+        max_backoff: float = 600.0
+    ):
+        '''
+        Parameters
+        ----------
+        default_address: str
+            The address, including port number, of the apollo server of the
+            hubs that don't name one
+
+        new_collector: Callable[[str], ApolloCollector]
+            Creates the collector of an apollo address, called the first time
+            a hub of the server is fetched
+
+        hedger: Hedger
+            The hedger shared by the collectors, if they hedge requests
+
+        backoff: float
+            The number of seconds a server is skipped after it failed,
+            doubled with each consecutive failure
+
+        max_backoff: float
+            The longest, in seconds, a server is skipped for
+        '''
+        self.default_address = default_address
+        self.new_collector = new_collector
+        self.hedger = hedger
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.collectors: Dict[str, ApolloCollector] = {}
+        self.health: Dict[str, ServerHealth] = {}
+        # Hubs the last fetch gave up on when its deadline passed
+        self.expired: List[LibraHub] = []
+        # Hubs the last fetch couldn't collect because their server failed
+        self.failed: List[LibraHub] = []
+        # Time, on the monotonic clock, by which the current fetch must end
+        self._deadline: Optional[float] = None
+        # Threads of the last fetch from several servers
+        self._pool = None
+
+    def address(
+        self,
+        hub: LibraHub
+    ) -> str:
+        '''
+        Get the address of the apollo server of a hub
+        '''
+        address = hub.apollo_address or self.default_address
+        if address is None:
+            raise ValueError(f'{hub.hub_id} has no apollo server')
+        return address
+
+    def _collector(
+        self,
+        address: str
+    ) -> ApolloCollector:
+        collector = self.collectors.get(address)
+        if collector is None:
+            collector = self.collectors[address] = self.new_collector(address)
+        return collector
+
+    def fetch(
+        self,
+        hubs: List[LibraHub],
+        deadline: Optional[float] = None
+    ) -> Iterator[HubResponse]:
+        '''
+        Request the SOH data of every hub from its apollo server
+
+        Parameters
+        ----------
+        hubs: List[LibraHub]
+            The hubs to request data for
+
+        deadline: float
+            Time, on the time.monotonic clock, after which no new request is
+            sent. The hubs that were not collected are listed in the expired
+            attribute
+
+        Returns
+        -------
+        Iterator[HubResponse]: The data returned for each hub, as each
+        server returns it
+        '''
+        servers: Dict[str, List[LibraHub]] = {}
+        for hub in hubs:
+            servers.setdefault(self.address(hub), []).append(hub)
+        # The threads of a fetch that was not consumed to the end could
+        # still update the state of this one
+        self._join()
+        self.expired = []
+        self.failed = []
+        self._deadline = deadline
+
+        now = time.monotonic()
+        polled = {}
+        for address, server_hubs in servers.items():
+            health = self.health.setdefault(address, ServerHealth())
+            if health.up(now):
+                polled[address] = server_hubs
+                continue
+            logging.warning(
+                f'Skipping apollo server {address} for another '
+                + f'{health.down_until - now:.0f}s after {health.failures} '
+                + f'failures, {len(server_hubs)} hubs not collected: '
+                + f'{health.last_error}')
+            self.failed.extend(server_hubs)
+
+        if len(polled) == 1:
+            (address, server_hubs), = polled.items()
+            yield from self._fetch_server(address, server_hubs)
+        elif polled:
+            yield from self._fetch_parallel(polled)
+
+        if self.hedger is not None:
+            self.hedger.log_stats()
+
+    def _fetch_parallel(
+        self,
+        servers: Dict[str, List[LibraHub]]
+    ) -> Iterator[HubResponse]:
+        '''
+        Request the hubs of each server from a thread per server, yielding
+        the responses as they arrive
+
+        If the responses stop being consumed, the threads stop once their
+        current request ends, without recording anything.
+        '''
+        # Only loaded with several servers, to keep the entry point quick to
+        # start
+        import queue
+        from concurrent.futures import ThreadPoolExecutor
+
+        # The end of each server's fetch is flagged with None
+        responses: queue.Queue = queue.Queue()
+        stop = threading.Event()
+
+        def fetch_server(address: str, server_hubs: List[LibraHub]):
+            try:
+                for response in self._fetch_server(
+                        address, server_hubs, stop):
+                    if stop.is_set():
+                        break
+                    responses.put(response)
+            finally:
+                responses.put(None)
+
+        pool = self._pool = ThreadPoolExecutor(max_workers=len(servers))
+        try:
+            for address, server_hubs in servers.items():
+                pool.submit(fetch_server, address, server_hubs)
+            remaining = len(servers)
+            while remaining:
+                response = responses.get()
+                if response is None:
+                    remaining -= 1
+                else:
+                    yield response
+        finally:
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _join(self):
+        '''
+        Wait for the threads of the last fetch from several servers to end
+        '''
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _fetch_server(
+        self,
+        address: str,
+        hubs: List[LibraHub],
+        stop: Optional[threading.Event] = None
+    ) -> Iterator[HubResponse]:
+        '''
+        Request the hubs of a server and track its health, unless stop is
+        set by the time the fetch ends
+        '''
+        health = self.health[address]
+        collected = set()
+        try:
+            collector = self._collector(address)
+            for response in collector.fetch(hubs, deadline=self._deadline):
+                collected.add(response.hub.hub_id)
+                yield response
+        except Exception as e:
+            if stop is not None and stop.is_set():
+                return
+            self._server_failed(address, e, [
+                hub for hub in hubs if hub.hub_id not in collected])
+            return
+        if stop is not None and stop.is_set():
+            return
+
+        self.expired.extend(collector.expired)
+        if not collected and collector.overloaded():
+            # Every request got a server error
+            self._server_failed(address, collector.errors[-1],
+                                collector.failed)
+            return
+        self.failed.extend(collector.failed)
+        if health.failures:
+            logging.info(f'Apollo server {address} recovered after '
+                         + f'{health.failures} failures')
+        health.failures = 0
+        health.last_error = None
+
+    def _server_failed(
+        self,
+        address: str,
+        error: Exception,
+        uncollected: List[LibraHub]
+    ):
+        '''
+        Record the failure of a server and skip it until its backoff ends
+        '''
+        health = self.health[address]
+        health.failures += 1
+        health.last_error = str(error) or type(error).__name__
+        delay = min(self.backoff * 2 ** (health.failures - 1),
+                    self.max_backoff)
+        health.down_until = time.monotonic() + delay
+        self.failed.extend(uncollected)
+        logging.error(
+            f'Apollo server {address} failed, {len(uncollected)} hubs '
+            + f'not collected, skipping it for {delay:.0f}s: '
+            + f'{health.last_error}')
+
+    def close(self):
+        '''
+        Wait for the threads of the last fetch and close the connection pool
+        of every server
+        '''
+        self._join()
+        for collector in self.collectors.values():
+            if collector.session is not None:
+                collector.session.close()
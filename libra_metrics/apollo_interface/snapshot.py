@@ -0,0 +1,263 @@
+'''
+Memory-mapped snapshot of the latest station statistics
+
+The collector publishes the statistics of every cycle to a snapshot file so
+local consumers can read the current values without querying apollo. The
+file has a fixed layout:
+
+    header   magic, version, record size, generation, cycle time, records
+    records  station, hub, total bytes, good burst ratio, receive power and
+             fetch latency of each station
+
+Each cycle writes a new file next to the snapshot and atomically renames it
+over the previous one, so a reader always sees a complete snapshot. Readers
+memory map the file and decode the records they access directly from the
+map.
+'''
+import math
+import mmap
+import os
+import struct
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from libra_metrics.apollo_interface.collector import HubResponse
+from libra_metrics.apollo_interface.soh_api import StationStatistics
+
+
+MAGIC = b'LBSS'
+VERSION = 1
+# magic, version, record size, generation, cycle time, number of records
+HEADER = struct.Struct('<4sHHQdI')
+# station, hub, total bytes, good burst ratio, receive power, fetch latency
+# Station and hub names are stored in 32 bytes, longer names are truncated
+RECORD = struct.Struct('<32s32sqddd')
+NAME_SIZE = 32
+
+
+def _name(name: str) -> bytes:
+    '''
+    Encode a name for a record, truncated on a character boundary so it can
+    always be decoded
+    '''
+    encoded = name.encode()
+    if len(encoded) <= NAME_SIZE:
+        return encoded
+    return encoded[:NAME_SIZE].decode(errors='ignore').encode()
+
+
+@dataclass
+class SnapshotRecord:
+    __slots__ = ('station', 'hub', 'total_bytes', 'good_burst',
+                 'receive_strength', 'latency')
+    station: str
+    hub: str
+    # -1 if the value was missing
+    total_bytes: int
+    # NaN if the value was missing
+    good_burst: float
+    receive_strength: float
+    latency: float
+
+
+def _read_generation(path: Path) -> int:
+    '''
+    Get the generation of an existing snapshot, 0 if there is none
+    '''
+    try:
+        with open(path, 'rb') as f:
+            magic, _, _, generation, _, _ = HEADER.unpack(
+                f.read(HEADER.size))
+    except (FileNotFoundError, struct.error):
+        return 0
+    return generation if magic == MAGIC else 0
+
+
+class SnapshotWriter:
+    '''
+    Publishes the statistics of each cycle to the snapshot file
+
+    Hubs that were not polled during a cycle keep the statistics of the last
+    cycle they were polled in.
+    '''
+    def __init__(
+        self,
+        path: str
+    ):
+        '''
+        Parameters
+        ----------
+        path: str
+            The path to the snapshot file
+        '''
+        self.path = Path(path)
+        self.generation = _read_generation(self.path)
+        # Packed records of each hub
+        self._latest: Dict[str, bytes] = {}
+
+    def add(
+        self,
+        response: HubResponse,
+        stations: StationStatistics
+    ):
+        '''
+        Add the statistics of a hub to the cycle being collected
+
+        Parameters
+        ----------
+        response: HubResponse
+            The response of the apollo server for the hub
+
+        stations: StationStatistics
+            The statistics extracted from the response
+        '''
+        hub = _name(response.hub.hub_id)
+        records = bytearray()
+        for stats in stations.stations:
+            records += RECORD.pack(
+                _name(stats.station_name),
+                hub,
+                stats.total_bytes,
+                math.nan if stats.good_burst < 0 else stats.good_burst,
+                math.nan if stats.receive_strength is None
+                else stats.receive_strength,
+                response.latency
+            )
+        self._latest[response.hub.hub_id] = bytes(records)
+
+    def abort_cycle(self):
+        '''
+        Keep the previous snapshot after a cycle failed part way, the hubs
+        added so far are published with the next cycle
+        '''
+
+    def end_cycle(self):
+        '''
+        Replace the snapshot with the statistics of the cycle
+        '''
+        self.generation += 1
+        records = b''.join(self._latest.values())
+        header = HEADER.pack(MAGIC, VERSION, RECORD.size, self.generation,
+                             time.time(), len(records) // RECORD.size)
+        tmp = self.path.with_name(f'.{self.path.name}.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(header)
+            f.write(records)
+        os.replace(tmp, self.path)
+
+
+class SnapshotReader:
+    '''
+    Reads the latest snapshot published by the collector
+
+    The reader keeps the snapshot it opened until refresh() is called, even
+    if the collector publishes a new one in the meantime.
+    '''
+    def __init__(
+        self,
+        path: str
+    ):
+        '''
+        Parameters
+        ----------
+        path: str
+            The path to the snapshot file
+
+        Raises
+        ------
+        FileNotFoundError: Raised if no snapshot was published yet
+
+        ValueError: Raised if the file is not a snapshot
+        '''
+        self.path = Path(path)
+        self._map: Optional[mmap.mmap] = None
+        self._index: Optional[Dict[str, int]] = None
+        self._open()
+
+    def _open(self):
+        with open(self.path, 'rb') as f:
+            self._inode = os.fstat(f.fileno()).st_ino
+            new_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, generation, timestamp, count = \
+            HEADER.unpack_from(new_map)
+        if magic != MAGIC or version != VERSION or \
+                record_size != RECORD.size:
+            new_map.close()
+            raise ValueError(f'{self.path} is not a version {VERSION} '
+                             + 'station snapshot')
+        if self._map is not None:
+            self._map.close()
+        self._map = new_map
+        self._index = None
+        self.generation = generation
+        self.timestamp = timestamp
+        self.count = count
+
+    def refresh(self) -> bool:
+        '''
+        Switch to the latest snapshot if a new one was published
+
+        Returns
+        -------
+        bool: True if a new snapshot was opened
+        '''
+        if os.stat(self.path).st_ino == self._inode:
+            return False
+        self._open()
+        return True
+
+    def _record(self, position: int) -> SnapshotRecord:
+        station, hub, total_bytes, good_burst, power, latency = \
+            RECORD.unpack_from(
+                self._map, HEADER.size + position * RECORD.size)
+        return SnapshotRecord(
+            station=station.rstrip(b'\0').decode(),
+            hub=hub.rstrip(b'\0').decode(),
+            total_bytes=total_bytes,
+            good_burst=good_burst,
+            receive_strength=power,
+            latency=latency
+        )
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[SnapshotRecord]:
+        for position in range(self.count):
+            yield self._record(position)
+
+    def get(
+        self,
+        station: str
+    ) -> Optional[SnapshotRecord]:
+        '''
+        Get the latest statistics of a station
+
+        Parameters
+        ----------
+        station: str
+            The station name
+
+        Returns
+        -------
+        SnapshotRecord: The statistics of the station, None if it is not in
+        the snapshot
+        '''
+        if self._index is None:
+            # Only the station names are decoded to build the index
+            self._index = {}
+            for position in range(self.count):
+                offset = HEADER.size + position * RECORD.size
+                name = self._map[offset:offset + NAME_SIZE] \
+                    .rstrip(b'\0').decode()
+                self._index[name] = position
+        # Long names are stored truncated
+        position = self._index.get(_name(station).decode())
+        return None if position is None else self._record(position)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
@@ -1,17 +1,27 @@
-from decimal import DivisionByZero
 import logging
-from typing import Dict, List
+from typing import Dict, List, Optional
 from dataclasses import dataclass
-import requests
 from libra_metrics.apollo_interface.station_map import LibraHub
 
 
+# Descriptions of the events counted when extracting the statistics of a hub
+MISSING_METRICS = {
+    'total_bytes': 'no total bytes',
+    'bursts': 'no burst statistics',
+    'zero_bursts': '0 total bursts',
+    'receive_power': 'no receive power',
+}
+
+
 @dataclass
 class StationStats:
+    # One instance per station per cycle, slots keep them small
+    __slots__ = ('station_name', 'total_bytes', 'good_burst',
+                 'receive_strength')
     station_name: str
     total_bytes: int
     good_burst: float
-    receive_strength: int
+    receive_strength: Optional[int]
 
 
 @dataclass
@@ -49,9 +59,38 @@ def assemble_api_url(
     return (base_url + api_options)
 
 
+def new_session(
+    pool_size: int = 1
+):
+    '''
+    Create an HTTP session keeping connections to an apollo server open
+    between requests
+
+    Parameters
+    ----------
+    pool_size: int
+        The number of connections kept open, at least the number of requests
+        sent at once
+
+    Returns
+    -------
+    requests.Session
+    '''
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
 def request_api(
     apollo_address: str,
     carina_id: str,
+    timeout: Optional[float] = None,
+    session=None
 ) -> Dict[str, str]:
     '''
     Sends a request to the apollo server api to get SOH statistics about a HUB
@@ -66,6 +105,13 @@ def request_api(
     carina_id: str
         The carina_id associated with the HUB
 
+    timeout: float
+        The number of seconds to wait for the server, forever if not set
+
+    session: requests.Session
+        The session whose connection pool the request is sent through, a
+        new connection is opened if not set
+
     Return
     ------
     Dictionary: The raw dump of the json returned by the API
@@ -73,18 +119,182 @@ def request_api(
     Raises
     ------
     HTTPError: Raised if the API call to the apollo server fails
+
+    Timeout: Raised if the server didn't answer within the timeout
     '''
+    # requests is slow to import so only load it when it is used
+    import requests
+
     request_url = assemble_api_url(
         apollo_address=apollo_address,
         carina_id=carina_id
     )
-    resp = requests.get(request_url)
+    get = requests.get if session is None else session.get
+    resp = get(request_url, timeout=timeout)
     resp.raise_for_status()
     data = resp.json()
 
     return data[carina_id]
 
 
+def assemble_batch_api_url(
+    apollo_address: str,
+    carina_ids: List[str]
+) -> str:
+    '''
+    Assemble the URL to be used to query the API for statistics about several
+    HUBs in a single request
+
+    Parameters
+    ----------
+    apollo_address: str
+        The address of the apollo server, including port number
+
+    carina_ids: List[str]
+        The carina_ids associated with the hubs
+
+    Returns
+    -------
+    str: The assembled URL to query the API with
+    '''
+    return assemble_api_url(
+        apollo_address=apollo_address,
+        carina_id=','.join(carina_ids)
+    )
+
+
+def request_api_batch(
+    apollo_address: str,
+    carina_ids: List[str],
+    timeout: Optional[float] = None,
+    session=None
+) -> Dict[str, Dict[str, str]]:
+    '''
+    Sends a single request to the apollo server api to get SOH statistics
+    about several HUBs and the modems connected to them
+
+    Parameters
+    ----------
+    apollo_address: str
+        The address, including port number, for the apollo server's web
+        interface
+
+    carina_ids: List[str]
+        The carina_ids associated with the HUBs
+
+    timeout: float
+        The number of seconds to wait for the server, forever if not set
+
+    session: requests.Session
+        The session whose connection pool the request is sent through, a
+        new connection is opened if not set
+
+    Return
+    ------
+    Dictionary: The raw dump of the json returned by the API for each
+    carina_id, indexed by carina_id. The carina_ids missing from the
+    response are left out
+
+    Raises
+    ------
+    HTTPError: Raised if the API call to the apollo server fails
+
+    Timeout: Raised if the server didn't answer within the timeout
+    '''
+    # requests is slow to import so only load it when it is used
+    import requests
+
+    request_url = assemble_batch_api_url(
+        apollo_address=apollo_address,
+        carina_ids=carina_ids
+    )
+    get = requests.get if session is None else session.get
+    resp = get(request_url, timeout=timeout)
+    resp.raise_for_status()
+    data = resp.json()
+
+    return {carina_id: data[carina_id] for carina_id in carina_ids
+            if carina_id in data}
+
+
+def get_slot_statistics(
+    api_data: Dict,
+    hub: LibraHub,
+    slot_id: str,
+    missing: Optional[Dict[str, List[str]]] = None
+) -> StationStats:
+    '''
+    Extract the statistics of the station attached to a single TDMA slot from
+    the API call results
+
+    Parameters
+    ----------
+    api_data: Dict
+        The raw data returned by the API for the hub
+
+    hub: LibraHub
+        The hub the data was requested for
+
+    slot_id: str
+        The TDMA slot the station is attached to
+
+    missing: Dict[str, List[str]]
+        If set, the slot is added to the list of each MISSING_METRICS event
+        it hits instead of logging a warning for each of them
+
+    Returns
+    -------
+    StationStats
+    '''
+    slot_num = slot_id.split('_')[1]
+
+    def report(event: str):
+        if missing is None:
+            logging.warning(f'{hub.hub_id} {slot_id}: '
+                            + f'{MISSING_METRICS[event]}')
+        else:
+            missing.setdefault(event, []).append(slot_id)
+
+    # Don't crash if values are missing
+    try:
+        total_bytes = int(
+            api_data[f"modem/tdma/slot/rxStats/totalBytes#_{slot_num}"])
+    except KeyError:
+        report('total_bytes')
+        # Set totalbyes to -1 so this can be handled down the pipe
+        total_bytes = -1
+
+    try:
+        total_bursts = int(
+            api_data[f"modem/tdma/slot/rxStats/totalBursts#_{slot_num}"])
+        good_bursts = int(
+            api_data[f"modem/tdma/slot/rxStats/goodBursts#_{slot_num}"])
+        burst_percentage = good_bursts / total_bursts
+    except KeyError:
+        report('bursts')
+        # Set value to -1 so it can be handled downstream
+        burst_percentage = -1
+    except ZeroDivisionError:
+        report('zero_bursts')
+        burst_percentage = -1
+
+    try:
+        receive_power = int(
+            api_data[f"modem/tdma/slot/rxStats/receivePower#_{slot_num}"])
+    except KeyError:
+        report('receive_power')
+        # Receive power is in dBm and can be negative, so flag the
+        # missing value with None instead of -1
+        receive_power = None
+
+    return StationStats(
+        station_name=hub.tdmaslots[slot_id].station,
+        total_bytes=total_bytes,
+        good_burst=burst_percentage,
+        receive_strength=receive_power
+    )
+
+
 def get_staion_statistics(
     api_data: Dict,
     hub: LibraHub
@@ -92,55 +302,34 @@ def get_staion_statistics(
     '''
     Extract valuable station statistics from the API call results
 
+    Missing metrics are summarized in a single warning for the hub rather
+    than logged for each slot.
+
     Parameters
     ----------
     api_data: Dict
 
     '''
     stations = StationStatistics(stations=[])
+    missing: Dict[str, List[str]] = {}
     for slot_id in hub.tdmaslots:
-        slot_num = slot_id.split('_')[1]
-
-        # Log a warning but don't crash if values are missing
-        try:
-            total_bytes = int(
-                api_data[f"modem/tdma/slot/rxStats/totalBytes#_{slot_num}"])
-        except KeyError:
-            logging.warning(f'No "total byes" value for {slot_id} of '
-                            + f'{hub.hub_id}, skipping.')
-            # Set totalbyes to -1 so this can be handled down the pipe
-            total_bytes = -1
-
-        try:
-            total_bursts = int(
-                api_data[f"modem/tdma/slot/rxStats/totalBursts#_{slot_num}"])
-            good_bursts = int(
-                api_data[f"modem/tdma/slot/rxStats/goodBursts#_{slot_num}"])
-            burst_percentage = good_bursts / total_bursts
-        except KeyError:
-            logging.warning(
-                f'Burst statistics missing for {slot_id}, skipping.')
-            # Set value to -1 so it can be handled downstream
-            burst_percentage = -1
-        except DivisionByZero:
-            logging.warning(f'0 total Bursts for {slot_id} of {hub.hub_id}')
-
-        try:
-            receive_power = int(
-                api_data[f"modem/tdma/slot/rxStats/receivePower#_{slot_num}"])
-        except KeyError:
-            logging.warning(
-                f'Receive power statistic missing for {slot_id}')
-            receive_power = -1
-
         # Create a StationStats object for the station and add it to the
         # StationStatistics object
-        station = StationStats(
-            station_name=hub.tdmaslots[slot_id].station,
-            total_bytes=total_bytes,
-            good_burst=burst_percentage,
-            receive_strength=receive_power
-        )
-        stations.stations.append(station)
+        stations.stations.append(get_slot_statistics(
+            api_data=api_data,
+            hub=hub,
+            slot_id=slot_id,
+            missing=missing
+        ))
+
+    if missing:
+        logging.warning(f'{hub.hub_id}: ' + ', '.join(
+            f'{len(slots)} slots with {MISSING_METRICS[event]}'
+            for event, slots in missing.items()))
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            for event, slots in missing.items():
+                logging.debug(f'{hub.hub_id} slots with '
+                              + f'{MISSING_METRICS[event]}: '
+                              + ', '.join(slots))
 
     return stations
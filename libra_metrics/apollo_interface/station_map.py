@@ -1,11 +1,14 @@
 from pathlib import Path
 import json
-from typing import Dict, List
-from dataclasses import dataclass
+import logging
+from typing import Dict, List, Optional
+from dataclasses import dataclass, field
 
 
 @dataclass
 class TDMASlot:
+    # Slots avoid a per instance __dict__ on large maps
+    __slots__ = ('cygnus_id', 'station')
     cygnus_id: str
     station: str
 
@@ -20,27 +23,49 @@ class TDMASlot:
 
 @dataclass
 class LibraHub:
+    __slots__ = ('tdmaslots', 'carina_id', 'hub_id', 'apollo_address',
+                 'min_interval', 'max_interval')
     tdmaslots: Dict[str, TDMASlot]
     carina_id: str
     hub_id: str
+    # The apollo server of the hub, the default server if not set
+    apollo_address: Optional[str]
+    # Optional bounds, in seconds, of the adaptive polling interval
+    min_interval: Optional[float]
+    max_interval: Optional[float]
 
     def __init__(self, data: Dict, hub_id: str):
         '''
         Initializes the LibraHub object
         Assumes the data Dict passed contains a carina_id key and a tdma_slot
         key which would point the dictionary required for a TDMASlot
-        initializer
+        initializer, and optionally an apollo_address key naming the apollo
+        server of the hub, and min_interval and max_interval keys bounding
+        how often the hub is polled
         '''
         self.carina_id = data['carina_id']
+        self.apollo_address = data.get('apollo_address')
+        self.min_interval = data.get('min_interval')
+        self.max_interval = data.get('max_interval')
+        self.hub_id = hub_id
         self.tdmaslots = {}
         for slot in data['tdma_slots']:
             self.tdmaslots[slot] = TDMASlot(data['tdma_slots'][slot])
-            self.hub_id = hub_id
+
+
+@dataclass
+class StationLocation:
+    __slots__ = ('hub', 'carina_id', 'slot_id')
+    hub: LibraHub
+    carina_id: str
+    slot_id: str
 
 
 @dataclass
 class LibraHubs:
     hubs: List[LibraHub]
+    # Reverse index of the map, from station name to where it is attached
+    stations: Dict[str, StationLocation] = field(default_factory=dict)
 
 
 def open_station_map(
@@ -89,8 +114,21 @@ def parse_map_data(
     '''
     librahubs = LibraHubs(hubs=[])
     for hub in map_data:
-        librahubs.hubs.append(LibraHub(
+        librahub = LibraHub(
             data=map_data[hub],
             hub_id=hub
-        ))
+        )
+        librahubs.hubs.append(librahub)
+
+        for slot_id, slot in librahub.tdmaslots.items():
+            if slot.station in librahubs.stations:
+                logging.warning(
+                    f'{slot.station} is attached to more than one TDMA slot, '
+                    + f'ignoring {slot_id} of {hub}')
+                continue
+            librahubs.stations[slot.station] = StationLocation(
+                hub=librahub,
+                carina_id=librahub.carina_id,
+                slot_id=slot_id
+            )
     return librahubs
@@ -1,12 +1,326 @@
 import logging
-from urllib.error import HTTPError
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
 import click
+from libra_metrics.apollo_interface.collector import ApolloCollector, \
+    HubResponse
+from libra_metrics.apollo_interface.export import FORMATS, ROTATIONS
+from libra_metrics.apollo_interface.fingerprint import HubResultCache
+from libra_metrics.apollo_interface.hedging import Hedger
+from libra_metrics.apollo_interface.limiter import AdaptiveLimiter, \
+    get_rate_limit
+from libra_metrics.apollo_interface.rolling_stats import \
+    RollingStatistics, load_rolling_statistics
+from libra_metrics.apollo_interface.recording import list_recorded_cycles, \
+    record_responses, replay_cycle
+from libra_metrics.apollo_interface.scheduler import PollScheduler
+from libra_metrics.apollo_interface.servers import ApolloServers
 from libra_metrics.apollo_interface.soh_api import get_staion_statistics, \
-    request_api
-from libra_metrics.apollo_interface.station_map import open_station_map
-from libra_metrics.nagios.config import load_nagios_config
-from libra_metrics.nagios.libra_checks import check_station
-from libra_metrics.nagios.nrdp import NagiosCheckResults, submit
+    new_session
+from libra_metrics.apollo_interface.station_map import LibraHubs, \
+    open_station_map
+from libra_metrics.nagios import NagiosAPI
+from libra_metrics.nagios.config import NagiosConfig, load_nagios_targets
+from libra_metrics.lock import AlreadyRunning, run_lock
+from libra_metrics.log import start_logging
+from libra_metrics.nagios.libra_checks import check_stations, \
+    check_uncollected_hub
+from libra_metrics.nagios.models import NagiosOutputCode
+from libra_metrics.nagios.nrdp import NagiosCheckResults, submit_all
+from libra_metrics.nagios.objects import NagiosObjectCache
+from libra_metrics.nagios.rollups import ProblemFilter, rollup_hub
+from libra_metrics.nagios.thresholds import ThresholdTable, \
+    load_threshold_profiles
+from libra_metrics.profiling import StageProfiler, check_memory_budget
+
+
+# Share of the deadline kept to check and submit what was collected
+DEADLINE_RESERVE = 0.1
+
+
+def _call_sinks(
+    sinks: List,
+    method: str,
+    *args
+):
+    '''
+    Call a method of each sink
+
+    A sink that fails is logged, its cycle is aborted and it is removed from
+    sinks so it is skipped for the rest of the cycle. The sinks are optional,
+    their failures must not keep the results from Nagios.
+    '''
+    for sink in list(sinks):
+        try:
+            getattr(sink, method)(*args)
+        except Exception as e:
+            logging.error(
+                f'{type(sink).__name__} failed in {method}, skipping it for '
+                + f'the rest of the cycle: {e}')
+            sinks.remove(sink)
+            if method != 'abort_cycle':
+                _call_sinks([sink], 'abort_cycle')
+
+
+def check_responses(
+    responses: Iterable[HubResponse],
+    thresholds: ThresholdTable,
+    rolling: Optional[RollingStatistics] = None,
+    sinks: Iterable = (),
+    scheduler: Optional[PollScheduler] = None,
+    rollups: bool = False,
+    problems: Optional[ProblemFilter] = None,
+    cache: Optional[HubResultCache] = None
+) -> NagiosCheckResults:
+    '''
+    Generate nagios check results for each station attached to each hub
+
+    The statistics extracted for each hub are also passed to the add method
+    of each sink, and the end_cycle method of each sink is called once every
+    response was processed, or its abort_cycle method if the processing
+    failed. A sink that fails is skipped for the rest of the cycle, the
+    checks still run. The latency and health of each hub are recorded by the
+    scheduler, if there is one.
+
+    With rollups, the rollup services of each hub are added to the results.
+    With a problem filter, only the station services that are not OK or just
+    recovered are kept.
+
+    With a result cache, the statistics and results of the hubs whose
+    response did not change are reused, or left out in change-only mode.
+    The checks of reused hubs are still run when there are rolling
+    statistics, so the trend windows get a sample every cycle.
+
+    The hubs left out in change-only mode bypass the problem filter as well.
+    Its state for their services is the one of the cycle they were last
+    submitted in, so a problem is resent, and a recovery sent, once the hub
+    changes or is recomputed after max_age cycles. That includes the trend
+    services, which are not compared to decide whether a hub changed.
+    '''
+    results = NagiosCheckResults()
+    sinks = list(sinks)
+    try:
+        for response in responses:
+            cached = None if cache is None else cache.get(response)
+            if cached is not None:
+                stations = cached.stations
+            else:
+                stations = get_staion_statistics(
+                    api_data=response.data,
+                    hub=response.hub
+                )
+            _call_sinks(sinks, 'add', response, stations)
+            if cached is not None and rolling is None:
+                hub_results = cached.results
+                hub_rollups = cached.rollups
+            else:
+                hub_results = check_stations(
+                    stations=stations,
+                    thresholds=thresholds,
+                    rolling=rolling
+                )
+                hub_rollups = NagiosCheckResults()
+                if rollups:
+                    hub_rollups = rollup_hub(
+                        response.hub, stations, hub_results)
+                if cache is not None and cached is None:
+                    cache.put(response, stations, hub_results, hub_rollups)
+            if scheduler is not None:
+                scheduler.record(
+                    hub=response.hub,
+                    latency=response.latency,
+                    healthy=all(
+                        result['state'] < NagiosOutputCode.critical
+                        for result in hub_results)
+                )
+            if cached is not None and cache.changed_only:
+                continue
+            results.extend(hub_rollups)
+            if problems is not None:
+                hub_results = problems.filter(hub_results)
+            results.extend(hub_results)
+    except BaseException:
+        # Sinks must not carry the failed cycle over to the next one
+        _call_sinks(sinks, 'abort_cycle')
+        raise
+    finally:
+        if cache is not None:
+            cache.end_cycle()
+    _call_sinks(sinks, 'end_cycle')
+    return results
+
+
+@dataclass
+class Cycle:
+    '''
+    Everything a collection cycle needs, set up once for every cycle
+    '''
+    hubs: LibraHubs
+    collector: ApolloServers
+    # The primary Nagios server first
+    nagios: List[NagiosConfig]
+    thresholds: ThresholdTable
+    rolling: Optional[RollingStatistics] = None
+    trend_state: Optional[str] = None
+    record: Optional[str] = None
+    sinks: List = field(default_factory=list)
+    scheduler: Optional[PollScheduler] = None
+    schedule_state: Optional[str] = None
+    rollups: bool = False
+    problems: Optional[ProblemFilter] = None
+    problem_state: Optional[str] = None
+    # Seconds the whole cycle must complete in
+    deadline: Optional[float] = None
+    hedge_state: Optional[str] = None
+    profiler: Optional[StageProfiler] = None
+    objects: Optional[NagiosObjectCache] = None
+    cache: Optional[HubResultCache] = None
+
+
+def run_cycle(
+    cycle: Cycle
+):
+    '''
+    Collect the statistics of every hub, check them and submit the results
+    to Nagios
+
+    With a scheduler, only the hubs that are due are collected. With a
+    deadline, the collection stops once most of it is used up and the
+    stations of the hubs that were not collected are reported as UNKNOWN.
+    With a profiler, each stage of the cycle is profiled on its own.
+
+    The state files are only saved once the results were submitted to the
+    primary Nagios server. If that failed, the schedule and the problem
+    filter go back to where they were so the hubs are polled, and their
+    results sent, again in the next cycle.
+    '''
+    stage = nullcontext if cycle.profiler is None else cycle.profiler.stage
+    start = time.monotonic()
+    fetch_deadline = None
+    if cycle.deadline is not None:
+        fetch_deadline = start + cycle.deadline * (1 - DEADLINE_RESERVE)
+
+    hubs = cycle.hubs.hubs
+    if cycle.scheduler is not None:
+        hubs = cycle.scheduler.due(hubs)
+        if not hubs:
+            logging.debug('No hub is due')
+            return
+        logging.info(f'Polling {len(hubs)} of {len(cycle.hubs.hubs)} hubs')
+        schedule = cycle.scheduler.checkpoint()
+    if cycle.problems is not None:
+        problems = set(cycle.problems.problems)
+
+    # Get SOH data from the API for each hub
+    with stage('api decode'):
+        responses = cycle.collector.fetch(hubs, deadline=fetch_deadline)
+        if cycle.record is not None:
+            responses = record_responses(cycle.record, responses)
+        if cycle.profiler is not None:
+            # Collected up front so the requests are profiled apart from the
+            # checks
+            responses = list(responses)
+
+    with stage('extraction'):
+        results = check_responses(
+            responses=responses,
+            thresholds=cycle.thresholds,
+            rolling=cycle.rolling,
+            sinks=cycle.sinks,
+            scheduler=cycle.scheduler,
+            rollups=cycle.rollups,
+            problems=cycle.problems,
+            cache=cycle.cache
+        )
+        trends = cycle.rolling is not None
+        for hub in cycle.collector.expired:
+            uncollected = check_uncollected_hub(hub, trends=trends)
+            if cycle.problems is not None:
+                uncollected = cycle.problems.filter(uncollected)
+            results.extend(uncollected)
+        for hub in cycle.collector.failed:
+            address = cycle.collector.address(hub)
+            if cycle.collector.health[address].failures:
+                reason = f'Apollo server {address} unavailable'
+            else:
+                # The server is up but the request of the hub failed
+                reason = f'Request to Apollo server {address} failed'
+            uncollected = check_uncollected_hub(
+                hub, reason=reason, trends=trends)
+            if cycle.problems is not None:
+                uncollected = cycle.problems.filter(uncollected)
+            results.extend(uncollected)
+
+        # NRDP would silently drop the results of unknown objects
+        index = None if cycle.objects is None else cycle.objects.index()
+        if index is not None:
+            results, dropped = index.filter(results)
+            if dropped:
+                logging.info(f'Dropped {dropped} results of hosts and '
+                             + 'services unknown to Nagios')
+
+    with stage('xml serialization'):
+        xml = results.to_xml()
+
+    # Push the results to every nagios server using NRDP
+    timeout = None
+    if cycle.deadline is not None:
+        timeout = max(start + cycle.deadline - time.monotonic(), 1.0)
+    with stage('submission'):
+        primary, *_ = submit_all(
+            nrdp=results,
+            targets=cycle.nagios,
+            timeout=timeout,
+            xml=xml
+        )
+    if not primary.success:
+        if cycle.scheduler is not None:
+            cycle.scheduler.rollback(schedule)
+        if cycle.problems is not None:
+            cycle.problems.problems = problems
+        return
+
+    if cycle.rolling is not None:
+        cycle.rolling.save(cycle.trend_state)
+    if cycle.schedule_state is not None:
+        cycle.scheduler.save(cycle.schedule_state)
+    if cycle.problem_state is not None:
+        cycle.problems.save(cycle.problem_state)
+    if cycle.hedge_state is not None:
+        cycle.collector.hedger.save(cycle.hedge_state)
+
+
+def replay(
+    directory: str,
+    hubs: LibraHubs,
+    thresholds: ThresholdTable,
+    rolling: Optional[RollingStatistics] = None,
+    sinks: Iterable = (),
+    rollups: bool = False,
+    problems: Optional[ProblemFilter] = None,
+    cache: Optional[HubResultCache] = None
+):
+    '''
+    Run every recorded cycle through the checks and the NRDP serializer
+    without sending anything over the network
+    '''
+    for cycle_dir in list_recorded_cycles(directory):
+        start = time.perf_counter()
+        results = check_responses(
+            responses=replay_cycle(cycle_dir, hubs),
+            thresholds=thresholds,
+            rolling=rolling,
+            sinks=sinks,
+            rollups=rollups,
+            problems=problems,
+            cache=cache
+        )
+        xml = results.to_xml()
+        click.echo(f'{cycle_dir.name}: {len(results)} results, '
+                   + f'{len(xml)} bytes of XML in '
+                   + f'{time.perf_counter() - start:.3f}s')
 
 
 @click.command()
@@ -18,56 +332,575 @@ from libra_metrics.nagios.nrdp import NagiosCheckResults, submit
 )
 @click.option(
     '-a',
+    '--apollo-address',
+    # Kept for the existing command lines
     '-apollo-address',
+    'apollo_address',
     help='The hostname or IP address of the apollo server to query, including \
-        port number'
+        port number. Hubs naming an apollo_address in the station map are \
+        queried on their own server'
 )
 @click.option(
     '-n',
     '--nagios-config',
     help='The configuration file containing information for reaching the \
-        Nagios server'
+        Nagios server, and optionally other servers the results are also \
+        submitted to'
+)
+@click.option(
+    '-b',
+    '--batch-size',
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help='The number of hubs to request from apollo in a single API call'
+)
+@click.option(
+    '--timeout',
+    default=None,
+    type=float,
+    help='The number of seconds to wait for each apollo request'
+)
+@click.option(
+    '--max-concurrency',
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help='Send up to this many apollo requests in parallel, adapting the \
+        number in flight to the latency of the server'
+)
+@click.option(
+    '--target-latency',
+    default=2.0,
+    show_default=True,
+    type=float,
+    help='Apollo requests slower than this, in seconds, reduce the number of \
+        requests sent in parallel'
+)
+@click.option(
+    '--rate-limit',
+    default=None,
+    type=float,
+    help='The maximum number of requests per second sent to apollo'
+)
+@click.option(
+    '--hedge',
+    is_flag=True,
+    help='Send a second request for hubs slower than the 95th percentile of \
+        their recent latencies and use the first response'
+)
+@click.option(
+    '--hedge-budget',
+    default=0.1,
+    show_default=True,
+    type=click.FloatRange(min=0, max=1),
+    help='The highest ratio of hedged requests to requests'
+)
+@click.option(
+    '--hedge-state',
+    default=None,
+    help='File keeping the recent latencies of each hub between runs. \
+        Requires --hedge'
+)
+@click.option(
+    '-t',
+    '--thresholds',
+    default=None,
+    help='Optional file containing warning and critical threshold profiles \
+        with defaults, per-hub and per-station overrides'
+)
+@click.option(
+    '--trend-state',
+    default=None,
+    help='File keeping the rolling statistics of each station between runs. \
+        Trend services are only submitted when this is set'
+)
+@click.option(
+    '--trend-window',
+    default=12,
+    show_default=True,
+    type=click.IntRange(min=2),
+    help='The number of samples the trend of each station is computed over'
+)
+@click.option(
+    '--trend-alpha',
+    default=0.3,
+    show_default=True,
+    type=click.FloatRange(min=0, max=1, min_open=True),
+    help='The smoothing factor of the moving average of each station'
+)
+@click.option(
+    '--deadline',
+    default=None,
+    type=click.FloatRange(min=0, min_open=True),
+    help='The number of seconds a cycle must complete in. Hubs that are not \
+        collected in time are reported as UNKNOWN'
+)
+@click.option(
+    '--lock-file',
+    default=None,
+    help='Lock this file for as long as the run lasts and exit with an error \
+        if another run holds it'
+)
+@click.option(
+    '--nagios-objects',
+    default=None,
+    help='Cache file of the hosts and services configured in Nagios, loaded \
+        with the xi_api_key of the Nagios config. Results of unknown objects \
+        are dropped and stations without a host are reported'
+)
+@click.option(
+    '--nagios-objects-max-age',
+    default=86400.0,
+    show_default=True,
+    type=click.FloatRange(min=0),
+    help='The age, in seconds, after which the Nagios objects are reloaded'
+)
+@click.option(
+    '--hub-rollups',
+    is_flag=True,
+    help='Also submit services summarizing the stations of each hub for a \
+        host named after the hub'
+)
+@click.option(
+    '--problems-only',
+    is_flag=True,
+    help='Only submit the station services that are not OK, and the first OK \
+        result after they recover'
+)
+@click.option(
+    '--problem-state',
+    default=None,
+    help='File keeping the station services that are not OK between runs so \
+        their recovery is submitted. Requires --problems-only'
+)
+@click.option(
+    '--skip-unchanged',
+    is_flag=True,
+    help='Reuse the results of the hubs whose statistics did not change since \
+        the previous cycle. Requires --interval or --replay'
+)
+@click.option(
+    '--changed-only',
+    is_flag=True,
+    help='Leave the results of the hubs whose statistics did not change out \
+        of the submission. Requires --skip-unchanged'
+)
+@click.option(
+    '--unchanged-max-age',
+    default=10,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help='The number of cycles after which the results of an unchanged hub \
+        are recomputed and submitted again'
+)
+@click.option(
+    '--interval',
+    default=None,
+    type=float,
+    help='Keep running, starting a new cycle every this many seconds, \
+        instead of running a single cycle'
+)
+@click.option(
+    '--adaptive-polling',
+    is_flag=True,
+    help='Poll hubs with a CRITICAL or UNKNOWN station every --min-interval \
+        and back off on stable hubs up to --max-interval. Hubs can override \
+        both with min_interval and max_interval in the station map'
+)
+@click.option(
+    '--min-interval',
+    default=60.0,
+    show_default=True,
+    type=click.FloatRange(min=0),
+    help='The polling interval, in seconds, of hubs that are not OK'
+)
+@click.option(
+    '--max-interval',
+    default=900.0,
+    show_default=True,
+    type=click.FloatRange(min=0),
+    help='The longest polling interval, in seconds, of stable hubs'
+)
+@click.option(
+    '--schedule-state',
+    default=None,
+    help='File keeping the polling schedule of each hub between runs. \
+        Requires --adaptive-polling'
+)
+@click.option(
+    '--metrics-port',
+    default=None,
+    type=int,
+    help='Serve the latest station statistics in the Prometheus text format \
+        on this port. Requires --interval'
+)
+@click.option(
+    '--history',
+    default=None,
+    help='Append the statistics of each cycle to the history kept in this \
+        directory'
+)
+@click.option(
+    '--history-retention',
+    default=365,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help='The number of days of history to keep'
+)
+@click.option(
+    '--history-downsample',
+    default=30,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help='The age, in days, after which the history is downsampled to \
+        hourly averages'
+)
+@click.option(
+    '--snapshot',
+    default=None,
+    help='Publish the statistics of each cycle to this memory-mapped \
+        snapshot file for local consumers'
+)
+@click.option(
+    '--export',
+    'export_dir',
+    default=None,
+    help='Stream the statistics of every station to files in this directory \
+        for downstream analytics'
+)
+@click.option(
+    '--export-format',
+    default='ndjson',
+    show_default=True,
+    type=click.Choice(FORMATS),
+    help='The format of the export files'
+)
+@click.option(
+    '--export-rotate',
+    default='daily',
+    show_default=True,
+    type=click.Choice(list(ROTATIONS)),
+    help='How often a new export file is started'
+)
+@click.option(
+    '--export-gzip',
+    is_flag=True,
+    help='Compress the export files with gzip'
+)
+@click.option(
+    '--profile',
+    'profile_dir',
+    default=None,
+    help='Run a single cycle under cProfile and tracemalloc and write a \
+        report of each stage to this directory'
+)
+@click.option(
+    '--memory-budget',
+    default=None,
+    type=click.FloatRange(min=0, min_open=True),
+    help='Warn when the peak memory goes above this many MiB. With \
+        --profile, the run fails if a stage goes above it'
+)
+@click.option(
+    '--log-level',
+    default='WARNING',
+    show_default=True,
+    type=click.Choice(['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                      case_sensitive=False),
+    help='The lowest level of the messages logged'
+)
+@click.option(
+    '--syslog',
+    is_flag=True,
+    help='Log to the local syslog instead of stderr'
+)
+@click.option(
+    '--record',
+    default=None,
+    help='Save each raw API response, compressed, to this directory'
+)
+@click.option(
+    '--replay',
+    'replay_dir',
+    default=None,
+    help='Run the responses recorded in this directory through the checks \
+        without querying apollo or submitting to Nagios'
 )
 def main(
     station_map: str,
     apollo_address: str,
-    nagios_config: str
+    nagios_config: str,
+    batch_size: int,
+    timeout: float,
+    max_concurrency: int,
+    target_latency: float,
+    rate_limit: float,
+    hedge: bool,
+    hedge_budget: float,
+    hedge_state: str,
+    thresholds: str,
+    trend_state: str,
+    trend_window: int,
+    trend_alpha: float,
+    deadline: float,
+    lock_file: str,
+    nagios_objects: str,
+    nagios_objects_max_age: float,
+    hub_rollups: bool,
+    problems_only: bool,
+    problem_state: str,
+    skip_unchanged: bool,
+    changed_only: bool,
+    unchanged_max_age: int,
+    interval: float,
+    adaptive_polling: bool,
+    min_interval: float,
+    max_interval: float,
+    schedule_state: str,
+    metrics_port: int,
+    history: str,
+    history_retention: int,
+    history_downsample: int,
+    snapshot: str,
+    export_dir: str,
+    export_format: str,
+    export_rotate: str,
+    export_gzip: bool,
+    profile_dir: str,
+    memory_budget: float,
+    log_level: str,
+    syslog: bool,
+    record: str,
+    replay_dir: str
 ):
-    # Load station map and nagios config
-    nagios = load_nagios_config(nagios_config)
-    hubs = open_station_map(station_map)
+    if metrics_port is not None and interval is None:
+        raise click.UsageError('--metrics-port requires --interval')
+    if schedule_state is not None and not adaptive_polling:
+        raise click.UsageError('--schedule-state requires --adaptive-polling')
+    if problem_state is not None and not problems_only:
+        raise click.UsageError('--problem-state requires --problems-only')
+    if skip_unchanged and interval is None and replay_dir is None:
+        raise click.UsageError(
+            '--skip-unchanged requires --interval or --replay')
+    if changed_only and not skip_unchanged:
+        raise click.UsageError('--changed-only requires --skip-unchanged')
+    if hedge_state is not None and not hedge:
+        raise click.UsageError('--hedge-state requires --hedge')
+    if profile_dir is not None and (interval is not None
+                                    or replay_dir is not None):
+        raise click.UsageError(
+            '--profile runs a single cycle, it can\'t be used with '
+            + '--interval or --replay')
 
-    results = NagiosCheckResults()
+    # Records are written from a background thread until the command returns
+    listener = start_logging(getattr(logging, log_level.upper()), syslog)
+    click.get_current_context().call_on_close(listener.stop)
+
+    if lock_file is not None:
+        # Held until the command returns
+        try:
+            click.get_current_context().with_resource(run_lock(lock_file))
+        except AlreadyRunning as e:
+            raise click.ClickException(str(e))
+
+    profiler = None
+    if profile_dir is not None:
+        profiler = StageProfiler(profile_dir, memory_budget)
 
-    for hub in hubs.hubs:
-        # Get SOH data from the API for each hub
-        api_data = request_api(
-            apollo_address=apollo_address,
-            carina_id=hub.carina_id
+    # Load station map
+    with nullcontext() if profiler is None else profiler.stage('map load'):
+        hubs = open_station_map(station_map)
+
+    # Resolve the threshold profiles once for every station in the map
+    if thresholds is None:
+        threshold_table = ThresholdTable()
+    else:
+        threshold_table = load_threshold_profiles(thresholds, hubs)
+
+    rolling = None
+    if trend_state is not None:
+        rolling = load_rolling_statistics(
+            trend_state, window=trend_window, alpha=trend_alpha)
+        dropped = rolling.prune(hubs.stations)
+        if dropped:
+            logging.info(f'Dropped the trends of {dropped} stations no '
+                         + 'longer in the station map')
+
+    sinks = []
+    if metrics_port is not None:
+        # Only loaded when used, http.server is slow to import
+        from libra_metrics.prometheus import PrometheusExporter, \
+            start_metrics_server
+        exporter = PrometheusExporter()
+        start_metrics_server(exporter, metrics_port)
+        sinks.append(exporter)
+    # The other sinks are only loaded when used as well
+    if history is not None:
+        from libra_metrics.apollo_interface.history import HistoryStore
+        sinks.append(HistoryStore(
+            directory=history,
+            retention=history_retention,
+            downsample_after=history_downsample
+        ))
+    if snapshot is not None:
+        from libra_metrics.apollo_interface.snapshot import SnapshotWriter
+        sinks.append(SnapshotWriter(snapshot))
+    if export_dir is not None:
+        from libra_metrics.apollo_interface.export import StatsExporter
+        sinks.append(StatsExporter(
+            directory=export_dir,
+            format=export_format,
+            compress=export_gzip,
+            rotate=export_rotate
+        ))
+
+    problems = None
+    if problems_only:
+        problems = ProblemFilter()
+        if problem_state is not None:
+            problems.load(problem_state)
+
+    cache = None
+    if skip_unchanged:
+        cache = HubResultCache(
+            changed_only=changed_only,
+            max_age=unchanged_max_age
         )
 
-        # Extract station metrics from the API
-        stations = get_staion_statistics(
-            api_data=api_data,
-            hub=hub
+    if replay_dir is not None:
+        replay(replay_dir, hubs, threshold_table, rolling, sinks,
+               hub_rollups, problems, cache)
+        return
+
+    if apollo_address is None and any(
+            hub.apollo_address is None for hub in hubs.hubs):
+        raise click.UsageError(
+            '--apollo-address is required unless every hub of the station '
+            + 'map names its apollo_address')
+
+    nagios = load_nagios_targets(nagios_config)
+
+    objects = None
+    if nagios_objects is not None:
+        if nagios[0].xi_api_key is None:
+            raise click.UsageError(
+                '--nagios-objects requires an xi_api_key in the Nagios config')
+        objects = NagiosObjectCache(
+            api=NagiosAPI(
+                apikey=nagios[0].xi_api_key,
+                baseurl=nagios[0].xi_url,
+                timeout=nagios[0].timeout
+            ),
+            path=nagios_objects,
+            hubs=hubs,
+            max_age=nagios_objects_max_age
         )
 
-        # Generate nagios check results for each station attached to the hub
-        for station in stations.stations:
-            check_results = check_station(
-                stats=station
+    hedger = None
+    if hedge:
+        # Enough threads for the requests and the hedges of every server at
+        # once, so a request never waits for a thread
+        servers = {hub.apollo_address or apollo_address for hub in hubs.hubs}
+        hedger = Hedger(
+            budget=hedge_budget,
+            max_workers=len(servers) * max_concurrency * 2
+        )
+        if hedge_state is not None:
+            hedger.load(hedge_state)
+        click.get_current_context().call_on_close(hedger.close)
+
+    def new_collector(address: str) -> ApolloCollector:
+        # Every server gets its own connection pool and limits
+        limiter = None
+        if max_concurrency > 1:
+            limiter = AdaptiveLimiter(
+                initial=min(2, max_concurrency),
+                maximum=max_concurrency,
+                target_latency=target_latency
             )
-        results.extend(check_results)
+        return ApolloCollector(
+            apollo_address=address,
+            batch_size=batch_size,
+            timeout=timeout,
+            limiter=limiter,
+            rate_limit=None if rate_limit is None else get_rate_limit(
+                address, rate_limit),
+            hedger=hedger,
+            # Hedges are sent on top of the concurrency limit
+            session=new_session(max_concurrency * (2 if hedge else 1))
+        )
 
-    # Push the results to nagios using NRDP
-    try:
-        submit(
-            nrdp=results,
-            nagios=nagios.address,
-            token=nagios.api_key
+    collector = ApolloServers(
+        default_address=apollo_address,
+        new_collector=new_collector,
+        hedger=hedger
+    )
+    click.get_current_context().call_on_close(collector.close)
+
+    scheduler = None
+    if adaptive_polling:
+        scheduler = PollScheduler(
+            min_interval=min_interval,
+            max_interval=max_interval
         )
-    except HTTPError as e:
-        logging.error(f"Failed to submit check results: {e}")
+        if schedule_state is not None:
+            scheduler.load(schedule_state)
+
+    cycle = Cycle(
+        hubs=hubs,
+        collector=collector,
+        nagios=nagios,
+        thresholds=threshold_table,
+        rolling=rolling,
+        trend_state=trend_state,
+        record=record,
+        sinks=sinks,
+        scheduler=scheduler,
+        schedule_state=schedule_state,
+        rollups=hub_rollups,
+        problems=problems,
+        problem_state=problem_state,
+        deadline=deadline,
+        hedge_state=hedge_state,
+        profiler=profiler,
+        objects=objects,
+        cache=cache
+    )
+
+    if interval is None:
+        try:
+            run_cycle(cycle)
+        finally:
+            # The profile of a cycle that failed is written as well
+            if profiler is not None:
+                report = profiler.finish()
+                click.echo(f'Profile written to {report}')
+        if profiler is not None:
+            if profiler.over_budget():
+                raise click.ClickException(
+                    'A stage went above the memory budget of '
+                    + f'{memory_budget} MiB')
+        elif memory_budget is not None:
+            check_memory_budget(memory_budget)
+        return
+
+    within_budget = True
+    while True:
+        start = time.monotonic()
+        try:
+            run_cycle(cycle)
+        except Exception:
+            # Keep running, the next cycle may succeed
+            logging.exception('Collection cycle failed')
+        if memory_budget is not None and within_budget:
+            # Only warned once, the peak never goes down
+            within_budget = check_memory_budget(memory_budget)
+        delay = interval - (time.monotonic() - start)
+        if scheduler is not None:
+            # Wake up early if a hub is due before the next cycle
+            delay = min(delay, scheduler.next_poll(hubs.hubs) - time.time())
+        time.sleep(max(0.0, delay))
 
 
 if __name__ == '__main__':
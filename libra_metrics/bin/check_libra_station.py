@@ -0,0 +1,157 @@
+import sys
+from typing import Optional
+import click
+from libra_metrics.apollo_interface.soh_api import StationStats, \
+    get_slot_statistics, request_api
+from libra_metrics.apollo_interface.station_map import open_station_map
+from libra_metrics.nagios.libra_checks import check_station
+from libra_metrics.nagios.models import SEVERITY, NagiosOutputCode, \
+    NagiosPerformance, NagiosResult, NagiosVerbose
+from libra_metrics.nagios.nrdp import NagiosCheckResults
+from libra_metrics.nagios.thresholds import ThresholdTable, \
+    load_threshold_profiles
+
+
+def summarize_station(
+    stats: StationStats,
+    results: NagiosCheckResults
+) -> NagiosResult:
+    '''
+    Combine the check results of a station's services into a single plugin
+    result
+
+    Parameters
+    ----------
+    stats: StationStats
+        The statistics of the station
+
+    results: NagiosCheckResults
+        The check results of the station's services
+
+    Returns
+    -------
+    NagiosResult: The worst status of the services, with the statistics as
+    performance data and each service's output as details
+    '''
+    status = max(
+        (NagiosOutputCode(result['state']) for result in results),
+        key=SEVERITY.index)
+
+    receive_power = 'n/a' if stats.receive_strength is None \
+        else f'{stats.receive_strength}dBm'
+    summary = f'{status.name.upper()} - {stats.station_name}: ' \
+        + f'bytes={stats.total_bytes}, good bursts={stats.good_burst}, ' \
+        + f'receive power={receive_power}'
+
+    performances = [
+        NagiosPerformance(label='Bytes', value=stats.total_bytes, uom='c'),
+        NagiosPerformance(label='GoodBursts', value=stats.good_burst)
+    ]
+    if stats.receive_strength is not None:
+        performances.append(NagiosPerformance(
+            label='ReceivePower', value=stats.receive_strength, uom='dBm'))
+
+    return NagiosResult(
+        summary=summary,
+        verbose=NagiosVerbose.multiline,
+        status=status,
+        performances=performances,
+        details='\n'.join(
+            f"{result['servicename']}: {result['output'].split(' | ')[0]}"
+            for result in results)
+    )
+
+
+@click.command()
+@click.option(
+   '-m',
+   '--station-map',
+   required=True,
+   help='The station map json file containing information about which stations \
+       come through which TDMA slot at which Libra HUB'
+)
+@click.option(
+    '-a',
+    '--apollo-address',
+    default=None,
+    help='The hostname or IP address of the apollo server to query, including \
+        port number. Required unless the hub of the station names its \
+        apollo_address in the station map'
+)
+@click.option(
+    '-s',
+    '--station',
+    required=True,
+    help='The station to check'
+)
+@click.option(
+    '-t',
+    '--thresholds',
+    default=None,
+    help='Optional file containing warning and critical threshold profiles \
+        with defaults, per-hub and per-station overrides'
+)
+@click.option(
+    '--timeout',
+    default=10.0,
+    show_default=True,
+    type=float,
+    help='The number of seconds to wait for the apollo server'
+)
+def main(
+    station_map: str,
+    apollo_address: str,
+    station: str,
+    thresholds: Optional[str],
+    timeout: float
+):
+    '''
+    Check a single station with a single request to the apollo server and
+    report the result using the Nagios plugin output format
+    '''
+    hubs = open_station_map(station_map)
+
+    location = hubs.stations.get(station)
+    if location is None:
+        click.echo(f'UNKNOWN - {station} is not in the station map')
+        sys.exit(NagiosOutputCode.unknown)
+    if location.hub.apollo_address is not None:
+        apollo_address = location.hub.apollo_address
+    elif apollo_address is None:
+        click.echo(f'UNKNOWN - No apollo server for {location.hub.hub_id}, '
+                   + 'set --apollo-address')
+        sys.exit(NagiosOutputCode.unknown)
+
+    if thresholds is None:
+        threshold_table = ThresholdTable()
+    else:
+        threshold_table = load_threshold_profiles(thresholds, hubs)
+
+    # Only the hub carrying the station is requested
+    from requests.exceptions import RequestException
+    try:
+        api_data = request_api(
+            apollo_address=apollo_address,
+            carina_id=location.carina_id,
+            timeout=timeout
+        )
+    except (RequestException, KeyError, ValueError) as e:
+        click.echo(f'UNKNOWN - Failed to query apollo for '
+                   + f'{location.hub.hub_id}: {e}')
+        sys.exit(NagiosOutputCode.unknown)
+
+    stats = get_slot_statistics(
+        api_data=api_data,
+        hub=location.hub,
+        slot_id=location.slot_id
+    )
+    result = summarize_station(
+        stats=stats,
+        results=check_station(stats=stats, thresholds=threshold_table)
+    )
+    click.echo(str(result))
+    sys.exit(result.status)
+
+
+if __name__ == '__main__':
+    main()
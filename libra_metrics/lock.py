@@ -0,0 +1,52 @@
+'''
+Lock file preventing overlapping runs
+
+The lock is an advisory fcntl lock held on the file for as long as the run
+lasts. The kernel releases it when the process exits, even if it crashed, so
+a stale file never blocks the next run.
+'''
+import fcntl
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class AlreadyRunning(RuntimeError):
+    '''
+    Raised when another run holds the lock
+    '''
+
+
+@contextmanager
+def run_lock(
+    path: str
+) -> Iterator[None]:
+    '''
+    Hold the lock file for the duration of the context
+
+    The pid of the process holding the lock is written to the file.
+
+    Parameters
+    ----------
+    path: str
+        The path to the lock file, created if needed
+
+    Raises
+    ------
+    AlreadyRunning: Raised if another process holds the lock
+    '''
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            holder = os.read(fd, 32).decode(errors='replace').strip()
+            raise AlreadyRunning(
+                f'{path} is locked by another run'
+                + (f' (pid {holder})' if holder else ''))
+        os.ftruncate(fd, 0)
+        os.write(fd, f'{os.getpid()}\n'.encode())
+        yield
+    finally:
+        # Closing the file releases the lock
+        os.close(fd)
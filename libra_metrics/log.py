@@ -0,0 +1,59 @@
+'''
+Non-blocking logging
+
+The root logger only puts the records on a queue. A background thread takes
+them off the queue and writes them out, so a slow stderr or syslog never
+holds up a collection cycle.
+'''
+import logging
+from typing import Optional
+
+
+def start_logging(
+    level: int = logging.WARNING,
+    syslog: bool = False,
+    handler: Optional[logging.Handler] = None
+):
+    '''
+    Route the records of the root logger through a queue to a background
+    thread
+
+    Parameters
+    ----------
+    level: int
+        The level of the root logger
+
+    syslog: bool
+        Write the records to the local syslog instead of stderr
+
+    handler: logging.Handler
+        Write the records with this handler instead
+
+    Returns
+    -------
+    QueueListener: The listener writing the records, call stop() before
+    exiting to write the records still queued
+    '''
+    # Only loaded when used, logging.handlers is slow to import
+    import queue
+    from logging.handlers import QueueHandler, QueueListener, SysLogHandler
+
+    if handler is None:
+        if syslog:
+            handler = SysLogHandler(address='/dev/log')
+            handler.setFormatter(logging.Formatter(
+                'libra_metrics[%(process)d]: %(levelname)s %(message)s'))
+        else:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for previous in root.handlers[:]:
+        root.removeHandler(previous)
+    root.addHandler(QueueHandler(records))
+    root.setLevel(level)
+
+    listener = QueueListener(records, handler)
+    listener.start()
+    return listener
@@ -4,8 +4,6 @@
 import copy
 from typing import Optional, Union, Dict
 
-import requests
-
 # Constants
 STATE_OK = 0
 STATE_WARNING = 1
@@ -265,7 +263,8 @@ class NagiosAPI(object):
     def __init__(
         self,
         apikey: str,
-        baseurl: str = 'http://nagios-e1.seismo.nrcan.gc.ca/nagiosxi/api/v1/'
+        baseurl: str = 'http://nagios-e1.seismo.nrcan.gc.ca/nagiosxi/api/v1/',
+        timeout: Optional[float] = None
     ):
         """
         Build essential arguments to API calls
@@ -275,9 +274,11 @@ class NagiosAPI(object):
 
         Keywords;
         baseurl - Nagios XI base URL (up to version number)
+        timeout - seconds to wait for each call, forever if not set
         """
         self.baseurl = baseurl
         self.apikey = apikey
+        self.timeout = timeout
 
     def _get(
         self,
@@ -290,10 +291,13 @@ class NagiosAPI(object):
         Exception:
         Throws request.exceptions
         """
+        # requests is slow to import so only load it when it is used
+        import requests
+
         # add apikey to query
         params['apikey'] = self.apikey
         # query nagios xi
-        req = requests.get(url, params=params)
+        req = requests.get(url, params=params, timeout=self.timeout)
         # throw error if not 200
         req.raise_for_status()
         # return response
@@ -310,8 +314,12 @@ class NagiosAPI(object):
         Exception:
         Throws request.exceptions
         """
+        # requests is slow to import so only load it when it is used
+        import requests
+
         # query nagios xi
-        req = requests.post(url, params={'apikey': self.apikey}, data=params)
+        req = requests.post(url, params={'apikey': self.apikey}, data=params,
+                            timeout=self.timeout)
         # throw error if not 200
         req.raise_for_status()
         # return response
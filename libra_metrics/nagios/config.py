@@ -1,19 +1,77 @@
 from configparser import ConfigParser
 from dataclasses import dataclass
+from typing import List, Optional
+
+
+# Prefix of the sections of the Nagios servers the results are also sent to
+TARGET_PREFIX = 'nagios:'
 
 
 @dataclass
 class NagiosConfig:
     address: str
     api_key: str
+    # Name of the config section, used to report on the server
+    name: str
+    # Seconds to wait for each NRDP submission
+    timeout: Optional[float]
+    # Number of times a failed submission is tried again
+    retries: int
+    # Seconds the submission must be done in, retries included
+    total_timeout: Optional[float]
+    # Key and base URL of the Nagios XI API, to query the configured objects
+    xi_api_key: Optional[str]
+    xi_url: str
 
     def __init__(
         self,
         address: str,
-        api_key: str
+        api_key: str,
+        name: str = 'nagios',
+        timeout: Optional[float] = 30.0,
+        retries: int = 2,
+        total_timeout: Optional[float] = None,
+        xi_api_key: Optional[str] = None,
+        xi_url: Optional[str] = None
     ):
         self.address = address
         self.api_key = api_key
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.total_timeout = total_timeout
+        self.xi_api_key = xi_api_key
+        self.xi_url = f"{address}/nagiosxi/api/v1/" if xi_url is None \
+            else xi_url
+
+
+def _target_config(
+    parser: ConfigParser,
+    section: str
+) -> NagiosConfig:
+    '''
+    Populate a NagiosConfig object from a section of the config file
+
+    The total_timeout of the servers the results are also sent to defaults
+    to their timeout, the primary server is only bound by the cycle.
+    '''
+    try:
+        timeout = parser.getfloat(section, 'timeout', fallback=30.0)
+        return NagiosConfig(
+            address=parser[section]['address'],
+            api_key=parser[section]['api_key'],
+            name=section,
+            timeout=timeout,
+            retries=parser.getint(section, 'retries', fallback=2),
+            total_timeout=parser.getfloat(
+                section, 'total_timeout',
+                fallback=timeout if section.startswith(TARGET_PREFIX)
+                else None),
+            xi_api_key=parser[section].get('xi_api_key'),
+            xi_url=parser[section].get('xi_url')
+        )
+    except KeyError as e:
+        raise KeyError(f"Invalid nagios config file. Key missing: {e}")
 
 
 def load_nagios_config(
@@ -35,11 +93,36 @@ def load_nagios_config(
     parser = ConfigParser()
 
     parser.read(nagios_config)
-    try:
-        config = NagiosConfig(
-            address=parser['nagios']['address'],
-            api_key=parser['nagios']['address']
-        )
-    except KeyError as e:
-        raise KeyError(f"Invalid nagios config file. Key missing: {e}")
-    return config
+    return _target_config(parser, 'nagios')
+
+
+def load_nagios_targets(
+    nagios_config: str
+) -> List[NagiosConfig]:
+    '''
+    Loads every Nagios server of a config file
+
+    The [nagios] section is the primary server. Each [nagios:<name>] section
+    adds a server the results are also submitted to. Every section has an
+    address and an api_key, and optionally a timeout in seconds, a number
+    of retries, a total_timeout in seconds for the submission, retries
+    included, and the xi_api_key and xi_url of the Nagios XI API.
+
+    Parameters
+    ----------
+    nagios_config: str
+        The path to the nagios config file
+
+    Returns
+    -------
+    List[NagiosConfig]: The primary server followed by the other servers, in
+    the order of the file
+    '''
+    parser = ConfigParser()
+
+    parser.read(nagios_config)
+    sections = [section for section in parser.sections()
+                if section.startswith(TARGET_PREFIX)]
+    if parser.has_section('nagios') or not sections:
+        sections.insert(0, 'nagios')
+    return [_target_config(parser, section) for section in sections]
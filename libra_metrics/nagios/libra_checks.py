@@ -1,10 +1,205 @@
-from libra_metrics.apollo_interface.soh_api import StationStats
+import math
+from typing import Dict, Optional
+from libra_metrics.apollo_interface.rolling_stats import RollingStatistics, \
+    SlotTrend
+from libra_metrics.apollo_interface.soh_api import StationStatistics, \
+    StationStats, get_staion_statistics
+from libra_metrics.apollo_interface.station_map import LibraHub
 from libra_metrics.nagios.models import NagiosRange
 from libra_metrics.nagios.nrdp import NagiosCheckResults, NagiosCheckResult
+from libra_metrics.nagios.thresholds import ThresholdTable, METRIC_BYTES, \
+    METRIC_BURST, METRIC_BURST_TREND, METRIC_RECEIVE_POWER, \
+    METRIC_RECEIVE_POWER_TREND
+
+
+# Used when the caller does not provide threshold profiles
+DEFAULT_THRESHOLD_TABLE = ThresholdTable()
+
+# Services submitted for each station comms host
+SERVICE_BYTES = "Bytes Received at Hub"
+SERVICE_BURST = "Good Burst Percentage"
+SERVICE_RECEIVE_POWER = "Receive Power at Hub"
+STATION_SERVICES = (SERVICE_BYTES, SERVICE_BURST, SERVICE_RECEIVE_POWER)
+# Services added with rolling statistics
+SERVICE_BURST_TREND = "Good Burst Trend"
+SERVICE_RECEIVE_POWER_TREND = "Receive Power Trend"
+TREND_SERVICES = (SERVICE_BURST_TREND, SERVICE_RECEIVE_POWER_TREND)
+
+
+def check_hub(
+    api_data: Dict,
+    hub: LibraHub,
+    thresholds: Optional[ThresholdTable] = None,
+    rolling: Optional[RollingStatistics] = None
+) -> NagiosCheckResults:
+    '''
+    Assemble check results for every station attached to a hub
+
+    Parameters
+    ----------
+    api_data: Dict
+        The raw data returned by the API for the hub
+
+    hub: LibraHub
+        The hub the data was requested for
+
+    thresholds: ThresholdTable
+        The resolved threshold profiles, defaults are used if not set
+
+    rolling: RollingStatistics
+        If set, the statistics of each station are added to the rolling
+        statistics and trend results are included
+
+    Returns
+    -------
+    NagiosCheckResults:
+        List of NagiosCheckResult objects for each station and service
+    '''
+    stations = get_staion_statistics(
+        api_data=api_data,
+        hub=hub
+    )
+    return check_stations(
+        stations=stations,
+        thresholds=thresholds,
+        rolling=rolling
+    )
+
+
+def check_stations(
+    stations: StationStatistics,
+    thresholds: Optional[ThresholdTable] = None,
+    rolling: Optional[RollingStatistics] = None
+) -> NagiosCheckResults:
+    '''
+    Assemble check results for the statistics extracted for several stations
+
+    Parameters
+    ----------
+    stations: StationStatistics
+        The statistics of the stations
+
+    thresholds: ThresholdTable
+        The resolved threshold profiles, defaults are used if not set
+
+    rolling: RollingStatistics
+        If set, the statistics of each station are added to the rolling
+        statistics and trend results are included
+
+    Returns
+    -------
+    NagiosCheckResults:
+        List of NagiosCheckResult objects for each station and service
+    '''
+    results = NagiosCheckResults()
+    for station in stations.stations:
+        results.extend(check_station(
+            stats=station,
+            thresholds=thresholds
+        ))
+        if rolling is not None:
+            results.extend(check_station_trends(
+                station_name=station.station_name,
+                trends=rolling.update(station),
+                thresholds=thresholds
+            ))
+    return results
+
+
+def check_station_trends(
+    station_name: str,
+    trends: Dict[str, SlotTrend],
+    thresholds: Optional[ThresholdTable] = None
+) -> NagiosCheckResults:
+    '''
+    Assemble trend check results for a single station
+
+    Parameters
+    ----------
+    station_name: str
+        The name of the station
+
+    trends: Dict[str, SlotTrend]
+        The trends returned by RollingStatistics.update for the station
+
+    thresholds: ThresholdTable
+        The resolved threshold profiles, defaults are used if not set
+
+    Returns
+    -------
+    NagiosCheckResults:
+        List of NagiosCheckResult objects for each trend service
+    '''
+    if thresholds is None:
+        thresholds = DEFAULT_THRESHOLD_TABLE
+
+    results = NagiosCheckResults()
+    hostname = f"{station_name}-comms"
+
+    burst_threshold = thresholds.lookup(station_name, METRIC_BURST_TREND)
+    results.append(check_trend(
+        hostname=hostname,
+        service=SERVICE_BURST_TREND,
+        label="GoodBursts",
+        trend=trends['good_burst'],
+        threshold=burst_threshold.critical,
+        warning=burst_threshold.warning
+    ))
+    power_threshold = thresholds.lookup(
+        station_name, METRIC_RECEIVE_POWER_TREND)
+    results.append(check_trend(
+        hostname=hostname,
+        service=SERVICE_RECEIVE_POWER_TREND,
+        label="ReceivePower",
+        trend=trends['receive_strength'],
+        threshold=power_threshold.critical,
+        warning=power_threshold.warning
+    ))
+    return results
+
+
+def check_uncollected_hub(
+    hub: LibraHub,
+    reason: str = "Collection deadline exceeded",
+    trends: bool = False
+) -> NagiosCheckResults:
+    '''
+    Assemble UNKNOWN check results for every station of a hub whose
+    statistics could not be collected
+
+    Parameters
+    ----------
+    hub: LibraHub
+        The hub that was not collected
+
+    reason: str
+        Why the hub was not collected, used as the output of the results
+
+    trends: bool
+        Also report the trend services, checked with rolling statistics
+
+    Returns
+    -------
+    NagiosCheckResults:
+        List of NagiosCheckResult objects for each station and service
+    '''
+    services = STATION_SERVICES + TREND_SERVICES if trends \
+        else STATION_SERVICES
+    results = NagiosCheckResults()
+    for slot in hub.tdmaslots.values():
+        for service in services:
+            results.append(NagiosCheckResult(
+                hostname=f"{slot.station}-comms",
+                servicename=service,
+                state=3,
+                output=f"UNKNOWN - {reason}"
+            ))
+    return results
 
 
 def check_station(
     stats: StationStats,
+    thresholds: Optional[ThresholdTable] = None
 ) -> NagiosCheckResults:
     '''
     Assemble check results for a single station to be pushed to Nagios through
@@ -16,11 +211,17 @@ def check_station(
         Object containing the station's name and the statistics assembled from
         the API
 
+    thresholds: ThresholdTable
+        The resolved threshold profiles, defaults are used if not set
+
     Returns
     -------
     NagiosCheckResults:
         List of NagiosCheckResult objects for each service
     '''
+    if thresholds is None:
+        thresholds = DEFAULT_THRESHOLD_TABLE
+
     results = NagiosCheckResults()
 
     # Use the standard hostname for the station's comms as the target for the
@@ -28,25 +229,47 @@ def check_station(
     hostname = f"{stats.station_name}-comms"
 
     # Assemble each check result for each service
+    bytes_threshold = thresholds.lookup(stats.station_name, METRIC_BYTES)
     results.append(check_bytes(
         hostname=hostname,
-        total_bytes=stats.total_bytes
+        total_bytes=stats.total_bytes,
+        threshold=bytes_threshold.critical,
+        warning=bytes_threshold.warning
     ))
+    burst_threshold = thresholds.lookup(stats.station_name, METRIC_BURST)
     results.append(check_burst_percentage(
         hostname=hostname,
-        burst_percentage=stats.good_burst
+        burst_percentage=stats.good_burst,
+        threshold=burst_threshold.critical,
+        warning=burst_threshold.warning
     ))
+    power_threshold = thresholds.lookup(
+        stats.station_name, METRIC_RECEIVE_POWER)
     results.append(check_receive_power(
         hostname=hostname,
-        receive_power=stats.receive_strength
+        receive_power=stats.receive_strength,
+        threshold=power_threshold.critical,
+        warning=power_threshold.warning
     ))
     return results
 
 
+def _in_range(
+    value: float,
+    threshold: Optional[str]
+) -> bool:
+    '''
+    Check a value against an optional Nagios range, an unset range never
+    matches
+    '''
+    return threshold is not None and NagiosRange(threshold).in_range(value)
+
+
 def check_bytes(
     hostname: str,
     total_bytes: int,
-    threshold: str = '1:'
+    threshold: Optional[str] = '1:',
+    warning: Optional[str] = None
 ) -> NagiosCheckResult:
     '''
     Check if the total bytes is above a certain threshold and assemble a check
@@ -63,25 +286,31 @@ def check_bytes(
     threshold: str
         The critical threshold for this check in Nagios
 
+    warning: str
+        The warning threshold for this check in Nagios
+
     Returns
     -------
     NagiosCheckResult
     '''
     # Check if the value is in the critical range
-    if NagiosRange(threshold).in_range(total_bytes):
+    if _in_range(total_bytes, threshold):
         state = 2
         output = f"CRITICAL - {total_bytes}"
     # Value below 0 indicates that the metric was not found in the API
     elif total_bytes < 0:
         state = 3
         output = "UNKNOWN - No data returned from API"
+    elif _in_range(total_bytes, warning):
+        state = 1
+        output = f"WARNING - {total_bytes}"
     else:
         state = 0
         output = f"OK - {total_bytes}"
 
-    output += f" | Bytes={total_bytes}c;;{threshold};;"
+    output += f" | Bytes={total_bytes}c;{warning or ''};{threshold or ''};;"
 
-    service = "Bytes Received at Hub"
+    service = SERVICE_BYTES
 
     return NagiosCheckResult(
         hostname=hostname,
@@ -94,7 +323,8 @@ def check_bytes(
 def check_burst_percentage(
     hostname: str,
     burst_percentage: float,
-    threshold: str = '1:'
+    threshold: Optional[str] = '1:',
+    warning: Optional[str] = None
 ) -> NagiosCheckResult:
     '''
     Check if the percentage of good bursts is above a certain threshold and
@@ -111,25 +341,32 @@ def check_burst_percentage(
     threshold: str
         The critical threshold for this check in Nagios
 
+    warning: str
+        The warning threshold for this check in Nagios
+
     Returns
     -------
     NagiosCheckResult
     '''
     # Check if the value is in the critical range
-    if NagiosRange(threshold).in_range(burst_percentage):
+    if _in_range(burst_percentage, threshold):
         state = 2
         output = f"CRITICAL - {burst_percentage}"
     # Value below 0 indicates that the metric was not found in the API
     elif burst_percentage < 0:
         state = 3
         output = "UNKNOWN - No data returned from API"
+    elif _in_range(burst_percentage, warning):
+        state = 1
+        output = f"WARNING - {burst_percentage}"
     else:
         state = 0
         output = f"OK - {burst_percentage}"
 
-    output += f" | GoodBursts={burst_percentage}%;;{threshold};;"
+    output += f" | GoodBursts={burst_percentage}%;{warning or ''};\
+{threshold or ''};;"
 
-    service = "Good Burst Percentage"
+    service = SERVICE_BURST
 
     return NagiosCheckResult(
         hostname=hostname,
@@ -141,12 +378,13 @@ def check_burst_percentage(
 
 def check_receive_power(
     hostname: str,
-    receive_power: int,
-    threshold: str = '1:'
+    receive_power: Optional[int],
+    threshold: Optional[str] = '1:',
+    warning: Optional[str] = None
 ) -> NagiosCheckResult:
     '''
-    Check if the percentage of good bursts is above a certain threshold and
-    assemble a check result for Nagios
+    Check if the receive power is above a certain threshold and assemble a
+    check result for Nagios
 
     Parameters
     ----------
@@ -154,30 +392,105 @@ def check_receive_power(
         The hostname for the station comms as it appears in Nagios
 
     receive_power: int
-        The percentage of good bursts coming from the station
+        The receive power of the station's signal at the hub in dBm, None if
+        the metric was not returned by the API
 
     threshold: str
         The critical threshold for this check in Nagios
 
+    warning: str
+        The warning threshold for this check in Nagios
+
     Returns
     -------
     NagiosCheckResult
     '''
+    # Receive power can legitimately be negative so a missing value is
+    # flagged with None rather than -1
+    if receive_power is None:
+        state = 3
+        output = "UNKNOWN - No data returned from API"
     # Check if the value is in the critical range
-    if NagiosRange(threshold).in_range(receive_power):
+    elif _in_range(receive_power, threshold):
         state = 2
         output = f"CRITICAL - {receive_power}"
-    # Value below 0 indicates that the metric was not found in the API
-    elif receive_power < 0:
-        state = 3
-        output = "UNKNOWN - No data returned from API"
+    elif _in_range(receive_power, warning):
+        state = 1
+        output = f"WARNING - {receive_power}"
     else:
         state = 0
         output = f"OK - {receive_power}"
 
-    output += f" | ReceivePower={receive_power}dBm;;{threshold};;"
+    # Nagios uses U for a value that could not be determined
+    perf_value = 'U' if receive_power is None else f'{receive_power}dBm'
+    output += f" | ReceivePower={perf_value};{warning or ''};\
+{threshold or ''};;"
+
+    service = SERVICE_RECEIVE_POWER
+
+    return NagiosCheckResult(
+        hostname=hostname,
+        servicename=service,
+        state=state,
+        output=output
+    )
+
+
+def check_trend(
+    hostname: str,
+    service: str,
+    label: str,
+    trend: SlotTrend,
+    threshold: Optional[str] = None,
+    warning: Optional[str] = None
+) -> NagiosCheckResult:
+    '''
+    Check if the slope of a metric's rolling window is within a certain
+    threshold and assemble a check result for Nagios
+
+    Parameters
+    ----------
+    hostname: str
+        The hostname for the station comms as it appears in Nagios
+
+    service: str
+        The name of the service in Nagios
+
+    label: str
+        The prefix of the performance data labels
+
+    trend: SlotTrend
+        The rolling statistics of the metric
+
+    threshold: str
+        The critical threshold on the slope for this check in Nagios
+
+    warning: str
+        The warning threshold on the slope for this check in Nagios
+
+    Returns
+    -------
+    NagiosCheckResult
+    '''
+    # The slope needs at least two samples
+    if math.isnan(trend.slope):
+        state = 0
+        output = f"OK - Collecting samples ({trend.samples})"
+    elif _in_range(trend.slope, threshold):
+        state = 2
+        output = f"CRITICAL - slope {trend.slope:.4g} per sample"
+    elif _in_range(trend.slope, warning):
+        state = 1
+        output = f"WARNING - slope {trend.slope:.4g} per sample"
+    else:
+        state = 0
+        output = f"OK - slope {trend.slope:.4g} per sample"
 
-    service = "Receive Power at Hub"
+    if not math.isnan(trend.slope):
+        output += f" | {label}Slope={trend.slope:.6g};{warning or ''};\
+{threshold or ''};; {label}EWMA={trend.ewma:.6g};;;; \
+{label}Mean={trend.mean:.6g};;;; \
+{label}StdDev={math.sqrt(trend.variance):.6g};;;;"
 
     return NagiosCheckResult(
         hostname=hostname,
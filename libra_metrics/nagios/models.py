@@ -26,6 +26,15 @@ class NagiosOutputCode(IntEnum):
     unknown: int = 3
 
 
+# Order of the states from best to worst, to find the worst of several states
+SEVERITY = (
+    NagiosOutputCode.ok,
+    NagiosOutputCode.warning,
+    NagiosOutputCode.unknown,
+    NagiosOutputCode.critical
+)
+
+
 @dataclass
 class NagiosRange:
     range: str
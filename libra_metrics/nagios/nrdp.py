@@ -13,23 +13,70 @@ Use nrdp to query fdsn and get trace data into Nagios
 Author: Gloria Son 2017-11-24
 """
 
-import xml.etree.ElementTree as ET
-import requests
 import logging
+import sys
+import time
+from collections.abc import MutableMapping
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
 
+from libra_metrics.nagios.config import NagiosConfig
 
-class NagiosCheckResult(dict):
+
+# Keys of a check result, in the order they are serialized
+CHECK_RESULT_KEYS = ('hostname', 'servicename', 'state', 'output')
+
+
+class NagiosCheckResult(MutableMapping):
     """
-    Dictionary with keys hostname, servicename, state, output
+    Check result with keys hostname, servicename, state, output
 
     If the servicename is not set, it is assume to be a host check
+
+    The values are stored in slots rather than a dictionary to keep large
+    lists of results compact, with the hostname and servicename interned since
+    they repeat from one cycle to the next. Results can still be read and
+    updated like a dictionary, with get, setdefault, update and item
+    assignment, but the keys can't be removed.
+
+    A result is not a dict: isinstance(result, dict) is False and json.dumps
+    needs dict(result).
     """
+    __slots__ = CHECK_RESULT_KEYS
+
     def __init__(self, *args, **kwargs):
-        super(NagiosCheckResult, self).__init__(*args, **kwargs)
-        self.setdefault('hostname', '')
-        self.setdefault('servicename', '')
-        self.setdefault('state', 3)  # unknown
-        self.setdefault('output', '')
+        values = dict(*args, **kwargs)
+        for key in values:
+            if key not in CHECK_RESULT_KEYS:
+                raise KeyError(f'Invalid check result key {key}')
+        self.hostname = sys.intern(values.get('hostname', ''))
+        self.servicename = sys.intern(values.get('servicename', ''))
+        self.state = values.get('state', 3)  # unknown
+        self.output = values.get('output', '')
+
+    def __getitem__(self, key: str):
+        if key not in CHECK_RESULT_KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value):
+        if key not in CHECK_RESULT_KEYS:
+            raise KeyError(f'Invalid check result key {key}')
+        if key in ('hostname', 'servicename'):
+            value = sys.intern(value)
+        setattr(self, key, value)
+
+    def __delitem__(self, key: str):
+        raise TypeError('The keys of a check result can\'t be removed')
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(CHECK_RESULT_KEYS)
+
+    def __len__(self) -> int:
+        return len(CHECK_RESULT_KEYS)
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({dict(self)!r})'
 
 
 class NagiosCheckResults(list):
@@ -42,9 +89,15 @@ class NagiosCheckResults(list):
         """
         Convert list of check results to XML response (NRDP format)
         """
+        # Loaded on first use to keep the import of this module cheap
+        import xml.etree.ElementTree as ET
+
+        # Checked once, the debug output is costly to build for every result
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
         xml = ET.Element('checkresults')
         for result in self:
-            logging.debug(f"Trying: {result}")
+            if debug:
+                logging.debug(f"Trying: {result}")
             # define if the type of check result is host or service
             new = ET.SubElement(
                 xml,
@@ -71,16 +124,151 @@ def submit(
     :param str nagios: nagios URL
     :param str token: nagios access token
     """
+    submit_xml(nrdp.to_xml(), nagios, token, **kwargs)
+
+
+def submit_xml(
+    xml: bytes,
+    nagios: str,
+    token: str,
+    **kwargs
+) -> None:
+    """
+    Submit check results already serialized to the NRDP XML format
+
+    :param bytes xml: the check results as returned by to_xml
+    :param str nagios: nagios URL
+    :param str token: nagios access token
+    """
+    # Loaded on first use to keep the import of this module cheap
+    import requests
+
     data = {
         'token': token,
         'cmd': 'submitcheck',
-        'XMLDATA': nrdp.to_xml()
+        'XMLDATA': xml
     }
 
-    logging.debug(data)
+    # Only the results are dumped, the token stays out of the logs
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(xml.decode())
     request = requests.post(
         f"{nagios}/nrdp/",
         data=data, **kwargs)
 
     logging.debug(request.status_code)
     request.raise_for_status()
+
+
+@dataclass
+class SubmitReport:
+    """
+    Outcome of the submission of the results to one Nagios server
+    """
+    target: str
+    success: bool
+    attempts: int
+    # Seconds from the first attempt to the end of the last one
+    elapsed: float
+    error: Optional[str] = None
+
+
+def _submit_target(
+    xml: bytes,
+    target: NagiosConfig,
+    deadline: Optional[float]
+) -> SubmitReport:
+    """
+    Submit the results to a Nagios server, trying again after failures until
+    the deadline, on the time.monotonic clock, if there is one
+    """
+    from requests.exceptions import RequestException
+
+    start = time.monotonic()
+    error = None
+    for attempt in range(1, target.retries + 2):
+        if attempt > 1:
+            # Back off a little more after each failure
+            time.sleep(min(attempt - 1, 5))
+        timeout = target.timeout
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                attempt -= 1
+                error = error or 'Deadline exceeded'
+                break
+            timeout = remaining if timeout is None \
+                else min(timeout, remaining)
+        try:
+            submit_xml(xml, target.address, target.api_key, timeout=timeout)
+        except RequestException as e:
+            error = str(e)
+            logging.warning(f"Submission to {target.name} failed "
+                            + f"(attempt {attempt}): {e}")
+            # Rejected submissions, such as a bad token, would fail again
+            response = e.response
+            if response is not None and 400 <= response.status_code < 500:
+                break
+            continue
+        return SubmitReport(target=target.name, success=True,
+                            attempts=attempt,
+                            elapsed=time.monotonic() - start)
+    return SubmitReport(target=target.name, success=False, attempts=attempt,
+                        elapsed=time.monotonic() - start, error=error)
+
+
+def submit_all(
+    nrdp: NagiosCheckResults,
+    targets: List[NagiosConfig],
+    timeout: Optional[float] = None,
+    xml: Optional[bytes] = None
+) -> List[SubmitReport]:
+    """
+    Submit the check results to several Nagios servers at once
+
+    The results are serialized once. Each server is sent them from its own
+    thread with its own timeout and retries, so a slow server does not delay
+    the others. A server with a total_timeout must be done within it, so a
+    DR server that is down doesn't hold up the cycle for all its retries.
+
+    :type nrdp: :class:`NagiosCheckResults`
+    :param targets: the Nagios servers to submit to
+    :param float timeout: seconds every server must be done in, retries
+        included
+    :param bytes xml: the results already serialized by to_xml, if they were
+    :returns: the outcome of the submission to each server, in the order of
+        the targets
+    """
+    now = time.monotonic()
+
+    def target_deadline(target: NagiosConfig) -> Optional[float]:
+        deadlines = [now + seconds for seconds in (timeout,
+                                                   target.total_timeout)
+                     if seconds is not None]
+        return min(deadlines, default=None)
+
+    if xml is None:
+        xml = nrdp.to_xml()
+    if len(targets) == 1:
+        reports = [_submit_target(xml, targets[0],
+                                  target_deadline(targets[0]))]
+    else:
+        # Only loaded with several servers, to keep the entry point quick to
+        # start
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+            reports = list(pool.map(
+                lambda target: _submit_target(xml, target,
+                                              target_deadline(target)),
+                targets))
+
+    for report in reports:
+        if report.success:
+            logging.info(f"Submitted {len(nrdp)} results to {report.target} "
+                         + f"in {report.elapsed:.3f}s")
+        else:
+            logging.error(f"Failed to submit check results to {report.target} "
+                          + f"after {report.attempts} attempts: "
+                          + f"{report.error}")
+    return reports
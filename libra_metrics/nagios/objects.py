@@ -0,0 +1,297 @@
+'''
+Index of the hosts and services known to Nagios
+
+NRDP silently drops the results of hosts and services Nagios doesn't know.
+The index is loaded from the Nagios XI API, cached in a local file and
+refreshed on a slow schedule, so the results of unknown objects can be
+dropped before they are serialized and the stations missing from Nagios can
+be reported.
+'''
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from libra_metrics.apollo_interface.station_map import LibraHubs
+from libra_metrics.nagios import NagiosAPI, NagiosQuery
+from libra_metrics.nagios.nrdp import NagiosCheckResults
+
+
+# Suffix of the hosts of the station comms
+HOST_SUFFIX = '-comms'
+
+
+def _records(
+    response,
+    key: str
+) -> List[Dict]:
+    '''
+    Get the objects of a Nagios XI API response, which is either the list of
+    objects or a dictionary holding them under the object type
+    '''
+    if isinstance(response, list):
+        return response
+    records = response.get(key, [])
+    # A single object is not wrapped in a list
+    return [records] if isinstance(records, dict) else records
+
+
+class NagiosObjectIndex:
+    '''
+    The services of each known host, as interned strings in frozensets
+    '''
+    __slots__ = ('services', 'loaded')
+
+    def __init__(
+        self,
+        services: Dict[str, FrozenSet[str]],
+        loaded: float
+    ):
+        '''
+        Parameters
+        ----------
+        services: Dict[str, FrozenSet[str]]
+            The service names of each host name
+
+        loaded: float
+            Time the index was loaded from Nagios, in seconds since the epoch
+        '''
+        self.services = services
+        self.loaded = loaded
+
+    def known(
+        self,
+        hostname: str,
+        servicename: str = ''
+    ) -> bool:
+        '''
+        Determine if Nagios knows a host, or a service of a host
+
+        Only the station comms hosts are indexed, other hosts, such as the
+        hubs of the rollup services, are assumed to be known.
+        '''
+        if not hostname.endswith(HOST_SUFFIX):
+            return True
+        services = self.services.get(hostname)
+        if services is None:
+            return False
+        return not servicename or servicename in services
+
+    def filter(
+        self,
+        results: NagiosCheckResults
+    ) -> Tuple[NagiosCheckResults, int]:
+        '''
+        Drop the results of the hosts and services Nagios doesn't know
+
+        Parameters
+        ----------
+        results: NagiosCheckResults
+            The check results to filter
+
+        Returns
+        -------
+        Tuple[NagiosCheckResults, int]: The results that were kept and the
+        number of results that were dropped
+        '''
+        kept = NagiosCheckResults(
+            result for result in results
+            if self.known(result['hostname'], result['servicename']))
+        return kept, len(results) - len(kept)
+
+    def missing_stations(
+        self,
+        hubs: LibraHubs
+    ) -> List[str]:
+        '''
+        Get the stations of the station map without a host in Nagios
+
+        Parameters
+        ----------
+        hubs: LibraHubs
+            The station map
+
+        Returns
+        -------
+        List[str]: The station names, sorted
+        '''
+        return sorted(
+            station for station in hubs.stations
+            if f'{station}{HOST_SUFFIX}' not in self.services)
+
+    def save(
+        self,
+        path: str
+    ):
+        '''
+        Save the index to a cache file
+        '''
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({
+                'loaded': self.loaded,
+                'services': {host: sorted(services)
+                             for host, services in self.services.items()}
+            }, f)
+        os.replace(tmp, path)
+
+
+def _index(
+    services: Dict[str, List[str]],
+    loaded: float
+) -> NagiosObjectIndex:
+    return NagiosObjectIndex(
+        services={
+            sys.intern(host): frozenset(sys.intern(name) for name in names)
+            for host, names in services.items()
+        },
+        loaded=loaded
+    )
+
+
+def fetch_object_index(
+    api: NagiosAPI
+) -> NagiosObjectIndex:
+    '''
+    Load the station comms hosts and their services from Nagios XI
+
+    Parameters
+    ----------
+    api: NagiosAPI
+        The Nagios XI API to query
+
+    Returns
+    -------
+    NagiosObjectIndex
+
+    Raises
+    ------
+    RequestException: Raised if a query to the API fails
+    '''
+    query = NagiosQuery()
+    query.columns = {'host_name': f'lk:{HOST_SUFFIX}'}
+
+    services: Dict[str, List[str]] = {}
+    for host in _records(api.get_host(query), 'host'):
+        services.setdefault(host['host_name'], [])
+    for service in _records(api.get_service(query), 'service'):
+        services.setdefault(service['host_name'], []).append(
+            service['service_description'])
+    return _index(services, time.time())
+
+
+def load_cached_index(
+    path: str
+) -> Optional[NagiosObjectIndex]:
+    '''
+    Load an index saved to a cache file, None if there is none
+    '''
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        return _index(data['services'], data['loaded'])
+    except FileNotFoundError:
+        return None
+    except (KeyError, ValueError) as e:
+        logging.warning(f'Ignoring invalid Nagios object cache {path}: {e}')
+        return None
+
+
+class NagiosObjectCache:
+    '''
+    Keeps the index of Nagios objects fresh, refreshing it from Nagios XI
+    when it is older than max_age
+
+    After a refresh failed, Nagios XI is not queried again for retry_interval
+    seconds so an unreachable server doesn't hold up every cycle. The time
+    of the failure is kept as the modification time of a .failed file next
+    to the cache so it also holds between runs.
+    '''
+    def __init__(
+        self,
+        api: NagiosAPI,
+        path: str,
+        hubs: LibraHubs,
+        max_age: float = 86400,
+        retry_interval: float = 900
+    ):
+        '''
+        Parameters
+        ----------
+        api: NagiosAPI
+            The Nagios XI API the index is loaded from
+
+        path: str
+            The cache file
+
+        hubs: LibraHubs
+            The station map, its stations missing from Nagios are reported
+            each time the index is refreshed
+
+        max_age: float
+            The age, in seconds, after which the index is refreshed
+
+        retry_interval: float
+            The number of seconds to wait before trying again after a refresh
+            failed
+        '''
+        self.api = api
+        self.path = path
+        self.hubs = hubs
+        self.max_age = max_age
+        self.retry_interval = retry_interval
+        self._index = load_cached_index(path)
+        self._failed_path = f'{path}.failed'
+        # Time of the last refresh that failed
+        self._failed_at: Optional[float] = None
+        try:
+            self._failed_at = os.stat(self._failed_path).st_mtime
+        except FileNotFoundError:
+            pass
+        self._reported = False
+
+    def index(self) -> Optional[NagiosObjectIndex]:
+        '''
+        Get the index, refreshed if it is too old
+
+        Returns
+        -------
+        NagiosObjectIndex: The index, a stale one if Nagios XI couldn't be
+        reached, or None if no index was ever loaded
+        '''
+        now = time.time()
+        stale = self._index is None or now - self._index.loaded > self.max_age
+        retry = self._failed_at is None or \
+            now - self._failed_at >= self.retry_interval
+        if stale and retry:
+            from requests.exceptions import RequestException
+            try:
+                self._index = fetch_object_index(self.api)
+            except (RequestException, KeyError, ValueError) as e:
+                self._failed_at = now
+                with open(self._failed_path, 'w') as f:
+                    f.write(f'{e}\n')
+                logging.warning(
+                    'Failed to refresh the Nagios objects, '
+                    + ('keeping the cached ones' if self._index is not None
+                       else 'results are not filtered')
+                    + f', trying again in {self.retry_interval:.0f}s: {e}')
+            else:
+                if self._failed_at is not None:
+                    self._failed_at = None
+                    os.remove(self._failed_path)
+                self._index.save(self.path)
+                self._reported = False
+                logging.info(
+                    f'Loaded {len(self._index.services)} hosts from Nagios')
+
+        if self._index is not None and not self._reported:
+            missing = self._index.missing_stations(self.hubs)
+            if missing:
+                logging.warning(
+                    f'{len(missing)} stations of the station map have no '
+                    + f'Nagios host: {", ".join(missing)}')
+            self._reported = True
+        return self._index
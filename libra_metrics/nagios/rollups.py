@@ -0,0 +1,213 @@
+'''
+Per-hub rollup services
+
+Each station produces several passive check results per cycle. The rollups
+summarize the stations of a hub in a few services submitted for the hub, so
+the per-station services can be limited to the stations that are not OK.
+'''
+import json
+import logging
+from typing import Dict, Set, Tuple
+
+from libra_metrics.apollo_interface.soh_api import StationStatistics
+from libra_metrics.apollo_interface.station_map import LibraHub
+from libra_metrics.nagios.models import SEVERITY, NagiosOutputCode
+from libra_metrics.nagios.nrdp import NagiosCheckResult, NagiosCheckResults
+
+
+def _median(values: list) -> float:
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def station_states(
+    results: NagiosCheckResults
+) -> Dict[str, int]:
+    '''
+    Get the worst state of the services of each host in the results
+
+    Parameters
+    ----------
+    results: NagiosCheckResults
+        The check results of the stations
+
+    Returns
+    -------
+    Dict[str, int]: The worst state of each hostname
+    '''
+    states: Dict[str, int] = {}
+    for result in results:
+        state = result['state']
+        current = states.get(result['hostname'])
+        if current is None or SEVERITY.index(state) > SEVERITY.index(current):
+            states[result['hostname']] = state
+    return states
+
+
+def rollup_hub(
+    hub: LibraHub,
+    stations: StationStatistics,
+    results: NagiosCheckResults
+) -> NagiosCheckResults:
+    '''
+    Assemble the rollup services of a hub
+
+    The services are submitted for a host named after the hub id:
+
+    Station Status
+        The number of stations in a CRITICAL and UNKNOWN state, with the
+        state of the worst station
+    Hub Throughput
+        The total bytes received from the stations of the hub
+    Hub Receive Power
+        The minimum and median receive power of the stations of the hub
+
+    Parameters
+    ----------
+    hub: LibraHub
+        The hub the statistics were extracted for
+
+    stations: StationStatistics
+        The statistics of the stations of the hub
+
+    results: NagiosCheckResults
+        The check results of the stations of the hub
+
+    Returns
+    -------
+    NagiosCheckResults
+    '''
+    rollups = NagiosCheckResults()
+    total = len(stations.stations)
+
+    states = list(station_states(results).values())
+    critical = states.count(NagiosOutputCode.critical)
+    unknown = states.count(NagiosOutputCode.unknown)
+    warning = states.count(NagiosOutputCode.warning)
+    state = max(states, key=SEVERITY.index, default=NagiosOutputCode.ok)
+    output = f"{NagiosOutputCode(state).name.upper()} - {critical} critical, \
+{unknown} unknown, {warning} warning of {total} stations | \
+Critical={critical};;;0;{total} Unknown={unknown};;;0;{total} \
+Warning={warning};;;0;{total}"
+    rollups.append(NagiosCheckResult(
+        hostname=hub.hub_id,
+        servicename="Station Status",
+        state=int(state),
+        output=output
+    ))
+
+    # Missing values are flagged with -1
+    total_bytes = [stats.total_bytes for stats in stations.stations
+                   if stats.total_bytes >= 0]
+    if total_bytes:
+        state = 0
+        output = f"OK - {sum(total_bytes)} bytes from {len(total_bytes)} \
+stations | Bytes={sum(total_bytes)}c;;;;"
+    else:
+        state = 3
+        output = "UNKNOWN - No data returned from API | Bytes=U;;;;"
+    rollups.append(NagiosCheckResult(
+        hostname=hub.hub_id,
+        servicename="Hub Throughput",
+        state=state,
+        output=output
+    ))
+
+    # Missing values are flagged with None
+    powers = [stats.receive_strength for stats in stations.stations
+              if stats.receive_strength is not None]
+    if powers:
+        state = 0
+        output = f"OK - min {min(powers)}dBm, median {_median(powers)}dBm | \
+MinReceivePower={min(powers)}dBm;;;; \
+MedianReceivePower={_median(powers)}dBm;;;;"
+    else:
+        state = 3
+        output = "UNKNOWN - No data returned from API | MinReceivePower=U;;;; \
+MedianReceivePower=U;;;;"
+    rollups.append(NagiosCheckResult(
+        hostname=hub.hub_id,
+        servicename="Hub Receive Power",
+        state=state,
+        output=output
+    ))
+    return rollups
+
+
+class ProblemFilter:
+    '''
+    Keeps only the check results that are not OK
+
+    The first OK result of a service that was not OK when it was last checked
+    is kept as well, so Nagios sees the service recover.
+    '''
+    def __init__(self):
+        self.problems: Set[Tuple[str, str]] = set()
+
+    def filter(
+        self,
+        results: NagiosCheckResults
+    ) -> NagiosCheckResults:
+        '''
+        Get the results that are not OK or that just recovered
+
+        Parameters
+        ----------
+        results: NagiosCheckResults
+            The check results to filter
+
+        Returns
+        -------
+        NagiosCheckResults
+        '''
+        kept = NagiosCheckResults()
+        for result in results:
+            key = (result['hostname'], result['servicename'])
+            if result['state'] != NagiosOutputCode.ok:
+                self.problems.add(key)
+                kept.append(result)
+            elif key in self.problems:
+                self.problems.discard(key)
+                kept.append(result)
+        return kept
+
+    def save(
+        self,
+        path: str
+    ):
+        '''
+        Save the services that are not OK so they can be reloaded by the next
+        run
+
+        Parameters
+        ----------
+        path: str
+            The path to the state file
+        '''
+        with open(path, 'w') as f:
+            json.dump(sorted(self.problems), f)
+
+    def load(
+        self,
+        path: str
+    ):
+        '''
+        Load the services that were not OK in a previous run, if there was one
+
+        Parameters
+        ----------
+        path: str
+            The path to the state file
+        '''
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            logging.warning(f'Ignoring invalid problem state in {path}: {e}')
+            return
+        self.problems = {(hostname, service) for hostname, service in data}
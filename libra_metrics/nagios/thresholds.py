@@ -0,0 +1,196 @@
+'''
+Threshold profiles for the Libra station checks
+
+Profiles are read from an INI style file with an optional [defaults]
+section, [hub:<hub_id>] sections and [station:<station>] sections. Each
+section may define <metric>_warning and <metric>_critical keys using the
+Nagios range format, e.g.
+
+    [defaults]
+    bytes_critical = 1:
+
+    [hub:HUB01]
+    receive_power_warning = -85:
+    receive_power_critical = -95:
+
+    [station:STN01]
+    bytes_critical =
+
+An empty value disables the threshold. Inheritance (defaults, then hub, then
+station) is resolved once when the file is loaded so the checks only need a
+single dictionary lookup per station and metric.
+'''
+from configparser import ConfigParser
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from libra_metrics.apollo_interface.station_map import LibraHubs
+from libra_metrics.nagios.models import NagiosRange
+
+
+METRIC_BYTES = 'bytes'
+METRIC_BURST = 'burst'
+METRIC_RECEIVE_POWER = 'receive_power'
+# Thresholds on the slope, per sample, of the rolling statistics
+METRIC_BURST_TREND = 'burst_trend'
+METRIC_RECEIVE_POWER_TREND = 'receive_power_trend'
+
+METRICS = (METRIC_BYTES, METRIC_BURST, METRIC_RECEIVE_POWER,
+           METRIC_BURST_TREND, METRIC_RECEIVE_POWER_TREND)
+
+LEVELS = ('warning', 'critical')
+
+
+@dataclass(frozen=True)
+class Threshold:
+    warning: Optional[str] = None
+    critical: Optional[str] = None
+
+
+# Thresholds used when no profile file is given, matching the historical
+# hard-coded behaviour of the checks
+DEFAULT_THRESHOLDS: Dict[str, Threshold] = {
+    METRIC_BYTES: Threshold(critical='1:'),
+    METRIC_BURST: Threshold(critical='1:'),
+    METRIC_RECEIVE_POWER: Threshold(critical='1:'),
+    # Trends only alert once thresholds are configured
+    METRIC_BURST_TREND: Threshold(),
+    METRIC_RECEIVE_POWER_TREND: Threshold(),
+}
+
+
+class ThresholdTable:
+    '''
+    Flat lookup table of resolved thresholds indexed by (station, metric)
+
+    Stations that are not in the table use the default thresholds.
+    '''
+    def __init__(
+        self,
+        table: Optional[Dict[Tuple[str, str], Threshold]] = None,
+        defaults: Optional[Dict[str, Threshold]] = None
+    ):
+        self.table = {} if table is None else table
+        self.defaults = DEFAULT_THRESHOLDS if defaults is None else defaults
+
+    def lookup(
+        self,
+        station: str,
+        metric: str
+    ) -> Threshold:
+        '''
+        Get the threshold to apply to a metric of a station
+
+        Parameters
+        ----------
+        station: str
+            The station name as it appears in the station map
+
+        metric: str
+            One of the METRIC_* constants
+
+        Returns
+        -------
+        Threshold
+        '''
+        try:
+            return self.table[(station, metric)]
+        except KeyError:
+            return self.defaults[metric]
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+
+def _section_overrides(
+    parser: ConfigParser,
+    section: str
+) -> Dict[Tuple[str, str], Optional[str]]:
+    '''
+    Read the (metric, level) overrides defined in a section of the profile
+    file, validating each range as it is read
+
+    :raises ValueError: unknown key or invalid Nagios range
+    '''
+    overrides: Dict[Tuple[str, str], Optional[str]] = {}
+    if not parser.has_section(section):
+        return overrides
+
+    for key, value in parser.items(section, raw=True):
+        metric, _, level = key.rpartition('_')
+        if metric not in METRICS or level not in LEVELS:
+            raise ValueError(
+                f'Invalid threshold key {key} in section [{section}]')
+        value = value.strip()
+        if value:
+            # Parse the range once to fail at load rather than mid-cycle
+            NagiosRange(value).in_range(0)
+        overrides[(metric, level)] = value or None
+    return overrides
+
+
+def _apply_overrides(
+    base: Dict[str, Threshold],
+    overrides: Dict[Tuple[str, str], Optional[str]]
+) -> Dict[str, Threshold]:
+    '''
+    Return a copy of base with the overrides applied
+    '''
+    if not overrides:
+        return base
+    resolved = {}
+    for metric, threshold in base.items():
+        resolved[metric] = Threshold(
+            warning=overrides.get((metric, 'warning'), threshold.warning),
+            critical=overrides.get((metric, 'critical'), threshold.critical)
+        )
+    return resolved
+
+
+def load_threshold_profiles(
+    thresholds_file: str,
+    hubs: LibraHubs
+) -> ThresholdTable:
+    '''
+    Load threshold profiles and resolve them for every station of the map
+
+    Parameters
+    ----------
+    thresholds_file: str
+        The path to the threshold profile file
+
+    hubs: LibraHubs
+        The hubs loaded from the station map
+
+    Returns
+    -------
+    ThresholdTable: Table of resolved thresholds for each station and metric
+
+    Raises
+    ------
+    ValueError: Raised if the file contains an invalid key or range
+    '''
+    parser = ConfigParser()
+    if not parser.read(thresholds_file):
+        raise ValueError(f'Unable to read threshold file {thresholds_file}')
+
+    defaults = _apply_overrides(
+        DEFAULT_THRESHOLDS,
+        _section_overrides(parser, 'defaults'))
+
+    # Share identical Threshold objects so large maps stay compact
+    interned: Dict[Threshold, Threshold] = {}
+    table: Dict[Tuple[str, str], Threshold] = {}
+    for hub in hubs.hubs:
+        hub_thresholds = _apply_overrides(
+            defaults,
+            _section_overrides(parser, f'hub:{hub.hub_id}'))
+        for slot in hub.tdmaslots.values():
+            station_thresholds = _apply_overrides(
+                hub_thresholds,
+                _section_overrides(parser, f'station:{slot.station}'))
+            for metric, threshold in station_thresholds.items():
+                table[(slot.station, metric)] = interned.setdefault(
+                    threshold, threshold)
+
+    return ThresholdTable(table=table, defaults=defaults)
@@ -0,0 +1,199 @@
+'''
+Profiling of a collection cycle
+
+StageProfiler runs the cycle under cProfile and takes a tracemalloc snapshot
+around each stage of the cycle: loading the station map, requesting and
+decoding the API responses, extracting and checking the statistics and
+serializing the results. The report written at the end gives the time, the
+memory allocated and the peak memory of each stage, with the lines that
+allocated the most.
+'''
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+
+MIB = 1024 * 1024
+
+
+@dataclass
+class StageReport:
+    name: str
+    # Seconds the stage took
+    elapsed: float
+    # Bytes still allocated at the end of the stage minus at its start
+    allocated: int
+    # Highest number of bytes allocated during the stage
+    peak: int
+    # Lines that allocated the most during the stage
+    top: List[str] = field(default_factory=list)
+
+
+class StageProfiler:
+    '''
+    Profiles the stages of a cycle and checks them against a memory budget
+    '''
+    def __init__(
+        self,
+        directory: str,
+        memory_budget: Optional[float] = None,
+        top: int = 10
+    ):
+        '''
+        Parameters
+        ----------
+        directory: str
+            The directory the report is written to, created if needed
+
+        memory_budget: float
+            The peak memory, in MiB, no stage should go above
+
+        top: int
+            The number of allocating lines reported for each stage
+        '''
+        # Only loaded when profiling
+        import cProfile
+        import tracemalloc
+
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.memory_budget = memory_budget
+        self.top = top
+        self.stages: List[StageReport] = []
+        tracemalloc.start()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def _snapshot(self):
+        import tracemalloc
+
+        # Leave out the allocations of the profiling itself
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+
+    @contextmanager
+    def stage(
+        self,
+        name: str
+    ) -> Iterator[None]:
+        '''
+        Profile the code run within the context as a stage of the cycle
+
+        Parameters
+        ----------
+        name: str
+            The name of the stage in the report
+        '''
+        import tracemalloc
+
+        before = self._snapshot()
+        tracemalloc.reset_peak()
+        start_memory, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            memory, peak = tracemalloc.get_traced_memory()
+            differences = self._snapshot().compare_to(before, 'lineno')
+            self.stages.append(StageReport(
+                name=name,
+                elapsed=elapsed,
+                allocated=memory - start_memory,
+                peak=peak,
+                top=[str(difference)
+                     for difference in differences[:self.top]]
+            ))
+            if self.over_budget(peak):
+                logging.warning(
+                    f'{name} peaked at {peak / MIB:.1f} MiB, above the '
+                    + f'memory budget of {self.memory_budget:.1f} MiB')
+
+    def over_budget(
+        self,
+        peak: Optional[int] = None
+    ) -> bool:
+        '''
+        Determine if a peak, in bytes, or the peak of any stage if not set,
+        is above the memory budget
+        '''
+        if self.memory_budget is None:
+            return False
+        if peak is None:
+            peak = max((stage.peak for stage in self.stages), default=0)
+        return peak > self.memory_budget * MIB
+
+    def finish(self) -> Path:
+        '''
+        Stop profiling and write the report
+
+        The report is written to report.txt and the raw profile, which can be
+        loaded with pstats or snakeviz, to profile.pstats.
+
+        Returns
+        -------
+        Path: The path to the report
+        '''
+        import io
+        import pstats
+        import tracemalloc
+
+        self._profile.disable()
+        tracemalloc.stop()
+        self._profile.dump_stats(str(self.directory / 'profile.pstats'))
+
+        lines = [f'{"stage":<24}{"seconds":>10}{"allocated MiB":>16}'
+                 + f'{"peak MiB":>12}']
+        for stage in self.stages:
+            lines.append(f'{stage.name:<24}{stage.elapsed:>10.3f}'
+                         + f'{stage.allocated / MIB:>16.2f}'
+                         + f'{stage.peak / MIB:>12.2f}')
+        if self.memory_budget is not None:
+            lines.append(f'Memory budget: {self.memory_budget:.1f} MiB, '
+                         + ('exceeded' if self.over_budget() else 'met'))
+        for stage in self.stages:
+            lines.append('')
+            lines.append(f'Top allocations of {stage.name}:')
+            lines.extend(f'  {line}' for line in stage.top)
+
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats(40)
+        lines.append('')
+        lines.append(stream.getvalue())
+
+        report = self.directory / 'report.txt'
+        report.write_text('\n'.join(lines))
+        return report
+
+
+def check_memory_budget(
+    memory_budget: float
+) -> bool:
+    '''
+    Check the peak resident memory of the process against a budget
+
+    Parameters
+    ----------
+    memory_budget: float
+        The budget in MiB
+
+    Returns
+    -------
+    bool: True if the peak is within the budget
+    '''
+    import resource
+
+    # ru_maxrss is in KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    if peak <= memory_budget * MIB:
+        return True
+    logging.warning(
+        f'Peak memory of {peak / MIB:.1f} MiB is above the memory budget of '
+        + f'{memory_budget:.1f} MiB')
+    return False
@@ -0,0 +1,179 @@
+'''
+Prometheus text format exposition of the latest station statistics
+
+The exporter is fed the statistics collected by each cycle of the checks and
+renders the whole exposition payload once at the end of the cycle. Scrapes
+are served that pre-rendered payload so they never trigger a request to the
+apollo server.
+'''
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+from libra_metrics.apollo_interface.collector import HubResponse
+from libra_metrics.apollo_interface.soh_api import StationStatistics
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# name, help, StationStats attribute
+STATION_METRICS = (
+    ('libra_station_bytes',
+     'Total bytes received at the hub from the station',
+     'total_bytes'),
+    ('libra_station_good_burst_ratio',
+     'Ratio of good bursts to total bursts received from the station',
+     'good_burst'),
+    ('libra_station_receive_power_dbm',
+     'Receive power of the station at the hub in dBm',
+     'receive_strength'),
+)
+
+
+def _escape(value: str) -> str:
+    '''
+    Escape a label value for the Prometheus text format
+    '''
+    return value.replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+class PrometheusExporter:
+    '''
+    Holds the Prometheus exposition payload of the latest complete cycle
+
+    Hubs that were not polled during a cycle keep the statistics of the last
+    cycle they were polled in. The time of that cycle is exported for each
+    hub so scrapers can tell how old its statistics are.
+    '''
+    def __init__(self):
+        self.payload = b''
+        # The latest statistics of each hub and the time they were added
+        self._latest: Dict[
+            str, Tuple[HubResponse, StationStatistics, float]] = {}
+
+    def add(
+        self,
+        response: HubResponse,
+        stations: StationStatistics,
+        now: Optional[float] = None
+    ):
+        '''
+        Add the statistics of a hub to the cycle being collected
+
+        Parameters
+        ----------
+        response: HubResponse
+            The response of the apollo server for the hub
+
+        stations: StationStatistics
+            The statistics extracted from the response
+
+        now: float
+            The time the statistics were collected, defaults to the system
+            time
+        '''
+        self._latest[response.hub.hub_id] = (
+            response, stations, time.time() if now is None else now)
+
+    def abort_cycle(self):
+        '''
+        Keep serving the previous payload after a cycle failed part way, the
+        hubs added so far are served with the next cycle
+        '''
+
+    def end_cycle(self):
+        '''
+        Render the payload of the cycle and make it the one that is served
+        '''
+        lines = []
+        for name, description, attribute in STATION_METRICS:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} gauge')
+            for response, stations, _ in self._latest.values():
+                hub = _escape(response.hub.hub_id)
+                for stats in stations.stations:
+                    value = getattr(stats, attribute)
+                    # Missing values are flagged with None or -1
+                    if value is None or (attribute != 'receive_strength'
+                                         and value < 0):
+                        continue
+                    station = _escape(stats.station_name)
+                    lines.append(
+                        f'{name}{{hub="{hub}",station="{station}"}} {value}')
+
+        name = 'libra_hub_fetch_latency_seconds'
+        lines.append(f'# HELP {name} Time taken by apollo to return the '
+                     + 'statistics of the hub')
+        lines.append(f'# TYPE {name} gauge')
+        for response, _, _ in self._latest.values():
+            lines.append(f'{name}{{hub="{_escape(response.hub.hub_id)}"}} '
+                         + f'{response.latency:.6f}')
+
+        name = 'libra_hub_last_update_timestamp_seconds'
+        lines.append(f'# HELP {name} Time the statistics of the hub were '
+                     + 'last collected')
+        lines.append(f'# TYPE {name} gauge')
+        for response, _, updated in self._latest.values():
+            lines.append(f'{name}{{hub="{_escape(response.hub.hub_id)}"}} '
+                         + f'{updated:.3f}')
+
+        name = 'libra_last_cycle_timestamp_seconds'
+        lines.append(f'# HELP {name} Time the last cycle completed')
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {time.time():.3f}')
+
+        # Replacing the attribute is atomic so scrapes never see a partial
+        # payload
+        self.payload = ('\n'.join(lines) + '\n').encode()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        payload = self.server.exporter.payload
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logging.debug(f'{self.address_string()} {format % args}')
+
+
+def start_metrics_server(
+    exporter: PrometheusExporter,
+    port: int,
+    address: str = ''
+) -> ThreadingHTTPServer:
+    '''
+    Serve the exporter's payload on /metrics from a background thread
+
+    Parameters
+    ----------
+    exporter: PrometheusExporter
+        The exporter holding the payload to serve
+
+    port: int
+        The port to listen on
+
+    address: str
+        The address to listen on, all interfaces by default
+
+    Returns
+    -------
+    ThreadingHTTPServer: The running server, call shutdown() to stop it
+    '''
+    server = ThreadingHTTPServer((address, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.exporter = exporter
+    thread = threading.Thread(
+        target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    logging.info(f'Serving Prometheus metrics on port {port}')
+    return server
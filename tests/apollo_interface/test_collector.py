@@ -0,0 +1,152 @@
+from libra_metrics.apollo_interface import collector
+from libra_metrics.apollo_interface.station_map import open_station_map
+
+
+def fake_single(apollo_address, carina_id, timeout=None):
+    return {'source': 'single', 'carina_id': carina_id}
+
+
+def test_fetch_hubs_batched(monkeypatch):
+    calls = []
+
+    def fake_batch(apollo_address, carina_ids, timeout=None):
+        calls.append(carina_ids)
+        return {carina_id: {'carina_id': carina_id}
+                for carina_id in carina_ids}
+
+    monkeypatch.setattr(collector, 'request_api_batch', fake_batch)
+    monkeypatch.setattr(collector, 'request_api', fake_single)
+    hubs = open_station_map(station_map='./tests/data/station_map.json')
+
+    responses = list(collector.fetch_hubs('apollo:8080', hubs.hubs, 2))
+
+    assert calls == [['carina110_2635', 'carina110_2636']]
+    assert [response.hub.hub_id for response in responses] == \
+        ['HUB01', 'HUB02']
+    assert responses[1].data == {'carina_id': 'carina110_2636'}
+
+
+def test_fetch_hubs_batch_rejected(monkeypatch):
+    from requests import Response
+    from requests.exceptions import HTTPError
+
+    def fake_batch(apollo_address, carina_ids, timeout=None):
+        # This apollo doesn't know the batch URL
+        response = Response()
+        response.status_code = 404
+        raise HTTPError('404 Not Found', response=response)
+
+    monkeypatch.setattr(collector, 'request_api_batch', fake_batch)
+    monkeypatch.setattr(collector, 'request_api', fake_single)
+    hubs = open_station_map(station_map='./tests/data/station_map.json')
+
+    responses = list(collector.fetch_hubs('apollo:8080', hubs.hubs, 2))
+
+    assert [response.data['source'] for response in responses] == \
+        ['single', 'single']
+
+
+def test_fetch_hubs_batch_missing(monkeypatch):
+    def fake_batch(apollo_address, carina_ids, timeout=None):
+        # Apollo only answered for the first instrument
+        return {carina_ids[0]: {'source': 'batch'}}
+
+    monkeypatch.setattr(collector, 'request_api_batch', fake_batch)
+    monkeypatch.setattr(collector, 'request_api', fake_single)
+    hubs = open_station_map(station_map='./tests/data/station_map.json')
+    apollo = collector.ApolloCollector('apollo:8080', batch_size=2)
+
+    responses = list(apollo.fetch(hubs.hubs))
+
+    # Only the missing hub is requested on its own
+    assert [response.data['source'] for response in responses] == \
+        ['batch', 'single']
+    assert apollo.batching
+
+
+def test_fetch_deadline(monkeypatch):
+    import time
+    from requests.exceptions import ReadTimeout
+    from libra_metrics.apollo_interface.limiter import AdaptiveLimiter
+
+    def slow_single(apollo_address, carina_id, timeout=None):
+        if carina_id == 'carina110_2636':
+            # The request is cut short by the deadline
+            time.sleep(timeout)
+            raise ReadTimeout()
+        return {'carina_id': carina_id}
+
+    monkeypatch.setattr(collector, 'request_api', slow_single)
+    hubs = open_station_map(station_map='./tests/data/station_map.json')
+
+    for limiter in (None, AdaptiveLimiter(initial=2)):
+        apollo = collector.ApolloCollector('apollo:8080', limiter=limiter)
+        responses = list(apollo.fetch(
+            hubs.hubs, deadline=time.monotonic() + 0.2))
+        assert [response.hub.hub_id for response in responses] == ['HUB01']
+        assert [hub.hub_id for hub in apollo.expired] == ['HUB02']
+
+
+def test_fetch_deadline_while_waiting(monkeypatch):
+    import time
+    from requests.exceptions import ReadTimeout
+    from libra_metrics.apollo_interface.limiter import AdaptiveLimiter
+
+    calls = []
+
+    def slow_single(apollo_address, carina_id, timeout=None):
+        calls.append(carina_id)
+        # Holds the only slot until the deadline
+        time.sleep(timeout)
+        raise ReadTimeout()
+
+    monkeypatch.setattr(collector, 'request_api', slow_single)
+    hubs = open_station_map(station_map='./tests/data/station_map.json')
+    limiter = AdaptiveLimiter(initial=1, maximum=2)
+    apollo = collector.ApolloCollector('apollo:8080', limiter=limiter)
+
+    responses = list(apollo.fetch(hubs.hubs, deadline=time.monotonic() + 0.2))
+    time.sleep(0.05)
+
+    assert responses == []
+    assert sorted(hub.hub_id for hub in apollo.expired) == ['HUB01', 'HUB02']
+    # The hub that waited for the slot was never requested
+    assert len(calls) == 1
+    assert limiter.stats().in_flight == 0
+
+
+def test_fetch_hub_failed(monkeypatch):
+    from requests import Response
+    from requests.exceptions import HTTPError
+    from libra_metrics.apollo_interface.limiter import AdaptiveLimiter
+    from libra_metrics.apollo_interface.station_map import parse_map_data
+
+    def fake_batch(apollo_address, carina_ids, timeout=None):
+        return {carina_id: {'source': 'batch'} for carina_id in carina_ids
+                if carina_id != 'carina2'}
+
+    def not_found_single(apollo_address, carina_id, timeout=None):
+        if carina_id == 'carina2':
+            response = Response()
+            response.status_code = 404
+            raise HTTPError('404 Not Found', response=response)
+        return fake_single(apollo_address, carina_id)
+
+    monkeypatch.setattr(collector, 'request_api_batch', fake_batch)
+    monkeypatch.setattr(collector, 'request_api', not_found_single)
+    hubs = parse_map_data({
+        f'HUB0{i}': {'carina_id': f'carina{i}', 'tdma_slots': {}}
+        for i in range(1, 4)
+    }).hubs
+
+    for batch_size, limiter in ((3, None), (1, None),
+                                (1, AdaptiveLimiter(initial=2))):
+        apollo = collector.ApolloCollector(
+            'apollo:8080', batch_size=batch_size, limiter=limiter)
+        responses = list(apollo.fetch(hubs))
+        # Only the hub whose request failed is left out
+        assert sorted(response.hub.hub_id for response in responses) == \
+            ['HUB01', 'HUB03']
+        assert [hub.hub_id for hub in apollo.failed] == ['HUB02']
+        assert len(apollo.errors) == 1
+        assert apollo.expired == []
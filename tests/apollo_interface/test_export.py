@@ -0,0 +1,76 @@
+import csv
+import gzip
+import json
+
+from libra_metrics.apollo_interface.collector import HubResponse
+from libra_metrics.apollo_interface.export import StatsExporter
+from libra_metrics.apollo_interface.soh_api import StationStatistics, \
+    StationStats
+from libra_metrics.apollo_interface.station_map import open_station_map
+
+
+def export_cycles(exporter, cycles):
+    hub = open_station_map(
+        station_map='./tests/data/station_map.json'
+    ).hubs[0]
+    for _ in range(cycles):
+        exporter.add(
+            HubResponse(hub=hub, data={}, latency=0.1),
+            StationStatistics(stations=[
+                StationStats(station_name='STN01', total_bytes=100,
+                             good_burst=0.5, receive_strength=-80),
+                StationStats(station_name='STN02', total_bytes=-1,
+                             good_burst=-1, receive_strength=None),
+            ])
+        )
+        exporter.end_cycle()
+
+
+def test_export_ndjson_gzip(tmp_path):
+    export_cycles(StatsExporter(str(tmp_path), compress=True), 2)
+
+    path, = tmp_path.glob('stations-*.ndjson.gz')
+    with gzip.open(path, 'rt') as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 4
+    assert records[0]['slot'] == 'slot_1'
+    assert records[0]['receive_strength'] == -80
+    assert records[1]['total_bytes'] is None
+
+
+def test_export_csv(tmp_path):
+    export_cycles(StatsExporter(str(tmp_path), format='csv'), 2)
+
+    path, = tmp_path.glob('stations-*.csv')
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    # The header is only written once
+    assert len(rows) == 4
+    assert rows[1]['hub'] == 'HUB01'
+    assert rows[1]['slot'] == 'slot_2'
+    assert rows[1]['good_burst'] == ''
+
+
+def test_export_abort_cycle(tmp_path, monkeypatch):
+    from libra_metrics.apollo_interface import export
+
+    exporter = StatsExporter(str(tmp_path))
+    hub = open_station_map(
+        station_map='./tests/data/station_map.json'
+    ).hubs[0]
+    response = HubResponse(hub=hub, data={}, latency=0.1)
+    stations = StationStatistics(stations=[
+        StationStats(station_name='STN01', total_bytes=100,
+                     good_burst=0.5, receive_strength=-80)])
+
+    monkeypatch.setattr(export.time, 'time', lambda: 1000.0)
+    exporter.add(response, stations)
+    exporter.abort_cycle()
+    monkeypatch.setattr(export.time, 'time', lambda: 2000.0)
+    exporter.add(response, stations)
+    exporter.end_cycle()
+
+    path, = tmp_path.glob('stations-*.ndjson')
+    # The cycle after the failed one gets its own time
+    assert [json.loads(line)['timestamp'] for line in path.open()] == \
+        [1000.0, 2000.0]
@@ -0,0 +1,45 @@
+from libra_metrics.apollo_interface.collector import HubResponse
+from libra_metrics.apollo_interface.fingerprint import HubResultCache
+from libra_metrics.apollo_interface.soh_api import get_staion_statistics
+from libra_metrics.apollo_interface.station_map import open_station_map
+from libra_metrics.nagios.libra_checks import check_stations
+from libra_metrics.nagios.nrdp import NagiosCheckResults
+from libra_metrics.nagios.thresholds import load_threshold_profiles
+
+
+def test_hub_result_cache(hub_data):
+    hubs = open_station_map(station_map='./tests/data/station_map.json')
+    thresholds = load_threshold_profiles('./tests/data/thresholds.ini', hubs)
+    hub = hubs.hubs[0]
+    cache = HubResultCache(max_age=2)
+
+    def cycle(total_bytes):
+        response = HubResponse(hub=hub, data=hub_data(total_bytes),
+                               latency=0.1)
+        cached = cache.get(response)
+        if cached is None:
+            stations = get_staion_statistics(api_data=response.data, hub=hub)
+            results = check_stations(stations=stations, thresholds=thresholds)
+            cache.put(response, stations, results, NagiosCheckResults())
+        counters = (cache.recomputed, cache.reused, cache.skipped)
+        cache.end_cycle()
+        return cached, counters
+
+    assert cycle('100') == (None, (1, 0, 0))
+    # Unchanged responses reuse the results until they are max_age cycles old
+    first, counters = cycle('100')
+    assert counters == (0, 1, 0)
+    assert first.age == 1
+    assert len(first.results) > 0
+    cached, counters = cycle('100')
+    assert cached is first and first.age == 2
+    assert cycle('100') == (None, (1, 0, 0))
+    # A changed response is recomputed
+    assert cycle('100')[1] == (0, 1, 0)
+    assert cycle('200') == (None, (1, 0, 0))
+
+    cache = HubResultCache(changed_only=True)
+    assert cycle('100') == (None, (1, 0, 0))
+    cached, counters = cycle('100')
+    assert cached is not None
+    assert counters == (0, 0, 1)
@@ -0,0 +1,89 @@
+import threading
+import time
+
+from libra_metrics.apollo_interface.hedging import Hedger
+from libra_metrics.apollo_interface.limiter import AdaptiveLimiter
+
+
+def test_hedger():
+    hedger = Hedger(budget=0.2, min_samples=3)
+    calls = []
+    lock = threading.Lock()
+
+    def request(delay):
+        with lock:
+            calls.append(delay)
+            first = len(calls) == 1
+        # Only the first request of the hedged call is slow
+        time.sleep(0.5 if first else 0.01)
+        return 'data'
+
+    # Not hedged until the hub has enough latencies
+    for _ in range(3):
+        assert hedger.call('HUB01', lambda: 'data') == 'data'
+    assert hedger.p95('HUB01') is not None
+
+    start = time.monotonic()
+    assert hedger.call('HUB01', request, delay=None) == 'data'
+    assert time.monotonic() - start < 0.25
+    assert len(calls) == 2
+    assert (hedger.stats.hedged, hedger.stats.won) == (1, 1)
+
+    # The budget allows a hedge every five requests
+    calls.clear()
+    hedger.call('HUB01', request, delay=None)
+    assert hedger.stats.skipped == 1
+    hedger.close()
+
+
+def test_hedger_limiter():
+    hedger = Hedger(budget=1.0, min_samples=1)
+    calls = []
+
+    def request():
+        calls.append(None)
+        # The first request of each call is slower than the p95 of 0.05s
+        time.sleep(0.3 if len(calls) % 2 else 0.01)
+        return 'data'
+
+    hedger.call('HUB01', lambda: time.sleep(0.05) or 'data')
+
+    # The caller holds the only slot, so the hedge can't be sent
+    limiter = AdaptiveLimiter(initial=1, maximum=1)
+    ticket = limiter.acquire()
+    assert hedger.call('HUB01', request, limiter=limiter) == 'data'
+    limiter.release(0.3, ticket=ticket)
+    assert (hedger.stats.hedged, hedger.stats.skipped) == (0, 1)
+    assert limiter.stats().in_flight == 0
+
+    # With a free slot the hedge takes it and gives it back once done
+    calls.clear()
+    # Only the latest latency is kept
+    hedger = Hedger(budget=1.0, window=1, min_samples=1)
+    hedger.call('HUB01', lambda: time.sleep(0.05) or 'data')
+    limiter = AdaptiveLimiter(initial=2, maximum=2, target_latency=10)
+    ticket = limiter.acquire()
+    assert hedger.call('HUB01', request, limiter=limiter) == 'data'
+    limiter.release(0.1, ticket=ticket)
+    assert (hedger.stats.hedged, hedger.stats.won) == (1, 1)
+    # Released by the hedge's thread once it completes
+    time.sleep(0.05)
+    assert limiter.stats().in_flight == 0
+    # The latency runs from the first request, not from the hedge
+    assert hedger.p95('HUB01') >= 0.05
+    hedger.close()
+
+
+def test_hedger_queued():
+    hedger = Hedger(min_samples=1, max_workers=1)
+    busy = threading.Thread(
+        target=hedger.call, args=('HUB01', lambda: time.sleep(0.2)))
+    busy.start()
+    time.sleep(0.02)
+
+    # The time waiting for the only thread isn't counted as latency
+    hedger.call('HUB02', lambda: 'data')
+    busy.join()
+    assert hedger.p95('HUB02') < 0.1
+    assert hedger.p95('HUB01') >= 0.2
+    hedger.close()
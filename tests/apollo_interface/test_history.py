@@ -0,0 +1,79 @@
+import math
+import time
+
+from libra_metrics.apollo_interface.collector import HubResponse
+from libra_metrics.apollo_interface.history import HistoryStore
+from libra_metrics.apollo_interface.soh_api import StationStatistics, \
+    StationStats
+from libra_metrics.apollo_interface.station_map import open_station_map
+
+
+DAY = 86400
+# Midnight UTC yesterday, so writing the cycles doesn't expire them
+START = (time.time() // DAY - 1) * DAY
+
+
+def add_cycle(store, hub, timestamp, total_bytes, receive_power):
+    store.add(
+        HubResponse(hub=hub, data={}, latency=0.1),
+        StationStatistics(stations=[
+            StationStats('STN01', total_bytes, 0.5, receive_power),
+            StationStats('STN02', -1, -1, None)
+        ]),
+        now=timestamp
+    )
+    store.end_cycle()
+
+
+def test_history_query_and_downsample(tmp_path):
+    hub = open_station_map('./tests/data/station_map.json').hubs[0]
+    store = HistoryStore(str(tmp_path), retention=10, downsample_after=2)
+    for minute in range(4):
+        add_cycle(store, hub, START + minute * 60, 100 * minute, -80)
+    add_cycle(store, hub, START + DAY, 1000, -90)
+
+    # A reopened store reads the same history
+    store = HistoryStore(str(tmp_path), retention=10, downsample_after=2)
+    records = list(store.query('STN01', START + 60, START + 180))
+    assert [record.total_bytes for record in records] == [100, 200, 300]
+    missing = list(store.query('STN02', START, START + DAY))
+    assert len(missing) == 5
+    assert math.isnan(missing[0].good_burst)
+
+    # The first day is downsampled to a single hourly average
+    store.maintain(now=START + 3 * DAY)
+    records = list(store.query('STN01', START, START + DAY))
+    assert [record.total_bytes for record in records] == [150, 1000]
+
+    # and deleted once past the retention
+    store.maintain(now=START + 11 * DAY)
+    records = list(store.query('STN01', START, START + DAY))
+    assert [record.total_bytes for record in records] == [1000]
+
+
+def test_history_stations_saved_per_cycle(tmp_path):
+    hub = open_station_map('./tests/data/station_map.json').hubs[0]
+    store = HistoryStore(str(tmp_path))
+    store.add(
+        HubResponse(hub=hub, data={}, latency=0.1),
+        StationStatistics(stations=[StationStats('STN01', 100, 0.5, -80)])
+    )
+    # New stations are only written out with the records of the cycle
+    assert not (tmp_path / 'stations.json').exists()
+    store.end_cycle()
+    assert (tmp_path / 'stations.json').read_text() == '["STN01"]'
+
+
+def test_history_torn_write(tmp_path):
+    hub = open_station_map('./tests/data/station_map.json').hubs[0]
+    store = HistoryStore(str(tmp_path))
+    add_cycle(store, hub, START, 100, -80)
+    # A write cut short, by a full disk for instance
+    day = time.strftime('%Y%m%d', time.gmtime(START))
+    for suffix in ('.seg', '.idx'):
+        with open(tmp_path / f'{day}{suffix}', 'ab') as f:
+            f.write(b'torn')
+    add_cycle(store, hub, START + 60, 200, -80)
+
+    records = list(store.query('STN01', START, START + 60))
+    assert [record.total_bytes for record in records] == [100, 200]
@@ -0,0 +1,25 @@
+from libra_metrics.apollo_interface.limiter import AdaptiveLimiter
+
+
+def test_adaptive_limiter_aimd():
+    limiter = AdaptiveLimiter(initial=2, maximum=4, target_latency=1.0)
+
+    # Fast requests slowly raise the limit up to the maximum
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release(latency=0.1)
+    assert limiter.stats().concurrency == 4
+
+    # A slow burst of requests sent together halves it once
+    tickets = [limiter.acquire() for _ in range(4)]
+    for ticket in tickets:
+        limiter.release(latency=5.0, ticket=ticket)
+    assert limiter.stats().concurrency == 2
+    # A failure sent after the cut halves it again
+    ticket = limiter.acquire()
+    limiter.release(latency=0.1, failed=True, ticket=ticket)
+    assert limiter.stats().concurrency == 1
+
+    stats = limiter.stats()
+    assert stats.in_flight == 0
+    assert stats.queue_depth == 0
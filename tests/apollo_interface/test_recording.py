@@ -0,0 +1,22 @@
+from datetime import datetime, timezone
+
+from libra_metrics.apollo_interface.collector import HubResponse
+from libra_metrics.apollo_interface.recording import list_recorded_cycles, \
+    record_responses, replay_cycle
+from libra_metrics.apollo_interface.station_map import open_station_map
+
+
+def test_record_and_replay(tmp_path):
+    hubs = open_station_map(station_map='./tests/data/station_map.json')
+    responses = [
+        HubResponse(hub=hub, data={'carina_id': hub.carina_id}, latency=0.5)
+        for hub in hubs.hubs
+    ]
+    cycle = datetime(2022, 10, 4, 12, tzinfo=timezone.utc)
+
+    recorded = list(record_responses(str(tmp_path), iter(responses), cycle))
+    assert recorded == responses
+
+    cycles = list_recorded_cycles(str(tmp_path))
+    assert [path.name for path in cycles] == ['20221004T120000Z']
+    assert list(replay_cycle(cycles[0], hubs)) == responses
@@ -0,0 +1,60 @@
+import math
+import statistics
+
+from libra_metrics.apollo_interface.rolling_stats import \
+    RESYNC_INTERVAL, TREND_METRICS, load_rolling_statistics
+from libra_metrics.apollo_interface.soh_api import StationStats
+
+
+def test_rolling_statistics(tmp_path):
+    path = str(tmp_path / 'trends.bin')
+    powers = [-70, -71, -73, -72, -76, -78, -77, -80]
+    window = 4
+
+    for power in powers:
+        # Reload the state each time like successive runs of the checks
+        rolling = load_rolling_statistics(path, window=window, alpha=0.5)
+        trends = rolling.update(StationStats(
+            station_name='STN01',
+            total_bytes=100,
+            good_burst=-1,
+            receive_strength=power
+        ))
+        rolling.save(path)
+
+    trend = trends['receive_strength']
+    last = powers[-window:]
+    assert trend.samples == window
+    assert math.isclose(trend.mean, statistics.mean(last))
+    assert math.isclose(trend.variance, statistics.pvariance(last))
+    assert math.isclose(
+        trend.slope, statistics.linear_regression(range(window), last).slope)
+
+    # Missing good burst values are never added
+    assert trends['good_burst'].samples == 0
+
+
+def test_rolling_statistics_resync_and_prune():
+    rolling = load_rolling_statistics('missing', window=5, alpha=0.5)
+    powers = [1e9 + (i % 7) * 0.1 for i in range(RESYNC_INTERVAL + 3)]
+    for power in powers:
+        for station in ('STN01', 'STN02'):
+            trends = rolling.update(StationStats(
+                station_name=station,
+                total_bytes=100,
+                good_burst=0.5,
+                receive_strength=power
+            ))
+
+    # Recomputed from the window, then updated incrementally again
+    trend = trends['receive_strength']
+    assert math.isclose(trend.mean, statistics.mean(powers[-5:]))
+    assert math.isclose(trend.slope, statistics.linear_regression(
+        range(5), powers[-5:]).slope, abs_tol=1e-6)
+
+    assert rolling.prune({'STN02'}) == 1
+    assert list(rolling.rows) == ['STN02']
+    assert len(rolling.counts) == len(TREND_METRICS)
+    pruned = rolling.update(StationStats('STN02', 100, 0.5, powers[0]))
+    assert pruned['receive_strength'].samples == 5
+    assert pruned['good_burst'].samples == 5
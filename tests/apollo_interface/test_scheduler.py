@@ -0,0 +1,49 @@
+from libra_metrics.apollo_interface.scheduler import PollScheduler
+from libra_metrics.apollo_interface.station_map import open_station_map
+
+
+def test_poll_scheduler(tmp_path):
+    hubs = open_station_map(
+        station_map='./tests/data/station_map.json'
+    ).hubs
+    hub1, hub2 = hubs
+    scheduler = PollScheduler(min_interval=60, max_interval=240)
+
+    # Every hub is due until it was polled once
+    assert scheduler.due(hubs, now=0) == hubs
+    scheduler.record(hub1, latency=1.0, healthy=True, now=0)
+    scheduler.record(hub2, latency=3.0, healthy=False, now=0)
+    assert scheduler.due(hubs, now=30) == []
+    assert scheduler.next_poll(hubs) == 60
+
+    # The slowest hub comes first, stable hubs back off up to the maximum
+    assert scheduler.due(hubs, now=60) == [hub2, hub1]
+    for now in (60, 180, 420):
+        scheduler.record(hub1, latency=1.0, healthy=True, now=now)
+    assert scheduler.hubs[hub1.hub_id].interval == 240
+    scheduler.record(hub1, latency=1.0, healthy=False, now=660)
+    assert scheduler.hubs[hub1.hub_id].interval == 60
+
+    # The schedule survives a restart
+    path = tmp_path / 'schedule.json'
+    scheduler.save(path)
+    restored = PollScheduler()
+    restored.load(path)
+    assert restored.hubs == scheduler.hubs
+
+
+def test_poll_scheduler_rollback():
+    hubs = open_station_map(
+        station_map='./tests/data/station_map.json'
+    ).hubs
+    scheduler = PollScheduler(min_interval=60, max_interval=240)
+    scheduler.record(hubs[0], latency=1.0, healthy=True, now=0)
+
+    checkpoint = scheduler.checkpoint()
+    for hub in hubs:
+        scheduler.record(hub, latency=1.0, healthy=True, now=60)
+    assert scheduler.due(hubs, now=60) == []
+    # The polls recorded since the checkpoint are due again
+    scheduler.rollback(checkpoint)
+    assert scheduler.due(hubs, now=60) == [hubs[1], hubs[0]]
+    assert scheduler.hubs[hubs[0].hub_id].interval == 60
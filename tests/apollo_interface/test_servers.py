@@ -0,0 +1,129 @@
+import threading
+
+from requests import Response
+from requests.exceptions import ConnectionError, HTTPError
+
+from libra_metrics.apollo_interface import collector
+from libra_metrics.apollo_interface.servers import ApolloServers
+from libra_metrics.apollo_interface.soh_api import new_session
+from libra_metrics.apollo_interface.station_map import parse_map_data
+
+
+def test_fetch_servers(monkeypatch):
+    down = {'apollo-b:8080'}
+
+    def fake_single(apollo_address, carina_id, timeout=None):
+        if apollo_address in down:
+            raise ConnectionError(f'{apollo_address} is down')
+        return {'apollo': apollo_address}
+
+    monkeypatch.setattr(collector, 'request_api', fake_single)
+    hubs = parse_map_data({
+        'HUB01': {'carina_id': 'carina1', 'tdma_slots': {}},
+        'HUB02': {'carina_id': 'carina2', 'apollo_address': 'apollo-b:8080',
+                  'tdma_slots': {}},
+        'HUB03': {'carina_id': 'carina3', 'tdma_slots': {}},
+    }).hubs
+    servers = ApolloServers(
+        default_address='apollo-a:8080',
+        new_collector=collector.ApolloCollector
+    )
+
+    # The outage of one server doesn't affect the hubs of the other
+    responses = list(servers.fetch(hubs))
+    assert sorted(response.hub.hub_id for response in responses) == \
+        ['HUB01', 'HUB03']
+    assert responses[0].data == {'apollo': 'apollo-a:8080'}
+    assert [hub.hub_id for hub in servers.failed] == ['HUB02']
+    assert servers.health['apollo-b:8080'].failures == 1
+    assert set(servers.collectors) == {'apollo-a:8080', 'apollo-b:8080'}
+
+    # The failed server is skipped until its backoff ends
+    down.clear()
+    list(servers.fetch(hubs))
+    assert [hub.hub_id for hub in servers.failed] == ['HUB02']
+    servers.health['apollo-b:8080'].down_until = 0
+    responses = list(servers.fetch(hubs))
+    assert len(responses) == 3
+    assert servers.failed == []
+    assert servers.health['apollo-b:8080'].failures == 0
+
+
+def http_error(status_code):
+    response = Response()
+    response.status_code = status_code
+    return HTTPError(f'{status_code} Error', response=response)
+
+
+def test_fetch_hub_errors(monkeypatch):
+    sessions = []
+    errors = {'carina2': http_error(404)}
+
+    def fake_single(apollo_address, carina_id, timeout=None, session=None):
+        sessions.append(session)
+        if carina_id in errors:
+            raise errors[carina_id]
+        return {'carina_id': carina_id}
+
+    monkeypatch.setattr(collector, 'request_api', fake_single)
+    hubs = parse_map_data({
+        'HUB01': {'carina_id': 'carina1', 'tdma_slots': {}},
+        'HUB02': {'carina_id': 'carina2', 'tdma_slots': {}},
+        'HUB03': {'carina_id': 'carina3', 'tdma_slots': {}},
+    }).hubs
+    servers = ApolloServers(
+        default_address='apollo-a:8080',
+        new_collector=lambda address: collector.ApolloCollector(
+            address, session=new_session(2))
+    )
+
+    # The hubs after the one that failed are still collected
+    responses = list(servers.fetch(hubs))
+    assert [response.hub.hub_id for response in responses] == \
+        ['HUB01', 'HUB03']
+    assert [hub.hub_id for hub in servers.failed] == ['HUB02']
+    assert servers.health['apollo-a:8080'].failures == 0
+    # Every request went through the session of the server
+    session = servers.collectors['apollo-a:8080'].session
+    assert sessions == [session] * 3
+    assert session.get_adapter('https://apollo-a:8080') is \
+        session.get_adapter('http://apollo-a:8080')
+
+    # A server that answers every request with a server error is down
+    errors.update({carina_id: http_error(503)
+                   for carina_id in ('carina1', 'carina2', 'carina3')})
+    assert list(servers.fetch(hubs)) == []
+    assert len(servers.failed) == 3
+    assert servers.health['apollo-a:8080'].failures == 1
+    servers.close()
+
+
+def test_fetch_servers_stopped(monkeypatch):
+    release = threading.Event()
+
+    def fake_single(apollo_address, carina_id, timeout=None):
+        if apollo_address == 'apollo-b:8080':
+            release.wait()
+            raise ConnectionError(f'{apollo_address} is down')
+        return {'apollo': apollo_address}
+
+    monkeypatch.setattr(collector, 'request_api', fake_single)
+    hubs = parse_map_data({
+        'HUB01': {'carina_id': 'carina1', 'tdma_slots': {}},
+        'HUB02': {'carina_id': 'carina2', 'apollo_address': 'apollo-b:8080',
+                  'tdma_slots': {}},
+    }).hubs
+    servers = ApolloServers(
+        default_address='apollo-a:8080',
+        new_collector=collector.ApolloCollector
+    )
+
+    fetch = servers.fetch(hubs)
+    assert next(fetch).hub.hub_id == 'HUB01'
+    fetch.close()
+    release.set()
+    servers.close()
+    # The thread still requesting apollo-b stopped without recording its
+    # failure
+    assert servers.failed == []
+    assert servers.health['apollo-b:8080'].failures == 0
@@ -0,0 +1,62 @@
+import math
+
+from libra_metrics.apollo_interface.collector import HubResponse
+from libra_metrics.apollo_interface.snapshot import SnapshotReader, \
+    SnapshotWriter
+from libra_metrics.apollo_interface.soh_api import StationStatistics, \
+    StationStats
+from libra_metrics.apollo_interface.station_map import open_station_map
+
+
+def publish(writer, hub, total_bytes):
+    writer.add(
+        HubResponse(hub=hub, data={}, latency=0.5),
+        StationStatistics(stations=[
+            StationStats('STN01', total_bytes, 0.75, -80),
+            StationStats('STN02', -1, -1, None)
+        ])
+    )
+    writer.end_cycle()
+
+
+def test_snapshot(tmp_path):
+    path = str(tmp_path / 'stats.snapshot')
+    hub = open_station_map('./tests/data/station_map.json').hubs[0]
+    writer = SnapshotWriter(path)
+    publish(writer, hub, 100)
+
+    reader = SnapshotReader(path)
+    assert reader.generation == 1
+    assert len(reader) == 2
+    record = reader.get('STN01')
+    assert (record.hub, record.total_bytes, record.receive_strength) == \
+        ('HUB01', 100, -80)
+    assert math.isnan(reader.get('STN02').receive_strength)
+    assert reader.get('OTHER') is None
+
+    # The reader keeps its snapshot until it is refreshed
+    publish(SnapshotWriter(path), hub, 200)
+    assert reader.get('STN01').total_bytes == 100
+    assert reader.refresh()
+    assert reader.generation == 2
+    assert reader.get('STN01').total_bytes == 200
+    reader.close()
+
+
+def test_snapshot_long_names(tmp_path):
+    path = str(tmp_path / 'stats.snapshot')
+    hub = open_station_map('./tests/data/station_map.json').hubs[0]
+    # The 32nd byte falls in the middle of a two byte character
+    name = 'S' * 31 + 'é' + 'TAIL'
+    writer = SnapshotWriter(path)
+    writer.add(
+        HubResponse(hub=hub, data={}, latency=0.5),
+        StationStatistics(stations=[StationStats(name, 100, 0.75, -80)])
+    )
+    writer.end_cycle()
+
+    reader = SnapshotReader(path)
+    record, = reader
+    assert record.station == 'S' * 31
+    assert reader.get(name).total_bytes == 100
+    reader.close()
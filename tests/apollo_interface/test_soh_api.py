@@ -0,0 +1,25 @@
+import logging
+
+from libra_metrics.apollo_interface.soh_api import get_staion_statistics
+from libra_metrics.apollo_interface.station_map import open_station_map
+
+
+def test_missing_metrics_summarized(caplog):
+    hub = open_station_map(
+        station_map='./tests/data/station_map.json'
+    ).hubs[0]
+    api_data = {
+        'modem/tdma/slot/rxStats/totalBytes#_1': '100',
+        'modem/tdma/slot/rxStats/totalBursts#_1': '0',
+        'modem/tdma/slot/rxStats/goodBursts#_1': '0',
+    }
+
+    with caplog.at_level(logging.WARNING):
+        stations = get_staion_statistics(api_data, hub)
+
+    assert [stats.total_bytes for stats in stations.stations] == [100, -1]
+    # A single warning for the hub rather than one per slot and metric
+    assert caplog.messages == [
+        'HUB01: 1 slots with 0 total bursts, 2 slots with no receive power, '
+        + '1 slots with no total bytes, 1 slots with no burst statistics'
+    ]
@@ -0,0 +1,86 @@
+import pytest
+
+from libra_metrics.apollo_interface.collector import HubResponse
+from libra_metrics.apollo_interface.fingerprint import HubResultCache
+from libra_metrics.apollo_interface.history import HistoryStore
+from libra_metrics.apollo_interface.station_map import open_station_map
+from libra_metrics.bin.check_apollo_stations import check_responses
+from libra_metrics.nagios.thresholds import ThresholdTable, \
+    load_threshold_profiles
+
+
+def test_check_responses_aborts_sinks(tmp_path):
+    hubs = open_station_map(station_map='./tests/data/station_map.json')
+    history = HistoryStore(str(tmp_path))
+
+    def failing_responses():
+        yield HubResponse(hub=hubs.hubs[0], data={}, latency=0.1)
+        raise OSError('Recording failed')
+
+    with pytest.raises(OSError):
+        check_responses(failing_responses(), ThresholdTable(),
+                        sinks=[history])
+
+    check_responses(
+        [HubResponse(hub=hubs.hubs[1], data={}, latency=0.1)],
+        ThresholdTable(),
+        sinks=[history]
+    )
+    # Only the station of the cycle that completed was written
+    assert list(history.query('STN01', 0, 1e10)) == []
+    assert len(list(history.query('STN03', 0, 1e10))) == 1
+
+
+def test_check_responses_cache(hub_data):
+    hubs = open_station_map(station_map='./tests/data/station_map.json')
+    thresholds = load_threshold_profiles('./tests/data/thresholds.ini', hubs)
+    hub = hubs.hubs[0]
+
+    def run(cache, total_bytes):
+        return check_responses(
+            responses=[HubResponse(hub=hub, data=hub_data(total_bytes),
+                                   latency=0.1)],
+            thresholds=thresholds,
+            rollups=True,
+            cache=cache
+        )
+
+    cache = HubResultCache()
+    first = run(cache, '100')
+    assert list(run(cache, '100')) == list(first)
+    assert list(run(cache, '200')) != list(first)
+
+    # Unchanged hubs are left out of the submission
+    cache = HubResultCache(changed_only=True)
+    assert len(run(cache, '100')) == len(first)
+    assert len(run(cache, '100')) == 0
+    assert len(run(cache, '200')) == len(first)
+
+
+def test_check_responses_sink_failed(tmp_path):
+    hubs = open_station_map(station_map='./tests/data/station_map.json')
+    history = HistoryStore(str(tmp_path))
+
+    class FullDisk:
+        aborted = 0
+
+        def add(self, response, stations):
+            raise OSError(28, 'No space left on device')
+
+        def end_cycle(self):
+            raise AssertionError('The cycle of the sink was aborted')
+
+        def abort_cycle(self):
+            self.aborted += 1
+
+    full = FullDisk()
+    results = check_responses(
+        [HubResponse(hub=hub, data={}, latency=0.1) for hub in hubs.hubs],
+        ThresholdTable(),
+        sinks=[full, history]
+    )
+
+    # The checks and the other sinks still ran
+    assert len(results) > 0
+    assert full.aborted == 1
+    assert len(list(history.query('STN03', 0, 1e10))) == 1
@@ -0,0 +1,51 @@
+from libra_metrics.apollo_interface.collector import HubResponse
+from libra_metrics.apollo_interface.scheduler import PollScheduler
+from libra_metrics.apollo_interface.station_map import open_station_map
+from libra_metrics.bin import check_apollo_stations
+from libra_metrics.bin.check_apollo_stations import Cycle, run_cycle
+from libra_metrics.nagios.config import load_nagios_targets
+from libra_metrics.nagios.nrdp import SubmitReport
+from libra_metrics.nagios.thresholds import ThresholdTable
+
+
+class FakeCollector:
+    expired = []
+    failed = []
+
+    def fetch(self, hubs, deadline=None):
+        for hub in hubs:
+            yield HubResponse(hub=hub, data={}, latency=0.1)
+
+
+def test_run_cycle_submission_failed(tmp_path, monkeypatch):
+    submitted = []
+
+    def fake_submit_all(nrdp, targets, timeout=None, xml=None):
+        success = bool(submitted)
+        submitted.append(len(nrdp))
+        return [SubmitReport(target=target.name, success=success,
+                             attempts=1, elapsed=0.1)
+                for target in targets]
+
+    monkeypatch.setattr(check_apollo_stations, 'submit_all',
+                        fake_submit_all)
+    hubs = open_station_map(station_map='./tests/data/station_map.json')
+    state = tmp_path / 'schedule.json'
+    cycle = Cycle(
+        hubs=hubs,
+        collector=FakeCollector(),
+        nagios=load_nagios_targets('./tests/data/nagios.ini'),
+        thresholds=ThresholdTable(),
+        scheduler=PollScheduler(),
+        schedule_state=str(state)
+    )
+
+    # The results of the hubs weren't submitted, they are polled again
+    run_cycle(cycle)
+    assert not state.exists()
+    run_cycle(cycle)
+    assert submitted[0] == submitted[1] > 0
+    assert state.exists()
+    # and once submitted, they are not due until their next poll
+    run_cycle(cycle)
+    assert len(submitted) == 2
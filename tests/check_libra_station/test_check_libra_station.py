@@ -0,0 +1,36 @@
+from libra_metrics.apollo_interface.soh_api import StationStats
+from libra_metrics.bin.check_libra_station import summarize_station
+from libra_metrics.nagios.models import NagiosOutputCode
+from libra_metrics.nagios.nrdp import NagiosCheckResult, NagiosCheckResults
+
+
+def station_results(*states):
+    return NagiosCheckResults(
+        NagiosCheckResult(
+            hostname='STN01-comms',
+            servicename=f'Service {i}',
+            state=state,
+            output=f'{NagiosOutputCode(state).name.upper()} - {i} | v={i}'
+        )
+        for i, state in enumerate(states)
+    )
+
+
+def test_summarize_station():
+    stats = StationStats(station_name='STN01', total_bytes=100,
+                         good_burst=0.5, receive_strength=None)
+
+    result = summarize_station(stats, station_results(0, 1, 3))
+    # The same ordering as the hub rollups, unknown is worse than warning
+    assert result.status == NagiosOutputCode.unknown
+    assert result.summary.startswith('UNKNOWN - STN01: bytes=100')
+    assert 'receive power=n/a' in result.summary
+    assert result.details.splitlines() == [
+        'Service 0: OK - 0',
+        'Service 1: WARNING - 1',
+        'Service 2: UNKNOWN - 2'
+    ]
+    assert [p.label for p in result.performances] == ['Bytes', 'GoodBursts']
+
+    result = summarize_station(stats, station_results(3, 2, 0))
+    assert result.status == NagiosOutputCode.critical
@@ -0,0 +1,18 @@
+import pytest
+
+
+@pytest.fixture
+def hub_data():
+    '''
+    Build the apollo response of a hub with two TDMA slots, every statistic
+    the checks read being set
+    '''
+    def build(total_bytes):
+        return {
+            f'modem/tdma/slot/rxStats/{key}#_{slot}': value
+            for slot in ('1', '2')
+            for key, value in (('totalBytes', total_bytes),
+                               ('totalBursts', '10'), ('goodBursts', '9'),
+                               ('receivePower', '-80'))
+        }
+    return build
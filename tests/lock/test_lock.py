@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+from libra_metrics.lock import AlreadyRunning, run_lock
+
+
+def test_run_lock(tmp_path):
+    path = str(tmp_path / 'libra.lock')
+    with run_lock(path):
+        with open(path) as f:
+            assert f.read() == f'{os.getpid()}\n'
+        # flock locks are per open file so a second open conflicts
+        with pytest.raises(AlreadyRunning):
+            with run_lock(path):
+                pass
+    # Released once the run ends
+    with run_lock(path):
+        pass
@@ -0,0 +1,57 @@
+import tracemalloc
+
+from libra_metrics.nagios.nrdp import NagiosCheckResult, NagiosCheckResults
+
+
+SERVICES = (
+    'Bytes Received at Hub',
+    'Good Burst Percentage',
+    'Receive Power at Hub'
+)
+
+
+def build_results(factory, stations: int) -> int:
+    '''
+    Build check results for a synthetic fleet and return the memory they use
+    '''
+    tracemalloc.start()
+    results = NagiosCheckResults()
+    for station in range(stations):
+        for service in SERVICES:
+            results.append(factory(
+                hostname=f'STN{station:05d}-comms',
+                servicename=service,
+                state=0,
+                output=f'OK - {station} | Bytes={station}c;;1:;;'
+            ))
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return used
+
+
+def test_check_result_is_dict_compatible():
+    result = NagiosCheckResult(hostname='STN01-comms', state=0)
+    assert result['servicename'] == ''
+    assert result.get('output') == ''
+    assert dict(result) == {
+        'hostname': 'STN01-comms',
+        'servicename': '',
+        'state': 0,
+        'output': ''
+    }
+    result['state'] = 2
+    result.update(output='CRITICAL')
+    assert result.setdefault('output', '') == 'CRITICAL'
+    assert result == {
+        'hostname': 'STN01-comms',
+        'servicename': '',
+        'state': 2,
+        'output': 'CRITICAL'
+    }
+
+
+def test_check_results_memory():
+    compact = build_results(NagiosCheckResult, 10000)
+    plain = build_results(dict, 10000)
+    # About half the memory of dictionaries
+    assert compact < plain * 0.7
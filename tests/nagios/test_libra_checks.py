@@ -0,0 +1,23 @@
+from libra_metrics.apollo_interface.rolling_stats import RollingStatistics
+from libra_metrics.apollo_interface.soh_api import StationStatistics, \
+    StationStats
+from libra_metrics.apollo_interface.station_map import open_station_map
+from libra_metrics.nagios.libra_checks import check_stations, \
+    check_uncollected_hub
+
+
+def test_check_uncollected_hub():
+    hub = open_station_map('./tests/data/station_map.json').hubs[0]
+    stations = StationStatistics(stations=[
+        StationStats(slot.station, 100, 0.5, -80)
+        for slot in hub.tdmaslots.values()
+    ])
+
+    # The same services as the checks of a collected hub
+    for rolling in (None, RollingStatistics()):
+        checked = check_stations(stations, rolling=rolling)
+        uncollected = check_uncollected_hub(
+            hub, trends=rolling is not None)
+        assert [(r['hostname'], r['servicename']) for r in uncollected] == \
+            [(r['hostname'], r['servicename']) for r in checked]
+        assert {r['state'] for r in uncollected} == {3}
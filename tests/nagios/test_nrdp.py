@@ -0,0 +1,70 @@
+from requests.exceptions import ConnectionError
+
+from libra_metrics.nagios import nrdp
+from libra_metrics.nagios.config import load_nagios_config, \
+    load_nagios_targets
+from libra_metrics.nagios.nrdp import NagiosCheckResult, NagiosCheckResults
+
+
+def test_load_nagios_targets():
+    primary = load_nagios_config('./tests/data/nagios.ini')
+    assert primary.api_key == 'primary-token'
+    # submit_xml adds the /nrdp/ path
+    assert primary.address == 'http://nagios.example.com'
+
+    targets = load_nagios_targets('./tests/data/nagios.ini')
+    assert [target.name for target in targets] == ['nagios', 'nagios:dr']
+    assert targets[1].timeout == 5
+    assert targets[1].retries == 0
+    # A secondary server is given its timeout unless it sets a total_timeout
+    assert targets[0].total_timeout is None
+    assert targets[1].total_timeout == 5
+
+
+def test_submit_all(monkeypatch):
+    calls = []
+
+    def fake_submit_xml(xml, nagios, token, timeout=None):
+        calls.append((token, timeout))
+        if token == 'dr-token':
+            raise ConnectionError('unreachable')
+        # The primary fails once and succeeds on the retry
+        if [call[0] for call in calls].count(token) == 1:
+            raise ConnectionError('reset')
+
+    monkeypatch.setattr(nrdp, 'submit_xml', fake_submit_xml)
+    monkeypatch.setattr(nrdp.time, 'sleep', lambda seconds: None)
+    targets = load_nagios_targets('./tests/data/nagios.ini')
+    results = NagiosCheckResults([NagiosCheckResult(
+        hostname='STN01-comms', servicename='Bytes Received at Hub', state=0,
+        output='OK - 100')])
+
+    primary, dr = nrdp.submit_all(results, targets, timeout=10)
+
+    assert (primary.success, primary.attempts) == (True, 2)
+    assert (dr.success, dr.attempts) == (False, 1)
+    assert dr.error == 'unreachable'
+    # Each server keeps its own timeout, capped by the one of the cycle
+    timeouts = dict(calls)
+    assert 9 < timeouts['primary-token'] <= 10
+    assert 4.9 < timeouts['dr-token'] <= 5
+
+
+def test_submit_all_secondary_timeout(monkeypatch):
+    calls = []
+
+    def fake_submit_xml(xml, nagios, token, timeout=None):
+        calls.append((token, timeout))
+
+    monkeypatch.setattr(nrdp, 'submit_xml', fake_submit_xml)
+    targets = load_nagios_targets('./tests/data/nagios.ini')
+    results = NagiosCheckResults()
+
+    targets[1].timeout = 30
+    targets[1].total_timeout = 2
+    nrdp.submit_all(results, targets, timeout=60)
+
+    # The DR server is not given the timeout of the cycle
+    timeouts = dict(calls)
+    assert timeouts['primary-token'] == 30
+    assert timeouts['dr-token'] <= 2
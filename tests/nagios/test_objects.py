@@ -0,0 +1,71 @@
+from libra_metrics.apollo_interface.station_map import open_station_map
+from libra_metrics.nagios.nrdp import NagiosCheckResult, NagiosCheckResults
+from libra_metrics.nagios.objects import NagiosObjectCache
+
+
+class FakeNagiosAPI:
+    def __init__(self):
+        self.calls = 0
+
+    def get_host(self, query):
+        self.calls += 1
+        return {'recordcount': 2, 'host': [
+            {'host_name': 'STN01-comms'}, {'host_name': 'STN02-comms'}]}
+
+    def get_service(self, query):
+        return {'recordcount': 1, 'service': {
+            'host_name': 'STN01-comms',
+            'service_description': 'Bytes Received at Hub'}}
+
+
+def test_nagios_object_cache(tmp_path):
+    hubs = open_station_map(station_map='./tests/data/station_map.json')
+    api = FakeNagiosAPI()
+    path = str(tmp_path / 'objects.json')
+
+    index = NagiosObjectCache(api, path, hubs).index()
+    assert index.missing_stations(hubs) == ['STN03']
+
+    results = NagiosCheckResults(
+        NagiosCheckResult(hostname=hostname, servicename=service, state=0)
+        for hostname, service in (
+            ('STN01-comms', 'Bytes Received at Hub'),
+            ('STN01-comms', 'Good Burst Percentage'),
+            ('STN03-comms', 'Bytes Received at Hub'),
+            ('HUB01', 'Station Status'),
+        ))
+    kept, dropped = index.filter(results)
+    assert [(result['hostname'], result['servicename']) for result in kept] \
+        == [('STN01-comms', 'Bytes Received at Hub'),
+            ('HUB01', 'Station Status')]
+    assert dropped == 2
+
+    # The cached index is used until it is too old
+    assert NagiosObjectCache(api, path, hubs).index().known('STN02-comms')
+    assert api.calls == 1
+    NagiosObjectCache(api, path, hubs, max_age=-1).index()
+    assert api.calls == 2
+
+
+def test_nagios_object_cache_retry(tmp_path):
+    from requests.exceptions import ConnectionError
+
+    class DownNagiosAPI(FakeNagiosAPI):
+        def get_host(self, query):
+            self.calls += 1
+            raise ConnectionError('Nagios XI is down')
+
+    hubs = open_station_map(station_map='./tests/data/station_map.json')
+    api = DownNagiosAPI()
+    path = str(tmp_path / 'objects.json')
+
+    cache = NagiosObjectCache(api, path, hubs)
+    assert cache.index() is None
+    assert cache.index() is None
+    # Not retried before the retry interval, even by the next run
+    assert NagiosObjectCache(api, path, hubs).index() is None
+    assert api.calls == 1
+
+    cache = NagiosObjectCache(FakeNagiosAPI(), path, hubs, retry_interval=0)
+    assert cache.index().known('STN01-comms')
+    assert not (tmp_path / 'objects.json.failed').exists()
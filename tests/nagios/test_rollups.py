@@ -0,0 +1,46 @@
+from libra_metrics.apollo_interface.soh_api import StationStatistics, \
+    StationStats
+from libra_metrics.apollo_interface.station_map import open_station_map
+from libra_metrics.nagios.libra_checks import check_stations
+from libra_metrics.nagios.rollups import ProblemFilter, rollup_hub
+from libra_metrics.nagios.thresholds import load_threshold_profiles
+
+
+def test_rollup_hub():
+    hubs = open_station_map(
+        station_map='./tests/data/station_map.json'
+    )
+    table = load_threshold_profiles('./tests/data/thresholds.ini', hubs)
+    stations = StationStatistics(stations=[
+        StationStats(station_name='STN01', total_bytes=0, good_burst=99.0,
+                     receive_strength=-80),
+        StationStats(station_name='STN02', total_bytes=0, good_burst=50.0,
+                     receive_strength=-90),
+        StationStats(station_name='STN03', total_bytes=500, good_burst=99.0,
+                     receive_strength=None),
+    ])
+    results = check_stations(stations, thresholds=table)
+    status, throughput, power = rollup_hub(hubs.hubs[0], stations, results)
+
+    assert status['hostname'] == 'HUB01'
+    assert status['state'] == 2
+    assert status['output'].startswith(
+        'CRITICAL - 1 critical, 1 unknown, 1 warning of 3 stations')
+    assert 'Bytes=500c' in throughput['output']
+    assert power['output'].startswith('OK - min -90dBm, median -85.0dBm')
+
+
+def test_problem_filter():
+    stations = StationStatistics(stations=[
+        StationStats(station_name='STN01', total_bytes=0, good_burst=99.0,
+                     receive_strength=10),
+    ])
+    problems = ProblemFilter()
+    kept = problems.filter(check_stations(stations))
+    assert [result['servicename'] for result in kept] == \
+        ['Bytes Received at Hub']
+
+    # The recovery is submitted once
+    stations.stations[0].total_bytes = 100
+    assert len(problems.filter(check_stations(stations))) == 1
+    assert len(problems.filter(check_stations(stations))) == 0
@@ -0,0 +1,41 @@
+from libra_metrics.apollo_interface.soh_api import StationStats
+from libra_metrics.apollo_interface.station_map import open_station_map
+from libra_metrics.nagios.libra_checks import check_station
+from libra_metrics.nagios.thresholds import load_threshold_profiles, \
+    METRIC_BYTES, METRIC_RECEIVE_POWER
+
+
+def test_load_threshold_profiles():
+    hubs = open_station_map(
+        station_map='./tests/data/station_map.json'
+    )
+    table = load_threshold_profiles('./tests/data/thresholds.ini', hubs)
+
+    # Defaults apply to every station
+    assert table.lookup('STN01', METRIC_RECEIVE_POWER).critical == '-95:'
+    assert table.lookup('STN01', METRIC_BYTES).critical == '1:'
+    # Hub override keeps the inherited critical threshold
+    assert table.lookup('STN03', METRIC_BYTES).warning == '100:'
+    assert table.lookup('STN03', METRIC_BYTES).critical == '1:'
+    # Station override can disable a threshold
+    assert table.lookup('STN02', METRIC_BYTES).critical is None
+    # Unknown stations fall back on the defaults
+    assert table.lookup('OTHER', METRIC_RECEIVE_POWER).warning == '-85:'
+
+
+def test_check_station_thresholds():
+    hubs = open_station_map(
+        station_map='./tests/data/station_map.json'
+    )
+    table = load_threshold_profiles('./tests/data/thresholds.ini', hubs)
+
+    results = check_station(
+        stats=StationStats(
+            station_name='STN03',
+            total_bytes=50,
+            good_burst=1.0,
+            receive_strength=-90
+        ),
+        thresholds=table
+    )
+    assert [result['state'] for result in results] == [1, 0, 1]
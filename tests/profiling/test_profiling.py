@@ -0,0 +1,40 @@
+from libra_metrics.profiling import StageProfiler
+
+
+def test_stage_profiler(tmp_path):
+    profiler = StageProfiler(str(tmp_path), memory_budget=1)
+    with profiler.stage('small'):
+        small = [0] * 1000
+    with profiler.stage('large'):
+        large = [0] * 1000000
+    report = profiler.finish()
+
+    assert [stage.name for stage in profiler.stages] == ['small', 'large']
+    assert profiler.stages[1].allocated > 1024 * 1024
+    # Only the large stage goes above the budget
+    assert not profiler.over_budget(profiler.stages[0].peak)
+    assert profiler.over_budget()
+    assert 'Memory budget: 1.0 MiB, exceeded' in report.read_text()
+    assert (tmp_path / 'profile.pstats').exists()
+    del small, large
+
+
+def test_profile_failed_cycle(tmp_path, monkeypatch):
+    from click.testing import CliRunner
+    from libra_metrics.bin import check_apollo_stations
+
+    def failing_cycle(cycle):
+        raise OSError('Cycle failed')
+
+    monkeypatch.setattr(check_apollo_stations, 'run_cycle', failing_cycle)
+    result = CliRunner().invoke(check_apollo_stations.main, [
+        '-m', './tests/data/station_map.json',
+        '-n', './tests/data/nagios.ini',
+        '-a', 'apollo:8080',
+        '--profile', str(tmp_path)
+    ])
+
+    # The cycle fails but its profile is written
+    assert isinstance(result.exception, OSError)
+    assert (tmp_path / 'profile.pstats').exists()
+    assert (tmp_path / 'report.txt').exists()
@@ -0,0 +1,50 @@
+from libra_metrics.apollo_interface.collector import HubResponse
+from libra_metrics.apollo_interface.soh_api import StationStatistics, \
+    StationStats
+from libra_metrics.apollo_interface.station_map import open_station_map
+from libra_metrics.prometheus import PrometheusExporter
+
+
+def test_exporter_renders_once_per_cycle():
+    hubs = open_station_map(station_map='./tests/data/station_map.json')
+    exporter = PrometheusExporter()
+    exporter.add(
+        HubResponse(hub=hubs.hubs[1], data={}, latency=0.25),
+        StationStatistics(stations=[StationStats(
+            station_name='STN03',
+            total_bytes=100,
+            good_burst=-1,
+            receive_strength=-80
+        )])
+    )
+    # Nothing is served until the cycle is complete
+    assert exporter.payload == b''
+
+    exporter.end_cycle()
+    lines = exporter.payload.decode().splitlines()
+    assert 'libra_station_bytes{hub="HUB02",station="STN03"} 100' in lines
+    assert 'libra_station_receive_power_dbm{hub="HUB02",station="STN03"} -80' \
+        in lines
+    assert 'libra_hub_fetch_latency_seconds{hub="HUB02"} 0.250000' in lines
+    # Missing values are left out
+    assert not any(line.startswith('libra_station_good_burst_ratio{')
+                   for line in lines)
+
+
+def test_exporter_last_update():
+    hubs = open_station_map(station_map='./tests/data/station_map.json')
+    exporter = PrometheusExporter()
+    for hub in hubs.hubs:
+        exporter.add(HubResponse(hub=hub, data={}, latency=0.25),
+                     StationStatistics(stations=[]), now=1000)
+    exporter.end_cycle()
+    # HUB02 was not collected in the next cycle
+    exporter.add(HubResponse(hub=hubs.hubs[0], data={}, latency=0.25),
+                 StationStatistics(stations=[]), now=1060)
+    exporter.end_cycle()
+
+    lines = exporter.payload.decode().splitlines()
+    assert 'libra_hub_last_update_timestamp_seconds{hub="HUB01"} 1060.000' \
+        in lines
+    assert 'libra_hub_last_update_timestamp_seconds{hub="HUB02"} 1000.000' \
+        in lines
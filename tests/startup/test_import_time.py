@@ -0,0 +1,45 @@
+'''
+Import time benchmark for the command line entry point
+
+Runs a fresh interpreter with -X importtime and checks that the heavy
+dependencies are only loaded when they are used.
+'''
+import subprocess
+import sys
+from typing import Dict
+
+
+# Modules that must not be imported just to start the entry point
+HEAVY_MODULES = ('requests', 'urllib3', 'xml.etree.ElementTree', 'decimal',
+                 'concurrent.futures', 'gzip', 'csv', 'mmap')
+
+
+def import_times(module: str) -> Dict[str, int]:
+    '''
+    Return the cumulative import time in microseconds of every module loaded
+    when importing module in a fresh interpreter
+    '''
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_entry_point_import_is_lean():
+    times = import_times('libra_metrics.bin.check_apollo_stations')
+    for module in HEAVY_MODULES:
+        assert module not in times
+
+
+def test_models_import_is_lean():
+    times = import_times('libra_metrics.nagios.models')
+    assert 'requests' not in times
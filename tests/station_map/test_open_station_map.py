@@ -7,3 +7,13 @@ def test_open_station_map():
     )
     assert len(hubs.hubs) == 2
     assert hubs.hubs[0].carina_id == 'carina110_2635'
+
+
+def test_station_index():
+    hubs = open_station_map(
+        station_map='./tests/data/station_map.json'
+    )
+    location = hubs.stations['STN03']
+    assert location.hub is hubs.hubs[1]
+    assert location.carina_id == 'carina110_2636'
+    assert location.slot_id == 'slot_1'